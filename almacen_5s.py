@@ -0,0 +1,423 @@
+# -*- coding: utf-8 -*-
+"""
+Almacenamiento de auditorías 5S (sin Streamlit): Supabase o una base SQLite local.
+
+Los dos almacenes exponen las mismas operaciones:
+
+    leer_auditorias(columnas, estatus=None, modificadas_desde=None, progreso=None) -> DataFrame
+    leer_detalle(ids, columnas) -> DataFrame indexado por id
+    leer_indice_borradores() -> [dict] con COLUMNAS_INDICE_BORRADORES
+    leer_auditoria(id_auditoria) -> dict con el renglón completo (None si no existe)
+    guardar(fila, id_auditoria=None) -> id
+    guardar_lote(filas) -> [id]  altas idempotentes por la columna clave_envio
+    cubo(mes=None, planta=None, area=None, maquina=None) -> cubo con el formato de construir_cubo
+
+cubo() empuja la agregación a SQL: solo viajan los renglones Planta × Area × Maquina × Mes con
+sumas y conteos, y el resultado se usa con rebanar_cubo / puntaje_etapas / ranking_preguntas
+igual que el cubo calculado en pandas. La consulta sale de sql_cubo() para los dos almacenes
+(solo cambia cómo se extrae el mes de la fecha), así que dan los mismos números. En Supabase
+vive en la función cubo_5s, cuya definición se genera con:
+
+    python almacen_5s.py --sql-supabase > cubo_5s.sql
+
+La salida incluye también la columna clave_envio (única) que usa guardar_lote y el trigger que
+pone actualizado_en con la hora del servidor en cada alta o cambio: la sincronización incremental
+y la llave de caché de los borradores dependen de él. Mientras el trigger no esté, guardar y
+guardar_lote mandan su propia hora en el renglón.
+
+Esta migración es necesaria para que las altas de la bandeja de salida sean idempotentes. Si la
+app se despliega antes de correrla, la primera vez que PostgREST rechaza el upsert por falta de
+la columna o de su restricción única (PGRST204 / 42703 / 42P10) AlmacenSupabase lo registra en el
+log, pone idempotente = False y desde ahí manda las altas con un insert simple sin clave_envio:
+las auditorías siguen llegando, pero reintentar un lote cuya respuesta se perdió puede duplicarlo.
+
+SQLite sirve para plantas sin conexión y para pruebas locales:
+
+    python almacen_5s.py --sqlite .cache_5s/auditorias.sqlite
+"""
+
+import argparse
+import logging
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from nucleo_5s import MAPEO_NOMBRES, MAPEO_RESPUESTAS, CLAVES_CUBO, MESES_MAP, etiqueta_mes, puntaje_etapas
+from supabase_5s import iterar_paginas, leer_paginado
+
+TABLA = "auditorias_5s"
+
+# --- COLUMNAS DE LA TABLA ---
+# La analítica solo necesita dimensiones, fecha y respuestas. Comentarios y URLs de evidencias
+# (el grueso de cada renglón) se piden por id solo cuando el reporte o la tabla los usan.
+COLUMNAS_COMENTARIOS = ["Comentarios_1S", "Comentario_2S", "Comentarios_3S", "Comentarios_4S", "Comentarios_5S"]
+COLUMNAS_EVIDENCIAS = [f"Evidencia_{momento}_{s}S" for s in range(1, 6) for momento in ["Antes", "Despues"]]
+COLUMNAS_DIMENSIONES = ["Planta", "Fecha", "Nombre del Auditor", "Nombre del Líder de 5s", "Seleccione un Turno", "Area", "Maquina"]
+COLUMNAS_TECNICAS = ["id", "creado_en", "actualizado_en", "estatus"]
+# Clave de idempotencia de las altas que llegan desde la bandeja de salida
+COLUMNA_CLAVE_ENVIO = "clave_envio"
+COLUMNAS_ANALITICA = [*COLUMNAS_TECNICAS, *COLUMNAS_DIMENSIONES, *MAPEO_NOMBRES]
+# Lo único que necesita el selector de borradores; el renglón completo se pide al elegir uno
+COLUMNAS_INDICE_BORRADORES = ["id", "Nombre del Auditor", "Area", "Maquina", "actualizado_en"]
+LOTE_DETALLE = 200
+# Errores de PostgREST / Postgres cuando falta clave_envio o su restricción única
+CODIGOS_SIN_CLAVE_ENVIO = {"PGRST204", "42703", "42P10"}
+
+log = logging.getLogger(__name__)
+
+# Preguntas (llaves cortas) de cada etapa, en el mismo orden que arma preparar_datos
+ETAPAS_CORTAS = {
+    etapa: [k for k in MAPEO_NOMBRES if k.startswith(f"s{i}_")]
+    for i, etapa in enumerate(["SEIRI", "SEITON", "SEISO", "SEIKETSU", "SHITSUKE"], start=1)
+}
+
+
+def _select(columnas):
+    """Lista de columnas para select(); las que llevan espacios van entre comillas."""
+    return ",".join(f'"{c}"' if " " in c else c for c in columnas)
+
+
+def _ahora():
+    return pd.Timestamp.now(tz="UTC").isoformat()
+
+
+# --- AGREGACIÓN EN SQL ---
+# Año-mes ('AAAA-MM') de la fecha en cada dialecto, NULL ("Sin Fecha") si no es una fecha válida.
+# Solo cuenta AAAA-MM-DD de calendario (sola o seguida de hora), que es como la guarda el
+# formulario: lo demás queda NULL igual que el NaT de pd.to_datetime(errors='coerce'). Ninguna
+# expresión puede fallar con un renglón malo: en Postgres un CAST a date de basura tumbaría todo
+# cubo_5s, así que se arma la fecha con make_date y se compara contra el texto original.
+_FECHA_TEXTO = "CAST(\"Fecha\" AS text)"
+EXPRESION_MES = {
+    "sqlite": ("CASE WHEN \"Fecha\" GLOB '[1-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]*'"
+               " AND (length(\"Fecha\") = 10 OR substr(\"Fecha\", 11, 1) IN (' ', 'T'))"
+               # date() sin modificador deja pasar '2025-02-30'; con '+0 days' lo normaliza y ya no coincide
+               " AND date(substr(\"Fecha\", 1, 10), '+0 days') = substr(\"Fecha\", 1, 10)"
+               " THEN substr(\"Fecha\", 1, 7) END"),
+    # CASE anidado: Postgres no garantiza el orden de un AND, y make_date solo recibe mes 01-12
+    "postgres": (f"CASE WHEN {_FECHA_TEXTO} ~ '^[1-9][0-9]{{3}}-(0[1-9]|1[0-2])-[0-3][0-9]([ T]|$)' THEN"
+                 f" CASE WHEN to_char(make_date(CAST(substr({_FECHA_TEXTO}, 1, 4) AS int),"
+                 f" CAST(substr({_FECHA_TEXTO}, 6, 2) AS int), 1)"
+                 f" + (CAST(substr({_FECHA_TEXTO}, 9, 2) AS int) - 1), 'YYYY-MM-DD') = substr({_FECHA_TEXTO}, 1, 10)"
+                 f" THEN substr({_FECHA_TEXTO}, 1, 7) END END"),
+}
+# Cómo se nombran los parámetros de filtro dentro de la consulta
+PARAMETRO = {"sqlite": ":{}", "postgres": "{}"}
+
+
+def _puntaje_sql(col):
+    """CASE que replica codificar_columna: lower/trim y MAPEO_RESPUESTAS (N/A queda NULL)."""
+    casos = " ".join(f"WHEN '{resp}' THEN {int(p)}" for resp, p in MAPEO_RESPUESTAS.items() if not pd.isna(p))
+    return f'CASE lower(trim("{col}")) {casos} END'
+
+
+def sql_cubo(dialecto="sqlite"):
+    """Consulta del cubo Planta × Area × Maquina × Mes sobre las auditorías terminadas.
+
+    Recibe los parámetros p_mes ('AAAA-MM', '' = sin fecha), p_planta, p_area y p_maquina;
+    NULL en cualquiera de ellos significa "todos".
+    """
+    param = PARAMETRO[dialecto].format
+    puntajes = ",\n".join(f"{_puntaje_sql(k)} AS p_{k}" for k in MAPEO_NOMBRES)
+    # Promedio por fila de cada etapa sobre las respuestas que sí cuentan
+    etapas = []
+    for etapa, claves in ETAPAS_CORTAS.items():
+        suma = " + ".join(f"COALESCE(p_{k}, 0)" for k in claves)
+        validas = " + ".join(f"CASE WHEN p_{k} IS NULL THEN 0 ELSE 1 END" for k in claves)
+        etapas.append(f"({suma}) * 1.0 / NULLIF({validas}, 0) AS e_{etapa}")
+    medidas = []
+    for etapa, claves in ETAPAS_CORTAS.items():
+        for k in claves:
+            medidas.append(f'SUM(COALESCE(p_{k}, 0)) AS "suma|{k}", COUNT(p_{k}) AS "n|{k}"')
+        medidas.append(f'SUM(COALESCE(e_{etapa}, 0)) AS "suma_etapa|{etapa}", COUNT(e_{etapa}) AS "n_etapa|{etapa}"')
+    medidas.append("COUNT(*) AS auditorias")
+    return f"""SELECT "Planta", "Area", "Maquina", mes,
+{", ".join(medidas)}
+FROM (
+SELECT *, {", ".join(etapas)}
+FROM (
+SELECT "Planta", "Area", "Maquina", {EXPRESION_MES[dialecto]} AS mes,
+{puntajes}
+FROM {TABLA}
+WHERE estatus = 'terminada'
+  AND ({param('p_planta')} IS NULL OR "Planta" = {param('p_planta')})
+  AND ({param('p_area')} IS NULL OR "Area" = {param('p_area')})
+  AND ({param('p_maquina')} IS NULL OR "Maquina" = {param('p_maquina')})
+) respuestas
+) filas
+WHERE ({param('p_mes')} IS NULL OR COALESCE(mes, '') = {param('p_mes')})
+GROUP BY "Planta", "Area", "Maquina", mes"""
+
+
+def sql_funcion_supabase():
+    """DDL de la función cubo_5s que Supabase expone por RPC (y de clave_envio y el trigger de actualizado_en)."""
+    return f"""ALTER TABLE {TABLA} ADD COLUMN IF NOT EXISTS {COLUMNA_CLAVE_ENVIO} text UNIQUE;
+
+-- actualizado_en con la hora del servidor en cada alta y cambio (marca de agua de la sincronización)
+CREATE OR REPLACE FUNCTION {TABLA}_actualizado_en() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.actualizado_en := now();
+    RETURN NEW;
+END
+$$;
+
+DROP TRIGGER IF EXISTS {TABLA}_actualizado_en ON {TABLA};
+CREATE TRIGGER {TABLA}_actualizado_en BEFORE INSERT OR UPDATE ON {TABLA}
+    FOR EACH ROW EXECUTE FUNCTION {TABLA}_actualizado_en();
+
+-- p_mes pasó de número de mes a 'AAAA-MM': la firma anterior se quita
+DROP FUNCTION IF EXISTS cubo_5s(integer, text, text, text);
+
+CREATE OR REPLACE FUNCTION cubo_5s(
+    p_mes text DEFAULT NULL, p_planta text DEFAULT NULL,
+    p_area text DEFAULT NULL, p_maquina text DEFAULT NULL)
+RETURNS json LANGUAGE sql STABLE AS $$
+SELECT COALESCE(json_agg(c), '[]'::json) FROM (
+{sql_cubo("postgres")}
+) c
+$$;
+"""
+
+
+def _parametros_cubo(mes, planta, area, maquina):
+    # "Enero 2025" -> '2025-01'
+    numero_mes = {nombre: n for n, nombre in MESES_MAP.items()}
+    if mes is None or mes == "Sin Fecha":
+        p_mes = None if mes is None else ""
+    else:
+        nombre, anio = mes.rsplit(" ", 1)
+        p_mes = f"{anio}-{numero_mes[nombre]:02d}"
+    return {"p_mes": p_mes, "p_planta": planta, "p_area": area, "p_maquina": maquina}
+
+
+def cubo_desde_sql(filas):
+    """Convierte las filas de sql_cubo al formato de construir_cubo (nombres largos, Mes en texto)."""
+    cubo = pd.DataFrame(filas)
+    if cubo.empty:
+        return cubo
+    cubo["Mes"] = cubo.pop("mes").map(lambda m: etiqueta_mes(*str(m).split("-")) if pd.notna(m) and m else "Sin Fecha")
+    columnas = list(CLAVES_CUBO)
+    for etapa, claves in ETAPAS_CORTAS.items():
+        for k in claves:
+            columnas += [f"suma|{k}", f"n|{k}"]
+        columnas += [f"suma_etapa|{etapa}", f"n_etapa|{etapa}"]
+    columnas.append("auditorias")
+    cubo = cubo[columnas]
+    for col in columnas[len(CLAVES_CUBO):]:
+        tipo = np.float64 if col.startswith("suma") else np.int64
+        cubo[col] = pd.to_numeric(cubo[col]).fillna(0).astype(tipo)
+    renombres = {}
+    for k, largo in MAPEO_NOMBRES.items():
+        renombres[f"suma|{k}"] = f"suma|{largo}"
+        renombres[f"n|{k}"] = f"n|{largo}"
+    return cubo.rename(columns=renombres)
+
+
+def _falta_clave_envio(error):
+    """True si PostgREST rechazó el upsert porque la tabla no tiene clave_envio o su restricción única."""
+    codigo = getattr(error, "code", None)
+    if codigo == "42P10":
+        return True
+    return codigo in CODIGOS_SIN_CLAVE_ENVIO and COLUMNA_CLAVE_ENVIO in str(getattr(error, "message", error))
+
+
+# --- SUPABASE ---
+class AlmacenSupabase:
+    """Tabla auditorias_5s en Supabase (PostgREST), con lecturas paginadas."""
+
+    def __init__(self, cliente):
+        self.cliente = cliente
+        # None hasta el primer guardar_lote; False si la tabla aún no tiene clave_envio
+        self.idempotente = None
+
+    def _tabla(self):
+        return self.cliente.table(TABLA)
+
+    def leer_auditorias(self, columnas=COLUMNAS_ANALITICA, estatus=None, modificadas_desde=None, progreso=None):
+        def filtros(q):
+            if estatus is not None:
+                q = q.eq("estatus", estatus)
+            if modificadas_desde is not None:
+                q = q.or_(f"actualizado_en.gt.{modificadas_desde},creado_en.gt.{modificadas_desde}")
+            return q
+        return leer_paginado(self._tabla, _select(columnas), filtros, progreso=progreso)
+
+    def leer_detalle(self, ids, columnas):
+        partes = []
+        for i in range(0, len(ids), LOTE_DETALLE):
+            res = self._tabla().select(_select(["id", *columnas])).in_("id", list(ids[i:i + LOTE_DETALLE])).execute()
+            partes.append(pd.DataFrame(res.data or []))
+        detalle = pd.concat(partes, ignore_index=True) if partes else pd.DataFrame()
+        if detalle.empty:
+            return pd.DataFrame(columns=list(columnas))
+        return detalle.drop_duplicates("id").set_index("id")
+
+    def leer_indice_borradores(self):
+        paginas = iterar_paginas(self._tabla, _select(COLUMNAS_INDICE_BORRADORES), lambda q: q.eq("estatus", "en_proceso"))
+        return [d for filas, _ in paginas for d in filas]
+
+    def leer_auditoria(self, id_auditoria):
+        res = self._tabla().select("*").eq("id", id_auditoria).limit(1).execute()
+        return res.data[0] if res.data else None
+
+    def guardar(self, fila, id_auditoria=None):
+        # El trigger de --sql-supabase la reemplaza por la hora del servidor
+        fila = {**fila, "actualizado_en": _ahora()}
+        if id_auditoria:
+            self._tabla().update(fila).eq("id", id_auditoria).execute()
+            return id_auditoria
+        res = self._tabla().insert(fila).execute()
+        return res.data[0]["id"] if res.data else None
+
+    def guardar_lote(self, filas):
+        ids = {}
+        ahora = _ahora()
+        # PostgREST pide las mismas llaves en todos los renglones de un insert múltiple
+        grupos = {}
+        for fila in filas:
+            fila = {**fila, "actualizado_en": ahora}
+            grupos.setdefault(tuple(sorted(fila)), []).append(fila)
+        for grupo in grupos.values():
+            if self.idempotente is not False:
+                try:
+                    res = self._tabla().upsert(grupo, on_conflict=COLUMNA_CLAVE_ENVIO).execute()
+                    self.idempotente = True
+                    ids.update({r[COLUMNA_CLAVE_ENVIO]: r["id"] for r in res.data or []})
+                    continue
+                except Exception as e:
+                    if not _falta_clave_envio(e):
+                        raise
+                    self.idempotente = False
+                    log.warning("La tabla %s no tiene %s o su restricción única (%s); las altas van con insert "
+                                "simple y sin idempotencia hasta correr: python almacen_5s.py --sql-supabase",
+                                TABLA, COLUMNA_CLAVE_ENVIO, getattr(e, "code", e))
+            # Sin la migración: insert simple; PostgREST regresa los renglones en el orden enviado
+            sin_clave = [{c: v for c, v in fila.items() if c != COLUMNA_CLAVE_ENVIO} for fila in grupo]
+            res = self._tabla().insert(sin_clave).execute()
+            ids.update({fila[COLUMNA_CLAVE_ENVIO]: r["id"] for fila, r in zip(grupo, res.data or [])})
+        return [ids.get(fila[COLUMNA_CLAVE_ENVIO]) for fila in filas]
+
+    def cubo(self, mes=None, planta=None, area=None, maquina=None):
+        res = self.cliente.rpc("cubo_5s", _parametros_cubo(mes, planta, area, maquina)).execute()
+        return cubo_desde_sql(res.data or [])
+
+
+# --- SQLITE LOCAL ---
+class AlmacenSQLite:
+    """La misma tabla en un archivo SQLite, para plantas sin conexión y pruebas."""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+        columnas = ", ".join(f'"{c}" TEXT' for c in [*COLUMNAS_DIMENSIONES, *MAPEO_NOMBRES, *COLUMNAS_COMENTARIOS, *COLUMNAS_EVIDENCIAS])
+        with self._conectar() as con:
+            con.execute(f"""CREATE TABLE IF NOT EXISTS {TABLA} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                creado_en TEXT NOT NULL, actualizado_en TEXT NOT NULL, estatus TEXT, {columnas})""")
+            con.execute(f"CREATE INDEX IF NOT EXISTS {TABLA}_estatus ON {TABLA} (estatus)")
+            # Archivos creados antes de la bandeja de salida no traen la columna
+            existentes = {c[1] for c in con.execute(f"PRAGMA table_info({TABLA})")}
+            if COLUMNA_CLAVE_ENVIO not in existentes:
+                con.execute(f"ALTER TABLE {TABLA} ADD COLUMN {COLUMNA_CLAVE_ENVIO} TEXT")
+            con.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {TABLA}_{COLUMNA_CLAVE_ENVIO} ON {TABLA} ({COLUMNA_CLAVE_ENVIO})")
+
+    def _conectar(self):
+        return sqlite3.connect(self.ruta, timeout=10)
+
+    def _columnas(self, columnas):
+        return "*" if columnas == "*" else ", ".join(f'"{c}"' for c in columnas)
+
+    def leer_auditorias(self, columnas=COLUMNAS_ANALITICA, estatus=None, modificadas_desde=None, progreso=None):
+        condiciones, parametros = [], []
+        if estatus is not None:
+            condiciones.append("estatus = ?")
+            parametros.append(estatus)
+        if modificadas_desde is not None:
+            condiciones.append("(actualizado_en > ? OR creado_en > ?)")
+            parametros += [modificadas_desde, modificadas_desde]
+        donde = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+        with self._conectar() as con:
+            df = pd.read_sql_query(f"SELECT {self._columnas(columnas)} FROM {TABLA} {donde} ORDER BY id", con, params=parametros)
+        if progreso:
+            progreso(len(df), len(df))
+        return df
+
+    def leer_detalle(self, ids, columnas):
+        partes = []
+        with self._conectar() as con:
+            for i in range(0, len(ids), LOTE_DETALLE):
+                lote = list(ids[i:i + LOTE_DETALLE])
+                consulta = f"SELECT id, {self._columnas(columnas)} FROM {TABLA} WHERE id IN ({', '.join('?' * len(lote))})"
+                partes.append(pd.read_sql_query(consulta, con, params=lote))
+        detalle = pd.concat(partes, ignore_index=True) if partes else pd.DataFrame()
+        if detalle.empty:
+            return pd.DataFrame(columns=list(columnas))
+        return detalle.set_index("id")
+
+    def leer_indice_borradores(self):
+        with self._conectar() as con:
+            con.row_factory = sqlite3.Row
+            consulta = f"SELECT {self._columnas(COLUMNAS_INDICE_BORRADORES)} FROM {TABLA} WHERE estatus = 'en_proceso' ORDER BY id"
+            filas = con.execute(consulta).fetchall()
+        return [dict(f) for f in filas]
+
+    def leer_auditoria(self, id_auditoria):
+        with self._conectar() as con:
+            con.row_factory = sqlite3.Row
+            fila = con.execute(f"SELECT * FROM {TABLA} WHERE id = ?", [id_auditoria]).fetchone()
+        return dict(fila) if fila else None
+
+    def guardar(self, fila, id_auditoria=None):
+        fila = {**fila, "actualizado_en": _ahora()}
+        with self._conectar() as con:
+            if id_auditoria:
+                asignaciones = ", ".join(f'"{c}" = ?' for c in fila)
+                con.execute(f"UPDATE {TABLA} SET {asignaciones} WHERE id = ?", [*fila.values(), id_auditoria])
+                return id_auditoria
+            fila["creado_en"] = fila["actualizado_en"]
+            columnas = ", ".join(f'"{c}"' for c in fila)
+            cursor = con.execute(f"INSERT INTO {TABLA} ({columnas}) VALUES ({', '.join('?' * len(fila))})", list(fila.values()))
+            return cursor.lastrowid
+
+    def guardar_lote(self, filas):
+        ahora = _ahora()
+        ids = []
+        with self._conectar() as con:
+            for fila in filas:
+                fila = {**fila, "creado_en": ahora, "actualizado_en": ahora}
+                columnas = ", ".join(f'"{c}"' for c in fila)
+                # Reintento de un alta ya entregada: se actualiza en su lugar, sin duplicar
+                asignaciones = ", ".join(f'"{c}" = excluded."{c}"' for c in fila if c != "creado_en")
+                con.execute(f"INSERT INTO {TABLA} ({columnas}) VALUES ({', '.join('?' * len(fila))}) "
+                            f"ON CONFLICT ({COLUMNA_CLAVE_ENVIO}) DO UPDATE SET {asignaciones}", list(fila.values()))
+                ids.append(con.execute(f"SELECT id FROM {TABLA} WHERE {COLUMNA_CLAVE_ENVIO} = ?",
+                                       [fila[COLUMNA_CLAVE_ENVIO]]).fetchone()[0])
+        return ids
+
+    def cubo(self, mes=None, planta=None, area=None, maquina=None):
+        with self._conectar() as con:
+            filas = pd.read_sql_query(sql_cubo("sqlite"), con, params=_parametros_cubo(mes, planta, area, maquina))
+        return cubo_desde_sql(filas)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Utilidades del almacén de auditorías 5S.")
+    grupo = parser.add_mutually_exclusive_group(required=True)
+    grupo.add_argument("--sql-supabase", action="store_true", help="Imprime el DDL de la función cubo_5s, la columna clave_envio y el trigger de actualizado_en para Supabase.")
+    grupo.add_argument("--sqlite", metavar="RUTA", help="Imprime el puntaje por área y etapa calculado en SQL sobre un archivo SQLite.")
+    args = parser.parse_args(argv)
+
+    if args.sql_supabase:
+        print(sql_funcion_supabase())
+        return
+    cubo = AlmacenSQLite(args.sqlite).cubo()
+    if cubo.empty:
+        print("Sin auditorías terminadas.")
+        return
+    print(puntaje_etapas(cubo, list(ETAPAS_CORTAS), por="Area").round(2).to_string())
+
+
+if __name__ == "__main__":
+    main()
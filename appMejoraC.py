@@ -12,8 +12,36 @@ import altair as alt
 import plotly.express as px
 import plotly.graph_objects as go
 import io
-from streamlit_autorefresh import st_autorefresh
+import os
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from supabase import create_client, Client
+from nucleo_5s import (
+    ETAPAS, MAPEO_NOMBRES, preparar_datos, construir_cubo, combinar_cubos, rebanar_cubo, puntaje_etapas,
+    resumen_etapas, ranking_areas, tabla_ranking, filtrar_posiciones, opciones_cubo, generate_html_report, etiqueta_mes,
+    nombre_corto, posiciones_tabla, paginas_tabla, pagina_tabla,
+)
+from exportar_reportes import exportar_zip
+from almacen_5s import (
+    COLUMNAS_ANALITICA, COLUMNAS_COMENTARIOS, COLUMNAS_EVIDENCIAS, TABLA, AlmacenSQLite, AlmacenSupabase,
+)
+from supabase_5s import feed_realtime
+from bandeja_5s import BandejaSalida
+from borradores_5s import GuardadoDiferido, campos_cambiados
+from refresco_5s import Refrescador, SenalNotificaciones, SenalSondeo
+from metricas_5s import METRICAS
+from tendencias_5s import FRECUENCIAS, MotorTendencias
+from evidencias_5s import (
+    BUCKET_EVIDENCIAS, MAX_LADO_EVIDENCIA, MAX_LADO_MINIATURA,
+    IndiceEvidencias, guardar_evidencias, url_miniatura,
+)
 
 # --- CONFIGURACIÓN DE PÁGINA ---
 st.set_page_config(
@@ -23,8 +51,6 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-st_autorefresh(interval=60 * 1000, key="data_refresh")
-
 # --- CONEXIÓN A SUPABASE DESDE SECRETS ---
 try:
     SUPABASE_URL = st.secrets["SUPABASE_URL"]
@@ -39,211 +65,598 @@ def init_supabase():
 
 supabase = init_supabase()
 
-# Este diccionario traduce lo que la DB guarda (s1_1) a lo que tu Dashboard espera (Nombre Largo)
-MAPEO_NOMBRES = {
-    "s1_1": "1S_Seleccionar_SEIR [1S_1 El área está libre de material dañado, tirado o defectuoso (scrap) y se encuentra en los contenedores para material de scrap o disposición.]",
-    "s1_2": "1S_Seleccionar_SEIR [1S_2 La máquina o estación está libre de material, herramientas por dentro y fuera.]",
-    "s1_3": "1S_Seleccionar_SEIR [1S_3 El área de trabajo está libre de alimentos y/o bebidas y artículos personales]",
-    "s2_1": "2S_Ordenar_SEITON [2S_1 Todas las máquinas están etiquetadas (nombre de la estación, número) y todas las líneas de servicio están identificadas de acuerdo al color y con la dirección del flujo. (hidráulico, neumático y eléctrico)]",
-    "s2_2": "2S_Ordenar_SEITON [2S_2 El personal (operador, coordinador, técnico, supervisor, ingenieros, calidad, etc.) que tiene su área de trabajo en la zona auditada tiene ordenada su estación de trabajo (incluye: máquina, gavetas, mesas, etc.)]",
-    "s2_3": "2S_Ordenar_SEITON [2S_3 Las fixturas de la máquina tienen un lugar asignado, cerca de la máquina y están ordenadas?]",
-    "s3_1": "3S_Limpieza_SEISO [3S_1 El personal limpia su área de trabajo al inicio y final de turno?]",
-    "s3_2": "3S_Limpieza_SEISO [3S_2 Los elementos del área (máquinas, instrumentos de medición, pruebas destructivas, mesas de trabajo, etc) se encuentran libres de suciedad, basura o polvo]",
-    "s3_3": "3S_Limpieza_SEISO [3S_3  Los materiales y equipos de limpieza están disponibles, están en buenas condiciones y son fácilmente accesibles.]",
-    "s4_1": "4S_Estandarizar_SEIKETSU [4S_1 Los tableros de desempeño por hora y documentación en el área (QPS, ayuda visual, check list, etc.) en el área tienen información actualizada y se encuentran en buenas condiciones (limpios y visibles)]",
-    "s4_2": "4S_Estandarizar_SEIKETSU [4S_2 El material, sus contenedores y racks estan identificados (cuenta con máximos y minimos)? ¿La etiqueta esta en buenas condiciones?]",
-    "s4_3": "4S_Estandarizar_SEIKETSU [4S_3 ¿El area se encuentra con las delimitaciones debidas? Carros, pallets, racks, gruas, gavetas.]",
-    "s5_1": "5S_Mantener_SHITSUKE [5S_1 El líder de área (supervisor / coordinador) conoce el resultado de la auditoría 5S y está realizando un seguimiento de las acciones correctivas y los resultados son visibles para todos]",
-    "s5_2": "5S_Mantener_SHITSUKE [5S_2 Es visible la limpieza, estandarización y orden del área (no hay material mal colocado o suciedad, los documentos estan actualizados, etc.)]"
-}
-
-# --- CARGAR DATOS CON MAPEO INVERSO ---
-@st.cache_data(ttl=60)
-def load_data(source="Combinar Ambos"):
-    df_sheets = pd.DataFrame()
-    df_supabase = pd.DataFrame()
-
-    # Cargar de Google Sheets
-    if source in ["Google Sheets", "Combinar Ambos"]:
-        try:
-            url = f"https://docs.google.com/spreadsheets/d/1fQknMt1KB98suoWzOedT87RMC6O_3uuCcUBiv3NOQgo/export?format=csv"
-            df_sheets = pd.read_csv(url)
-            df_sheets.columns = [c.strip() for c in df_sheets.columns]
-        except Exception as e:
-            st.error(f"Error al cargar Google Sheets: {e}")
+# --- MÉTRICAS DE TIEMPO POR ETAPA ---
+# Cada rerun junta sus spans en una traza; el registro del proceso guarda p50/p95 por span y las
+# filas/bytes de cada descarga. METRICAS_JSONL y METRICAS_PROMETHEUS (rutas en Secrets) los
+# exportan a un archivo de eventos y a un textfile para el collector de Prometheus.
+def _contar_bytes_supabase(respuesta):
+    # El hook corre antes de leer el cuerpo; read() lo deja en memoria para postgrest
+    METRICAS.sumar_bytes("Supabase", len(respuesta.read()))
 
-    # Cargar de Supabase
-    if source in ["Supabase", "Combinar Ambos"]:
-        try:
-            res = supabase.table("auditorias_5s").select("*").eq("estatus", "terminada").execute()
-            if res.data:
-                df_sp_raw = pd.DataFrame(res.data)
-                
-                # --- AQUÍ ESTÁ LA MAGIA: Traducimos llaves cortas a nombres largos del CSV ---
-                # Esto hace que el Dashboard crea que vienen del CSV original
-                df_supabase = df_sp_raw.rename(columns={v: k for k, v in MAPEO_NOMBRES.items()})
-                
-                # Eliminamos las columnas técnicas de la DB
-                cols_to_drop = [c for c in ["id", "creado_en", "actualizado_en", "estatus"] if c in df_supabase.columns]
-                df_supabase = df_supabase.drop(columns=cols_to_drop)
-        except Exception as e:
-            st.error(f"Error al conectar con Supabase: {e}")
+@st.cache_resource
+def init_metricas():
+    if st.secrets.get("METRICAS_JSONL"):
+        METRICAS.conectar_jsonl(st.secrets["METRICAS_JSONL"])
+    if st.secrets.get("METRICAS_PROMETHEUS"):
+        METRICAS.conectar_prometheus(st.secrets["METRICAS_PROMETHEUS"], int(st.secrets.get("METRICAS_PROMETHEUS_SEGUNDOS", 15)))
+    sesion = getattr(getattr(supabase, "postgrest", None), "session", None)
+    if sesion is not None:
+        sesion.event_hooks["response"].append(_contar_bytes_supabase)
+    return METRICAS
+
+metricas = init_metricas()
+metricas.iniciar_traza()
+
+# Tamaño máximo (lado mayor, en px) de las evidencias y sus miniaturas; se puede ajustar en Secrets
+MAX_LADO_FOTO = int(st.secrets.get("EVIDENCIA_MAX_LADO", MAX_LADO_EVIDENCIA))
+MAX_LADO_MINI = int(st.secrets.get("EVIDENCIA_MAX_LADO_MINIATURA", MAX_LADO_MINIATURA))
+
+# --- ESTADO DE DATOS COMPARTIDO POR EL PROCESO ---
+# Guardamos en memoria del proceso lo último que bajamos de cada fuente (ya con nombres largos),
+# la marca de agua de Supabase (mayor actualizado_en/creado_en visto) y un número de versión
+# que sube cada vez que cambia algo. La versión se usa para invalidar todo lo que depende de los datos.
+# El motor de tendencias recibe lo mismo pero solo como delta (tiene su propio lock y revisión).
+@st.cache_resource
+def estado_datos():
+    return {
+        "sheets": None, "sheets_hash": None,
+        "supabase": None, "watermark": None,
+        "version": 0, "version_en_disco": None,
+        "resincronizar": False, "avance_supabase": None, "errores_fuentes": {},
+        "tendencias": MotorTendencias(),
+        "lock": threading.RLock(),
+    }
+
+def _ids(df):
+    """Ids de Supabase como enteros (claves del motor de tendencias)."""
+    return df["id"].astype("int64").tolist() if "id" in df.columns else []
+
+# Hilos del proceso para descargar las fuentes (compartidos por todas las sesiones)
+@st.cache_resource
+def ejecutor_fuentes():
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="fuentes_5s")
+
+# --- SNAPSHOT EN DISCO (ARRANQUE EN CALIENTE) ---
+# Un proceso nuevo pinta con el último snapshot Parquet guardado y reconcilia en segundo plano.
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache_5s")
+SNAPSHOT_PARQUET = os.path.join(CACHE_DIR, "auditorias.parquet")
+SNAPSHOT_META = os.path.join(CACHE_DIR, "auditorias.json")
+SNAPSHOT_ESQUEMA = 2
+
+def leer_snapshot():
+    """Regresa (df, meta) del snapshot en disco, o (None, None) si no existe o es de otro esquema."""
+    try:
+        with open(SNAPSHOT_META, encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("esquema") != SNAPSHOT_ESQUEMA:
+            return None, None
+        return pd.read_parquet(SNAPSHOT_PARQUET, memory_map=True), meta
+    except Exception:
+        return None, None
+
+def guardar_snapshot():
+    """Escribe el estado actual a disco si cambió desde la última escritura (escritura atómica)."""
+    estado = estado_datos()
+    with estado["lock"]:
+        if estado["version"] == estado["version_en_disco"]:
+            return
+        partes = [df.assign(_origen=origen) for origen, df in [("sheets", estado["sheets"]), ("supabase", estado["supabase"])] if df is not None]
+        meta = {"esquema": SNAPSHOT_ESQUEMA, "version": estado["version"], "watermark": estado["watermark"],
+                "sheets_hash": estado["sheets_hash"], "guardado_en": pd.Timestamp.now(tz="UTC").isoformat()}
+        version = estado["version"]
+    if not partes:
+        return
+    df = pd.concat(partes, ignore_index=True)
+    # Parquet no acepta columnas object con tipos mezclados (ej. Maquina numérica en el CSV y texto en la DB)
+    for col in [c for c in df.columns if df[c].dtype == object]:
+        df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_parquet, tmp_meta = SNAPSHOT_PARQUET + ".tmp", SNAPSHOT_META + ".tmp"
+    df.to_parquet(tmp_parquet, index=False)
+    with open(tmp_meta, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp_parquet, SNAPSHOT_PARQUET)
+    os.replace(tmp_meta, SNAPSHOT_META)
+    with estado["lock"]:
+        estado["version_en_disco"] = version
+
+def sembrar_desde_snapshot():
+    """Carga el snapshot en el estado del proceso. Regresa True si había uno utilizable."""
+    df, meta = leer_snapshot()
+    if df is None:
+        return False
+    estado = estado_datos()
+    with estado["lock"]:
+        if estado["version"] != 0:
+            return True
+        for origen in ["sheets", "supabase"]:
+            parte = df[df["_origen"] == origen].drop(columns="_origen")
+            if not parte.empty:
+                estado[origen] = parte.dropna(axis=1, how="all").reset_index(drop=True)
+                claves = estado[origen].index if origen == "sheets" else _ids(estado[origen])
+                estado["tendencias"].reemplazar(origen, estado[origen], claves)
+        estado["watermark"] = meta.get("watermark")
+        estado["sheets_hash"] = meta.get("sheets_hash")
+        estado["version"] = estado["version_en_disco"] = meta.get("version", 1)
+    return True
+
+# --- ALMACÉN DE AUDITORÍAS ---
+# Supabase por defecto; ALMACEN = "sqlite" en Secrets usa un archivo local (plantas sin conexión)
+@st.cache_resource
+def init_almacen():
+    if st.secrets.get("ALMACEN", "supabase") == "sqlite":
+        return AlmacenSQLite(st.secrets.get("ALMACEN_SQLITE", os.path.join(CACHE_DIR, "auditorias.sqlite")))
+    return AlmacenSupabase(supabase)
+
+almacen = init_almacen()
+
+# --- DESCARGA DE CADA FUENTE ---
+URL_SHEETS = "https://docs.google.com/spreadsheets/d/1fQknMt1KB98suoWzOedT87RMC6O_3uuCcUBiv3NOQgo/export?format=csv"
+SHEETS_CUERPO = os.path.join(CACHE_DIR, "sheets.csv")
+SHEETS_META = os.path.join(CACHE_DIR, "sheets.json")
+TIMEOUT_SHEETS = 20
+
+def descargar_sheets(condicional=True):
+    """Baja el CSV de Sheets con petición condicional (ETag / Last-Modified).
+
+    Regresa los bytes nuevos, o None si el servidor respondió 304 y la copia local sigue vigente.
+    """
+    try:
+        with open(SHEETS_META, encoding="utf-8") as f:
+            meta = json.load(f)
+    except Exception:
+        meta = {}
+    encabezados = {}
+    if condicional and os.path.exists(SHEETS_CUERPO):
+        if meta.get("etag"):
+            encabezados["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            encabezados["If-Modified-Since"] = meta["last_modified"]
+    try:
+        with urllib.request.urlopen(urllib.request.Request(URL_SHEETS, headers=encabezados), timeout=TIMEOUT_SHEETS) as resp:
+            cuerpo = resp.read()
+            meta = {"etag": resp.headers.get("ETag"), "last_modified": resp.headers.get("Last-Modified")}
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return None
+        raise
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(SHEETS_CUERPO + ".tmp", "wb") as f:
+        f.write(cuerpo)
+    with open(SHEETS_META + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(SHEETS_CUERPO + ".tmp", SHEETS_CUERPO)
+    os.replace(SHEETS_META + ".tmp", SHEETS_META)
+    return cuerpo
+
+def actualizar_sheets(completo=False):
+    """Baja el CSV de Google Sheets y sube la versión solo si el contenido cambió."""
+    with metricas.span("descarga_sheets", fuente="Google Sheets") as descarga:
+        cuerpo = descargar_sheets(condicional=not completo)
+        descarga["bytes"] = 0 if cuerpo is None else len(cuerpo)
+    estado = estado_datos()
+    with estado["lock"]:
+        vigente = estado["sheets"] is not None and estado["sheets_hash"] is not None
+    if cuerpo is None:
+        if vigente:
+            metricas.registrar_descarga("Google Sheets", 0, 0)
+            return
+        # 304 en un proceso recién levantado (o tras resincronizar): se usa la copia local
+        with open(SHEETS_CUERPO, "rb") as f:
+            cuerpo = f.read()
+    # Con el hash de los bytes ni siquiera se parsea un CSV que no cambió
+    hash_sheets = hashlib.sha256(cuerpo).hexdigest()
+    if vigente and hash_sheets == estado["sheets_hash"]:
+        metricas.registrar_descarga("Google Sheets", 0, descarga["bytes"])
+        return
+    with metricas.span("parseo_sheets", bytes=len(cuerpo)) as parseo:
+        df_sheets = pd.read_csv(io.BytesIO(cuerpo))
+        df_sheets.columns = [c.strip() for c in df_sheets.columns]
+        parseo["filas"] = len(df_sheets)
+    metricas.registrar_descarga("Google Sheets", len(df_sheets), descarga["bytes"])
+    with estado["lock"]:
+        if hash_sheets == estado["sheets_hash"]:
+            return
+        estado["sheets"] = df_sheets
+        estado["sheets_hash"] = hash_sheets
+        estado["version"] += 1
+    # El CSV cambió completo: sus renglones se reemplazan en las tendencias
+    with metricas.span("tendencias", fuente="Google Sheets", filas=len(df_sheets)):
+        estado["tendencias"].reemplazar("sheets", df_sheets, df_sheets.index)
+
+def _marca_de_agua(df):
+    """Regresa la fecha más reciente (ISO) entre actualizado_en y creado_en del frame."""
+    fechas = pd.Series(pd.NaT, index=df.index, dtype="datetime64[ns, UTC]")
+    for col in ["actualizado_en", "creado_en"]:
+        if col in df.columns:
+            fechas = fechas.fillna(pd.to_datetime(df[col], errors="coerce", utc=True))
+    maximo = fechas.max()
+    return None if pd.isna(maximo) else maximo.isoformat()
+
+def sincronizar_supabase(completo=False, progreso=None):
+    """Trae de Supabase solo lo nuevo desde la última marca de agua (o todo si completo=True).
+
+    En lugar de bajar toda la tabla en cada recarga, pedimos los renglones posteriores a la
+    marca de agua y los fusionamos por 'id' con lo que ya teníamos en memoria. La lectura la hace
+    el almacén configurado (en Supabase va paginada). progreso(filas, total) se le pasa tal cual.
+    La descarga corre sin tomar el lock, así que las sesiones siguen pintando mientras tanto.
+    """
+    estado = estado_datos()
+    with estado["lock"]:
+        carga_completa = completo or estado["supabase"] is None or estado["watermark"] is None
+        wm = estado["watermark"]
+
+    with metricas.span("consulta_supabase", fuente="Supabase", completo=carga_completa) as consulta:
+        bytes_antes = metricas.bytes_recibidos("Supabase")
+        if carga_completa:
+            delta = almacen.leer_auditorias(COLUMNAS_ANALITICA, estatus="terminada", progreso=progreso)
+        else:
+            # Sin filtrar por estatus: así detectamos borradores que pasaron a 'terminada'
+            # y auditorías terminadas que se regresaron a borrador.
+            delta = almacen.leer_auditorias(COLUMNAS_ANALITICA, modificadas_desde=wm, progreso=progreso)
+        consulta["filas"] = len(delta)
+        # Aproximado: otra consulta a Supabase en paralelo (borradores, guardado) también suma aquí
+        consulta["bytes"] = metricas.bytes_recibidos("Supabase") - bytes_antes
+    metricas.registrar_descarga("Supabase", consulta["filas"], consulta["bytes"])
+
+    with estado["lock"]:
+        # Si alguien resincronizó mientras bajábamos, este delta ya no aplica
+        if estado["watermark"] != wm:
+            return
+        df = pd.DataFrame() if carga_completa else estado["supabase"]
+
+        if not carga_completa and delta.empty:
+            return
+
+        terminadas = pd.DataFrame()
+        if not delta.empty:
+            if "id" in df.columns:
+                df = df[~df["id"].isin(delta["id"])]
+            terminadas = delta[delta["estatus"] == "terminada"] if "estatus" in delta.columns else delta
+            # --- AQUÍ ESTÁ LA MAGIA: Traducimos llaves cortas a nombres largos del CSV ---
+            # Esto hace que el Dashboard crea que vienen del CSV original
+            terminadas = terminadas.rename(columns=MAPEO_NOMBRES)
+            df = pd.concat([df, terminadas], ignore_index=True)
+            wm_delta = _marca_de_agua(delta)
+            if wm_delta and (carga_completa or wm_delta > estado["watermark"]):
+                estado["watermark"] = wm_delta
+
+        estado["supabase"] = df
+        estado["version"] += 1
+
+    # Tendencias: solo el delta (todo en una carga completa), fuera del lock de los datos
+    with metricas.span("tendencias", fuente="Supabase", filas=len(delta), completo=carga_completa):
+        motor = estado["tendencias"]
+        if carga_completa:
+            motor.reemplazar("supabase", terminadas, _ids(terminadas))
+        else:
+            # Las que dejaron de estar terminadas salen; las terminadas entran o se reemplazan
+            motor.quitar("supabase", _ids(delta))
+            motor.aplicar("supabase", terminadas, _ids(terminadas))
+
+def forzar_resincronizacion():
+    """Pide al refrescador una descarga completa (sin delta ni petición condicional) de inmediato.
+
+    Lo que hay en memoria se sigue mostrando hasta que la descarga completa lo reemplaza.
+    """
+    estado = estado_datos()
+    with estado["lock"]:
+        estado["resincronizar"] = True
+    refrescador().notificar()
+
+def combinar_fuentes(source):
+    """Arma el frame de analítica a partir del estado en memoria."""
+    estado = estado_datos()
+    with estado["lock"]:
+        df_sheets = estado["sheets"] if estado["sheets"] is not None else pd.DataFrame()
+        df_supabase = estado["supabase"] if estado["supabase"] is not None else pd.DataFrame()
+        version = estado["version"]
+
+    # Eliminamos las columnas técnicas de la DB ('id' se queda para pedir el detalle bajo demanda)
+    cols_to_drop = [c for c in ["creado_en", "actualizado_en", "estatus"] if c in df_supabase.columns]
+    df_supabase = df_supabase.drop(columns=cols_to_drop)
 
     # Combinar o retornar
-    if source == "Google Sheets": return df_sheets
-    if source == "Supabase": return df_supabase
-    
+    if source == "Google Sheets":
+        df = df_sheets
+    elif source == "Supabase":
+        df = df_supabase
     # Si combinamos, nos aseguramos de que las columnas coincidan
-    if not df_sheets.empty and not df_supabase.empty:
-        return pd.concat([df_sheets, df_supabase], ignore_index=True)
-    return df_sheets if not df_sheets.empty else df_supabase
-
-
-# --- SIDEBAR FILTROS ---
-logo = "EA_2.png"
-try:
-    st.sidebar.image(logo, width=300)
-except:
-    pass
-
-st.sidebar.markdown("<div style='text-align:center;'><h2>🏭 5S Factory Command Center</h2></div>", unsafe_allow_html=True)
-
-origen_datos = st.sidebar.selectbox("💾 Origen de Datos (Analítica)", ["Combinar Ambos", "Google Sheets", "Supabase"])
-
-try:
-    df_raw = load_data(origen_datos)
-    mapeo = {"no cumple": 1, "falta mejorar": 3, "si cumple": 5, "n/a": np.nan}
-
-    def parse_value(val):
-        if pd.isna(val): return np.nan
-        v = str(val).lower().strip()
-        return mapeo.get(v, np.nan)
-
-    df_calc = df_raw.copy()
-    cols_1s = [c for c in df_raw.columns if "1S_" in c and "[" in c]
-    cols_2s = [c for c in df_raw.columns if "2S_" in c and "[" in c]
-    cols_3s = [c for c in df_raw.columns if "3S_" in c and "[" in c]
-    cols_4s = [c for c in df_raw.columns if "4S_" in c and "[" in c]
-    cols_5s = [c for c in df_raw.columns if "5S_" in c and "[" in c]
-    all_eval_cols = cols_1s + cols_2s + cols_3s + cols_4s + cols_5s
-
-    for col in all_eval_cols:
-        df_calc[col] = df_calc[col].apply(parse_value)
-        df_calc[col] = pd.to_numeric(df_calc[col], errors='coerce')
-
-    # --- VALIDAR COLUMNA PLANTA ---
-    if "Planta" not in df_calc.columns:
-        st.warning("⚠️ El dataset no contiene una columna 'Planta'. Se usará el filtro de Área como fallback.")
-        df_calc["Planta"] = "General"
-        plantas_disponibles = ["General"]
+    elif not df_sheets.empty and not df_supabase.empty:
+        df = pd.concat([df_sheets, df_supabase], ignore_index=True)
     else:
-        plantas_disponibles = sorted(df_calc["Planta"].unique().tolist())
+        df = df_sheets if not df_sheets.empty else df_supabase
+    df = df.copy()
+    df.attrs["version_datos"] = version
+    return df
+
+# --- REFRESCO COMPARTIDO POR EL PROCESO ---
+# Un solo hilo descarga las fuentes (en paralelo entre sí) y sube la versión cuando algo cambia.
+# Las sesiones nunca descargan: leen lo publicado y se repintan cuando ven una versión nueva.
+REFRESCO_SEG = int(st.secrets.get("REFRESCO_SEGUNDOS", 60))
+VIGILANCIA_SEG = int(st.secrets.get("VIGILANCIA_SEGUNDOS", 10))
+
+def _avance_supabase(filas, total):
+    estado_datos()["avance_supabase"] = (filas, total)
+
+FUENTES = {
+    "Google Sheets": actualizar_sheets,
+    "Supabase": lambda completo: sincronizar_supabase(completo, progreso=_avance_supabase),
+}
 
-    # --- VALIDAR COLUMNA DE FECHA PARA EL FILTRO DE MES ---
-    col_fecha = next((c for c in df_calc.columns if c.lower() in ['fecha', 'marca temporal', 'timestamp', 'date']), None)
-    if col_fecha:
+def refrescar_fuentes(completo=False):
+    """Descarga en paralelo todas las fuentes, guarda el snapshot y regresa {fuente: error}."""
+    futuros = {fuente: ejecutor_fuentes().submit(tarea, completo) for fuente, tarea in FUENTES.items()}
+    errores = {}
+    for fuente, futuro in futuros.items():
         try:
-            df_calc['_Fecha_Parsed'] = pd.to_datetime(df_calc[col_fecha], errors='coerce')
-            meses_map = {1: 'Enero', 2: 'Febrero', 3: 'Marzo', 4: 'Abril', 5: 'Mayo', 6: 'Junio',
-                         7: 'Julio', 8: 'Agosto', 9: 'Septiembre', 10: 'Octubre', 11: 'Noviembre', 12: 'Diciembre'}
-            df_calc['Mes'] = df_calc['_Fecha_Parsed'].dt.month.map(meses_map).fillna('Sin Fecha')
-            meses_ordenados = sorted(df_calc['_Fecha_Parsed'].dt.month.dropna().unique())
-            meses_disponibles = [meses_map[m] for m in meses_ordenados]
-            if 'Sin Fecha' in df_calc['Mes'].values:
-                meses_disponibles.append('Sin Fecha')
-        except:
-            df_calc['Mes'] = 'General'
-            meses_disponibles = ['General']
-    else:
-        df_calc['Mes'] = 'General'
-        meses_disponibles = ['General']
-
-    st.sidebar.header("🔍 Filtros de Auditoría")
-
-    mes_sel = st.sidebar.selectbox("📅 Mes", ["Todos"] + meses_disponibles)
-    planta_sel = st.sidebar.selectbox("🌱 Planta", ["Todas"] + plantas_disponibles)
-
-    df_chain = df_calc.copy()
-
-    if mes_sel != "Todos":
-        df_chain = df_chain[df_chain["Mes"] == mes_sel]
-
-    df_plant_filtered = df_chain.copy()
-    if planta_sel != "Todas":
-        df_plant_filtered = df_plant_filtered[df_plant_filtered["Planta"] == planta_sel]
-
-    areas_disponibles = sorted(df_plant_filtered["Area"].unique().tolist()) if not df_plant_filtered.empty else []
-    area_sel = st.sidebar.selectbox("Área", ["Todos"] + areas_disponibles)
+            futuro.result()
+        except Exception as e:
+            errores[fuente] = str(e)
+    try:
+        guardar_snapshot()
+    except Exception as e:
+        errores["Snapshot"] = str(e)
+    return errores
+
+def ciclo_de_refresco():
+    estado = estado_datos()
+    with estado["lock"]:
+        completo, estado["resincronizar"] = estado["resincronizar"], False
+        estado["avance_supabase"] = None
+    errores = refrescar_fuentes(completo)
+    with estado["lock"]:
+        estado["errores_fuentes"] = errores
 
-    df_area_filtered = df_plant_filtered.copy()
-    if area_sel != "Todos":
-        df_area_filtered = df_area_filtered[df_area_filtered["Area"] == area_sel]
+@st.cache_resource
+def refrescador():
+    """Arranca (una vez por proceso) el hilo de refresco con la señal configurada en Secrets.
+
+    SENAL_CAMBIOS = "notificaciones" despierta con cada cambio de la tabla en Supabase Realtime.
+    """
+    if st.secrets.get("SENAL_CAMBIOS", "sondeo") == "notificaciones":
+        senal = SenalNotificaciones(respaldo=int(st.secrets.get("SENAL_RESPALDO_SEGUNDOS", 600)))
+        senal.conectar(feed_realtime(SUPABASE_URL, SUPABASE_KEY, TABLA))
+    else:
+        senal = SenalSondeo(REFRESCO_SEG)
+    # Arranque en frío con snapshot en disco: se pinta con él mientras llega la primera descarga
+    sembrar_desde_snapshot()
+    return Refrescador(ciclo_de_refresco, senal).iniciar()
+
+def esperar_datos():
+    """Bloquea solo si todavía no hay nada que mostrar (proceso nuevo y sin snapshot)."""
+    motor = refrescador()
+    estado = estado_datos()
+    if estado["version"]:
+        return
+    barra = st.empty()
+    while not motor.esperar_primera_carga(0.25):
+        if estado["avance_supabase"] and estado["avance_supabase"][1]:
+            filas, total = estado["avance_supabase"]
+            barra.progress(min(filas / total, 1.0), text=f"Descargando auditorías de Supabase: {filas:,}/{total:,}")
+    barra.empty()
+
+def mostrar_errores_fuentes(source):
+    mensajes = {"Google Sheets": "Error al cargar Google Sheets", "Supabase": "Error al conectar con Supabase"}
+    for fuente, error in estado_datos()["errores_fuentes"].items():
+        if fuente == "Snapshot":
+            st.warning(f"No se pudo guardar el snapshot local: {error}")
+        elif source in [fuente, "Combinar Ambos"]:
+            st.error(f"{mensajes[fuente]}: {error}")
+
+@st.fragment(run_every=VIGILANCIA_SEG)
+def vigilar_version():
+    """Repinta la sesión completa solo cuando el refrescador publicó una versión nueva."""
+    if estado_datos()["version"] != st.session_state.get("version_mostrada"):
+        st.rerun()
+    ultima = refrescador().ultima_actualizacion
+    if ultima:
+        st.caption(f"🟢 Datos revisados a las {pd.Timestamp.fromtimestamp(ultima):%H:%M:%S}")
+
+# --- DETALLE BAJO DEMANDA (COMENTARIOS Y EVIDENCIAS) ---
+@st.cache_data(ttl=300, max_entries=32, show_spinner=False)
+def cargar_detalle(ids, columnas, version):
+    """Trae las columnas de detalle de las auditorías del almacén con esos ids."""
+    return almacen.leer_detalle(list(ids), list(columnas))
+
+def completar_detalle(df, version, columnas):
+    """Regresa df con las columnas de detalle llenas para sus renglones de Supabase.
+
+    Los renglones de Google Sheets ya traen sus comentarios en el CSV y se respetan tal cual.
+    """
+    if df.empty or "id" not in df.columns:
+        return df
+    ids = df["id"].dropna()
+    if ids.empty:
+        return df
+    # Al combinar con Sheets el id queda como float (NaN en los renglones sin id)
+    if pd.api.types.is_float_dtype(ids):
+        ids = ids.astype("int64")
+    detalle = cargar_detalle(tuple(sorted(ids.unique().tolist())), tuple(columnas), version)
+    df = df.copy()
+    for col in columnas:
+        if col not in detalle.columns:
+            continue
+        valores = df["id"].map(detalle[col])
+        df[col] = valores.combine_first(df[col]) if col in df.columns else valores
+    return df
+
+# Índice local hash de contenido -> URL de las evidencias ya subidas
+@st.cache_resource
+def indice_evidencias():
+    return IndiceEvidencias(os.path.join(CACHE_DIR, "evidencias.sqlite"))
 
-    maquinas_disponibles = sorted(df_area_filtered["Maquina"].unique().tolist()) if not df_area_filtered.empty else []
-    maq_sel = st.sidebar.selectbox("Máquina", ["Todos"] + maquinas_disponibles)
+# --- BORRADORES ---
+AUTOGUARDADO_SEG = float(st.secrets.get("AUTOGUARDADO_SEGUNDOS", 5))
 
-    df_filtered = df_area_filtered.copy()
-    if maq_sel != "Todos":
-        df_filtered = df_filtered[df_filtered["Maquina"] == maq_sel]
+@st.cache_data(ttl=60, show_spinner=False)
+def indice_borradores():
+    """Índice compacto de borradores (id, auditor, área, máquina, actualizado_en); se limpia al guardar."""
+    return almacen.leer_indice_borradores()
 
-    # --- CÁLCULOS RESUMEN ---
-    resumen_data = []
-    etapas_dict = {"SEIRI": cols_1s, "SEITON": cols_2s, "SEISO": cols_3s, "SEIKETSU": cols_4s, "SHITSUKE": cols_5s}
-    etapas_nombres = list(etapas_dict.keys())
+@st.cache_data(ttl=300, max_entries=16, show_spinner=False)
+def cargar_borrador(id_borrador, actualizado_en):
+    """Renglón completo de un borrador; actualizado_en va en la llave para no servir una versión vieja."""
+    return almacen.leer_auditoria(id_borrador)
 
-    for etapa, columnas in etapas_dict.items():
-        if not df_filtered.empty and len(columnas) > 0:
-            avg_etapa = df_filtered[columnas].mean(axis=1, numeric_only=True).mean()
-            ranking = df_filtered.groupby("Area")[columnas].mean(numeric_only=True).mean(axis=1)
-            mejor_area = ranking.idxmax() if not ranking.empty and ranking.max() > 0 else "N/A"
-        else:
-            avg_etapa = np.nan
-            mejor_area = "N/A"
+def etiqueta_borrador(d):
+    # El id va en la etiqueta: el selectbox distingue las opciones por su texto
+    etiqueta = f"#{d['id']} {d.get('Nombre del Auditor')} - {d.get('Area')} - {d.get('Maquina')}"
+    fecha = pd.to_datetime(d.get("actualizado_en"), errors="coerce", utc=True)
+    return f"{etiqueta} ({fecha:%d/%m %H:%M})" if pd.notna(fecha) else etiqueta
 
-        resumen_data.append({
-            "Etapa": etapa, "Puntaje": round(avg_etapa, 2) if not np.isnan(avg_etapa) else 0,
-            "Mejor Área": mejor_area
-        })
+# --- BANDEJA DE SALIDA (GUARDADO SIN CONEXIÓN) ---
+REINTENTO_BANDEJA_SEG = int(st.secrets.get("BANDEJA_REINTENTO_SEGUNDOS", 30))
 
-    score_global = sum([d['Puntaje'] for d in resumen_data]) / 5
-    resumen_data.append({"Etapa": "TOTAL", "Puntaje": round(score_global, 2), "Mejor Área": "N/A"})
-    resumen = pd.DataFrame(resumen_data)
-
-    if not df_filtered.empty:
-        ranking_general = df_filtered.groupby('Area')[all_eval_cols].mean(numeric_only=True).mean(axis=1).sort_values(ascending=False)
-    else:
-        ranking_general = pd.Series()
+@st.cache_resource
+def bandeja():
+    return BandejaSalida(os.path.join(CACHE_DIR, "bandeja.sqlite"))
 
-    ranking_df = ranking_general.reset_index()
-    ranking_df.columns = ['Area', 'Calificación Total 5S']
+@st.cache_resource
+def vaciador_bandeja():
+    """Hilo que manda la bandeja al almacén al arrancar, al encolar algo y cada REINTENTO_BANDEJA_SEG."""
+    salida, refresco, indice = bandeja(), refrescador(), indice_evidencias()
+    def subir(archivos):
+        return guardar_evidencias(
+            supabase.storage.from_(BUCKET_EVIDENCIAS), archivos, indice=indice,
+            max_lado=MAX_LADO_FOTO, max_lado_miniatura=MAX_LADO_MINI
+        )
+    def vaciar():
+        if salida.vaciar(almacen, subir=subir):
+            # Llegaron borradores o auditorías: índice de borradores y dashboard se ponen al día
+            indice_borradores.clear()
+            refresco.notificar()
+    return Refrescador(vaciar, SenalSondeo(REINTENTO_BANDEJA_SEG), nombre="bandeja_5s").iniciar()
+
+def encolar_envio(fila, id_auditoria=None, clave=None, archivos=None):
+    """Guarda en la bandeja local (latencia de disco) y despierta al hilo que la vacía."""
+    clave = bandeja().encolar(fila, id_auditoria, clave, archivos)
+    vaciador_bandeja().notificar()
+    return clave
+
+# Un solo agrupador por proceso; cada borrador tiene su propia espera
+@st.cache_resource
+def autoguardado():
+    salida, vaciador = bandeja(), vaciador_bandeja()
+    def escribir(id_borrador, cambios):
+        salida.encolar(cambios, id_borrador)
+        vaciador.notificar()
+    return GuardadoDiferido(escribir, espera=AUTOGUARDADO_SEG)
 
-    max_score = ranking_df['Calificación Total 5S'].max() if not ranking_df.empty else 0
-    ranking_df['Es_Máximo'] = ranking_df['Calificación Total 5S'] == max_score
+# El vaciador arranca con el proceso: lo que quedó en la bandeja antes de un reinicio se manda
+# aunque nadie vuelva a guardar nada
+vaciador_bandeja()
 
-    # --- PESTAÑAS PRINCIPALES ---
-    st.title("🏭🎛️ 5S Operations Command Center")
-    tab_dashboard, tab_formulario = st.tabs(["📊 Dashboard de Control", "📝 Registrar / Continuar Auditoría 5S"])
+# --- CARGAR DATOS CON MAPEO INVERSO ---
+@st.cache_data(max_entries=8, show_spinner=False)
+def load_data(source="Combinar Ambos", version=None):
+    """Frame de analítica publicado para (origen, versión); no descarga nada."""
+    return combinar_fuentes(source)
 
-    # ==========================================
-    # PESTAÑA 1: DASHBOARD DE CONTROL
-    # ==========================================
-    with tab_dashboard:
-        c1, c2, c3 = st.columns(3)
-        c1.metric("Auditorías", len(df_filtered))
-        c2.metric("Score Global", f"{score_global:.2f}")
 
-        lider_nombre = ranking_general.idxmax() if not ranking_general.empty else "N/A"
-        c3.metric("Líder de Planta", lider_nombre)
+# --- PREPARACIÓN COMPARTIDA POR VERSIÓN DE DATOS ---
+# Las auditorías del almacén se agregan en SQL (cubo_5s en Supabase): al tablero solo llegan
+# renglones Planta × Area × Maquina × Mes. Requiere la función de `python almacen_5s.py --sql-supabase`,
+# así que va apagado hasta poner CUBO_EN_ALMACEN = true en Secrets; apagado todo se arma en pandas.
+CUBO_EN_ALMACEN = str(st.secrets.get("CUBO_EN_ALMACEN", "false")).strip().lower() in ("true", "1", "si", "sí")
+log = logging.getLogger("tablero_5s")
 
-        # RADAR
-        st.subheader("📊 Comparativo de Madurez por Área")
+@st.cache_resource
+def falla_cubo_almacen():
+    """Primer error de almacen.cubo() en el proceso ({} si no ha fallado); desde ahí ya no se intenta."""
+    return {}
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def datos_preparados(_df_raw, version, source, con_cubo=True):
+    """preparar_datos una sola vez por (versión, origen).
+
+    El resultado se comparte entre todas las sesiones (no se copia por sesión), así que se trata
+    como de solo lectura.
+    """
+    return preparar_datos(_df_raw, con_cubo)
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def cubo_tablero(_datos, version, source):
+    """(cubo, error) del tablero por (versión, origen); error es None si el almacén respondió.
+
+    Si preparar_datos ya armó el cubo en pandas se usa ese. Si no, la parte del almacén sale de
+    almacen.cubo() y solo los renglones de Google Sheets (que no viven en el almacén) se agregan
+    aquí. Si el almacén falla (ej. falta la función cubo_5s) se arma todo en pandas; la falla se
+    anota una vez por proceso (log y panel de depuración) y las versiones siguientes ya no lo intentan.
+    """
+    df, etapas_dict = _datos["df"], _datos["etapas"]
+    if _datos["cubo"] is not None:
+        return _datos["cubo"], None
+    falla = falla_cubo_almacen()
+    if falla:
+        with metricas.span("cubo", filas=len(df)):
+            return construir_cubo(df, etapas_dict), falla["error"]
+    try:
+        with metricas.span("cubo_almacen") as info:
+            partes = [almacen.cubo()]
+            info["celdas"] = len(partes[0])
+    except Exception as e:
+        falla.setdefault("error", e)
+        log.warning("almacen.cubo() falló, el tablero se arma en pandas hasta reiniciar el proceso: %s", e)
+        with metricas.span("cubo", filas=len(df)):
+            return construir_cubo(df, etapas_dict), e
+    if source == "Combinar Ambos":
+        df_sheets = df[df["id"].isna()] if "id" in df.columns else df
+        if not df_sheets.empty:
+            with metricas.span("cubo", filas=len(df_sheets)):
+                partes.append(construir_cubo(df_sheets, etapas_dict))
+    return combinar_cubos(partes, etapas_dict), None
+
+# --- FIGURAS DEL TABLERO ---
+# Con más de 2 × RADAR_EXTREMOS áreas el radar puede mostrar solo los extremos (el resto en banda)
+RADAR_EXTREMOS = int(st.secrets.get("RADAR_EXTREMOS", 5))
+# Columnas que la tabla de datos muestra de entrada (las preguntas se agregan a mano)
+COLUMNAS_TABLA = ["Fecha", "Marca temporal", "Mes", "Planta", "Area", "Maquina", "Nombre del Auditor", "Seleccione un Turno"]
+
+@st.cache_resource(max_entries=32, show_spinner=False)
+def figuras_memorizadas(_cubo, _ranking_df, etapas_nombres, version, source, seleccion, extremos=None):
+    """Radar (figura Plotly) y barras (spec Vega-Lite) por (versión, filtros), compartidos entre sesiones.
+
+    Un rerun sin datos nuevos ni cambios en el sidebar no vuelve a agregar ni a armar figuras;
+    al llenarse se descarta la combinación usada hace más tiempo. El radar se guarda como figura
+    y no como dict porque st.plotly_chart vuelve a validar un dict completo en cada render.
+    Con extremos=N el radar lleva solo las N mejores y N peores áreas; las demás van juntas en
+    una banda (mínimo a máximo por etapa) con su promedio. Son de solo lectura.
+    """
+    with metricas.span("radar") as info:
         fig_radar = go.Figure()
-        areas_activas = df_filtered['Area'].unique() if not df_filtered.empty else []
+        puntajes_area = puntaje_etapas(_cubo, etapas_nombres, por="Area", ordenar=False)
+        info["areas"] = len(puntajes_area)
+
+        resto = []
+        if extremos and len(puntajes_area) > 2 * extremos:
+            # Mismo promedio que muestra cada trazo: etapas redondeadas, sin dato = 0
+            promedios = puntajes_area.round(2).fillna(0).sum(axis=1) / 5
+            orden = promedios.sort_values(ascending=False, kind="stable").index
+            resto = orden[extremos:-extremos]
+            banda = puntajes_area.loc[resto].fillna(0)
+            puntajes_area = puntajes_area.loc[orden[:extremos].append(orden[-extremos:])]
+        info["trazos"] = len(puntajes_area)
+
+        if len(resto):
+            theta_vals = etapas_nombres + [etapas_nombres[0]]
+            maximos, minimos = banda.max().round(2).tolist(), banda.min().round(2).tolist()
+            # Anillo: contorno exterior por los máximos y de regreso por los mínimos
+            fig_radar.add_trace(go.Scatterpolar(
+                r=maximos + [maximos[0]] + (minimos + [minimos[0]])[::-1], theta=theta_vals + theta_vals[::-1],
+                name=f"Resto: rango de {len(resto)} áreas", fill='toself', fillcolor="rgba(160,160,160,0.25)",
+                line=dict(width=0), hoverinfo="skip"
+            ))
+            r_resto = [round(v, 2) if not np.isnan(v) else 0 for v in puntaje_etapas(_cubo[_cubo["Area"].isin(resto)], etapas_nombres)]
+            avg_resto = round(sum(r_resto)/5, 2)
+            fig_radar.add_trace(go.Scatterpolar(
+                r=r_resto + [r_resto[0]], theta=theta_vals, name=f"Resto: {len(resto)} áreas ({avg_resto})",
+                line=dict(color="#b0b0b0", width=2, dash="dash"), fill='none',
+                hovertemplate=f"<b>Resto ({len(resto)} áreas)</b><br>Etapa: %{{theta}}<br>Calificación: %{{r}}<br>Promedio: {avg_resto}<extra></extra>"
+            ))
 
-        for area in areas_activas:
-            df_area = df_filtered[df_filtered['Area'] == area]
-            r_vals = [round(df_area[cols].mean(axis=1, numeric_only=True).mean(), 2) for cols in etapas_dict.values()]
-            r_vals = [v if not np.isnan(v) else 0 for v in r_vals]
+        for area, fila in puntajes_area.iterrows():
+            r_vals = [round(v, 2) if not np.isnan(v) else 0 for v in fila]
             avg_area = round(sum(r_vals)/5, 2)
 
             color_linea = "#00FF00" if avg_area >= 4 else ("#FFFF00" if avg_area >= 3 else "#ff4b4b")
@@ -266,11 +679,9 @@ try:
             ),
             legend=dict(orientation="h", yanchor="bottom", y=1.1, xanchor="center", x=0.5, font=dict(color="white"))
         )
-        st.plotly_chart(fig_radar, use_container_width=True)
 
-        # BARRAS ALTAIR
-        st.subheader("📈 Calificación Total 5S por Área")
-        bars = alt.Chart(ranking_df).mark_bar(cornerRadiusTopLeft=8, cornerRadiusTopRight=8).encode(
+    with metricas.span("altair", areas=len(_ranking_df)):
+        bars = alt.Chart(_ranking_df).mark_bar(cornerRadiusTopLeft=8, cornerRadiusTopRight=8).encode(
             x=alt.X('Area:N', sort=None, axis=alt.Axis(labelColor='white', labelAngle=-45, title='Área')),
             y=alt.Y('Calificación Total 5S:Q', scale=alt.Scale(domain=[0, 5]), axis=alt.Axis(labelColor='white', title='Calificación Total (0-5)')),
             color=alt.condition(alt.datum.Es_Máximo, alt.value('#00FF00'), alt.value('#1f77b4')),
@@ -280,198 +691,232 @@ try:
         text = bars.mark_text(align='center', baseline='bottom', dy=-5, color='white', fontSize=12, fontWeight='bold').encode(
             text=alt.Text('Calificación Total 5S:Q', format='.2f')
         )
-        st.altair_chart(bars + text, use_container_width=True)
-
-        # ==========================================
-        # REPORTE HTML (RESTAURADO A LA VERSIÓN ORIGINAL)
-        # ==========================================
-        def generate_html_report(df_resumen, df_audit, ranking_df_area, mes_aplicado):
-            ranking_total = df_audit.groupby('Area')[all_eval_cols].mean(numeric_only=True).mean(axis=1).dropna()
-            area_critica = ranking_total.idxmin() if not ranking_total.empty else "N/A"
-            area_lider_rep = ranking_total.idxmax() if not ranking_total.empty else "N/A"
-            score_critico_area = round(ranking_total.min(), 2) if not ranking_total.empty else 0
-            auditor_lider_rep = df_audit['Nombre del Auditor'].mode()[0] if not df_audit.empty and 'Nombre del Auditor' in df_audit.columns else "N/A"
-
-            etapas_ciclo = etapas_nombres + [etapas_nombres[0]]
-            plantas_unicas = df_audit['Planta'].unique() if not df_audit.empty and 'Planta' in df_audit.columns else []
-
-            fig_anim = go.Figure()
-            for planta in plantas_unicas:
-                df_p = df_audit[df_audit['Planta'] == planta]
-                r_v = [round(df_p[cols].mean(axis=1, numeric_only=True).mean(), 2) for cols in etapas_dict.values()]
-                r_v = [v if not np.isnan(v) else 0 for v in r_v]
-                avg_planta = round(sum(r_v)/5, 2)
-                color_linea = "#00FF00" if avg_planta >= 4 else ("#FFFF00" if avg_planta >= 3 else "#ff4b4b")
-                r_v.append(r_v[0])
-                fig_anim.add_trace(go.Scatterpolar(
-                    r=r_v, theta=etapas_ciclo, name=planta,
-                    line=dict(color=color_linea, width=3), fill='none',
-                    marker=dict(size=6, color=color_linea),
-                    hovertemplate=f"<b>Planta: {planta}</b><br>Etapa: %{{theta}}<br>Calificación: %{{r}}<br>Promedio: {avg_planta}<extra></extra>"
-                ))
-
-            # Se restauro el estilo en el Update Layout para igualar el original
-            fig_anim.update_layout(
-                template="plotly_dark",
-                polar=dict(
-                    bgcolor="rgba(0,0,0,0)",
-                    radialaxis=dict(range=[0,5], visible=True, tickfont=dict(color="white", size=12)),
-                    angularaxis=dict(
-                        tickfont=dict(color="white", size=14),
-                        tickvals=etapas_nombres,
-                        ticktext=[f"<b>{etapa}</b>" for etapa in etapas_nombres]
-                    )
-                ),
-                paper_bgcolor="rgba(0,0,0,0)",
-                plot_bgcolor="rgba(0,0,0,0)",
-                margin=dict(t=30, b=30, l=30, r=30)
-            )
-            radar_div = fig_anim.to_html(full_html=False, include_plotlyjs='cdn')
-
-            ranking_df_area['Es_Maximo'] = ranking_df_area['Calificación Total 5S'] == ranking_df_area['Calificación Total 5S'].max()
-            fig_barras = go.Figure()
-            fig_barras.add_trace(go.Bar(
-                x=ranking_df_area['Area'], y=ranking_df_area['Calificación Total 5S'],
-                marker_color=['#00FF00' if es_max else '#1f77b4' for es_max in ranking_df_area['Es_Maximo']],
-                text=ranking_df_area['Calificación Total 5S'].round(2), textposition='outside',
-                textfont=dict(color='white', size=12), hovertemplate='Área: %{x}<br>Calificación: %{y}<extra></extra>'
-            ))
-            fig_barras.update_layout(
-                title="Calificación Total 5S por Área", template="plotly_dark",
-                paper_bgcolor="rgba(0,0,0,0)", plot_bgcolor="rgba(0,0,0,0)",
-                yaxis=dict(title="Calificación Total (0-5)", range=[0, 5], gridcolor="gray", tickfont=dict(color="white")),
-                xaxis=dict(title="Área", tickfont=dict(color="white"), tickangle=-45), height=500, margin=dict(t=50, b=100, l=50, r=50)
-            )
-            barras_div = fig_barras.to_html(full_html=False, include_plotlyjs='cdn')
-
-            cols_comentarios = [c for c in df_audit.columns if 'Comentario' in c or 'Comentarios' in c]
-            comentarios_por_area = {}
-            for _, row in df_audit.iterrows():
-                area = row['Area']
-                comentarios = []
-                for col in cols_comentarios:
-                    if pd.notna(row[col]) and str(row[col]).strip() != '':
-                        # Limpiamos el nombre de la columna para que se vea más limpio
-                        col_name = col.replace('Comentario', '').replace('Comentarios', '').replace('_', ' ').strip()
-                        comentarios.append(f"• {col_name}: {row[col]}")
-                if comentarios:
-                    if area not in comentarios_por_area: comentarios_por_area[area] = []
-                    comentarios_por_area[area].extend(comentarios)
-
-            comentarios_html = ""
-            for area, comentarios_lista in comentarios_por_area.items():
-                comentarios_texto = "<br>".join(list(set(comentarios_lista)))
-                clase_anim = 'class="row-critical-blink"' if area == area_critica else ''
-                comentarios_html += f"<tr {clase_anim}><td style='padding: 12px; border-bottom: 1px solid #333; font-weight: bold;'>{area}</td><td style='padding: 12px; border-bottom: 1px solid #333;'>{comentarios_texto}</td></tr>"
-
-            tabla_calificaciones_html = ""
-            for _, row in ranking_df_area.iterrows():
-                clase_anim = 'class="row-critical-blink"' if row['Area'] == area_critica else ''
-                tabla_calificaciones_html += f"""
-                <tr {clase_anim}>
-                    <td style="padding: 12px; border-bottom: 1px solid #333; font-weight: bold;">{row['Area']}</td>
-                    <td style="padding: 12px; border-bottom: 1px solid #333;">{row['Calificación Total 5S']:.2f}</td>
-                    <td style="padding: 12px; border-bottom: 1px solid #333; color: #00ffff;">{area_lider_rep if row['Calificación Total 5S'] == ranking_df_area['Calificación Total 5S'].max() else '-'}</td>
-                </tr>
-                """
-
-            # HTML RECONSTRUIDO CON CSS AVANZADO ORIGINAL
-            return f"""
-            <html>
-            <head>
-                <meta charset="UTF-8">
-                <style>
-                    @keyframes blink-red {{
-                        0% {{ background-color: rgba(255, 75, 75, 0.1); }}
-                        50% {{ background-color: rgba(255, 75, 75, 0.4); color: #fff; }}
-                        100% {{ background-color: rgba(255, 75, 75, 0.1); }}
-                    }}
-                    @keyframes float {{
-                        0% {{ transform: translateY(0px); }}
-                        50% {{ transform: translateY(-10px); }}
-                        100% {{ transform: translateY(0px); }}
-                    }}
-                    body {{ background-color: #0e1117; color: #e0e0e0; font-family: 'Segoe UI', sans-serif; padding: 40px; text-align: center; }}
-                    .insight-grid {{ display: flex; justify-content: center; gap: 20px; margin: 30px 0; flex-wrap: wrap; }}
-                    .insight-card {{ flex: 1; max-width: 300px; padding: 25px; border-radius: 15px; background: #161b22; border-top: 4px solid #333; box-shadow: 0 4px 15px rgba(0,0,0,0.3); }}
-                    .val {{ font-size: 28px; font-weight: bold; color: #00ffff; display: block; margin: 10px 0; }}
-                    .radar-container, .barras-container {{ animation: float 4s ease-in-out infinite; background: #161b22; padding: 20px; border-radius: 20px; margin: 20px auto; max-width: 850px; border: 1px solid #30363d; }}
-                    .styled-table {{ width: 90%; margin-left: auto; margin-right: auto; border-collapse: collapse; margin-top: 20px; background: #161b22; }}
-                    .styled-table th {{ background: #00ffff; color: #000; padding: 15px; text-transform: uppercase; font-size: 0.9em; }}
-                    .styled-table td {{ padding: 12px; border-bottom: 1px solid #333; }}
-                    .row-critical-blink {{ animation: blink-red 2s infinite; font-weight: bold; }}
-                    h1, h3 {{ letter-spacing: 2px; text-transform: uppercase; color: #fff; }}
-                </style>
-            </head>
-            <body>
-                <h1>🏭 Command Center: Reporte de Desempeño 5S</h1>
-                <p style="font-size: 1.2em; color: #00ffff; margin-top: -10px;">Filtro de Análisis: <b>Filtro por Mes -> {mes_aplicado}</b></p>
-                <p>Developed by Master Engineer <b>Erik Armenta</b></p>
-
-                <div class="insight-grid">
-                    <div class="insight-card" style="border-top-color: #ff4b4b;">
-                        <small style="color:#ff4b4b">ALERTA: ÁREA CRÍTICA</small>
-                        <span class="val">{area_critica}</span>
-                        <small>Puntaje: {score_critico_area}</small>
-                    </div>
-                    <div class="insight-card" style="border-top-color: #00ffff;">
-                        <small style="color:#00ffff">BENCHMARK: ÁREA LÍDER</small>
-                        <span class="val">{area_lider_rep}</span>
-                        <small>Máximo Desempeño</small>
-                    </div>
-                    <div class="insight-card" style="border-top-color: #f1c40f;">
-                        <small style="color:#f1c40f">AUDITOR LÍDER</small>
-                        <span class="val">{auditor_lider_rep}</span>
-                        <small>Mayor Nivel de Actividad</small>
-                    </div>
-                </div>
-
-                <div class="radar-container">
-                    <h3>Análisis de Madurez por Planta (Calificación Global)</h3>
-                    {radar_div}
-                </div>
-
-                <div class="barras-container">
-                    <h3>Calificación Total 5S por Área</h3>
-                    {barras_div}
-                </div>
-
-                <div style="margin-top:40px;">
-                    <h3>📊 Calificaciones Detalladas por Área (Total 5S)</h3>
-                    <table class="styled-table" style="max-width: 600px;">
-                        <thead>
-                            <tr><th>Área</th><th>Puntaje Promedio Total 5S</th><th>Área Referente (Líder)</th></tr>
-                        </thead>
-                        <tbody>{tabla_calificaciones_html}</tbody>
-                    </table>
-                </div>
-
-                <div style="margin-top:40px;">
-                    <h3>📝 Comentarios de Auditoría por Área</h3>
-                    <table class="styled-table">
-                        <thead>
-                            <tr><th>Área</th><th>Comentarios de Auditoría</th></tr>
-                        </thead>
-                        <tbody>{comentarios_html if comentarios_html else '<tr><td colspan="2">Sin comentarios registrados</td></tr>'}</tbody>
-                    </table>
-                </div>
-
-                <div style="margin-top: 50px; color: #888; font-size: 0.9em;">
-                    Generado automáticamente por EA 5S System • {pd.Timestamp.now().strftime('%Y-%m-%d %H:%M')}
-                </div>
-            </body>
-            </html>"""
+        spec_barras = (bars + text).to_dict()
+    return fig_radar, spec_barras
+
+# Orígenes del motor de tendencias que entran en cada opción del selector de datos
+ORIGENES_TENDENCIA = {"Combinar Ambos": ["sheets", "supabase"], "Google Sheets": ["sheets"], "Supabase": ["supabase"]}
+
+@st.cache_resource(max_entries=32, show_spinner=False)
+def tendencia_memorizada(revision, source, planta, area, frecuencia, ventana):
+    """Spec Vega-Lite de la tendencia por etapa; la llave es la revisión del motor, no la versión de datos.
+
+    planta/area None = todas. Regresa None si no hay auditorías con fecha para la selección.
+    """
+    with metricas.span("tendencia", frecuencia=frecuencia, ventana=ventana) as info:
+        serie = estado_datos()["tendencias"].serie(frecuencia, ORIGENES_TENDENCIA[source], planta, area, ventana)
+        info["periodos"] = len(serie)
+        if serie.empty:
+            return None
+        largo = serie.reset_index().melt(
+            id_vars=["Periodo", "Auditorías"], value_vars=ETAPAS + ["TOTAL"], var_name="Etapa", value_name="Puntaje"
+        )
+        if frecuencia == "M":
+            largo["Periodo_txt"] = [etiqueta_mes(p.year, p.month) for p in largo["Periodo"]]
+        else:
+            largo["Periodo_txt"] = "Semana del " + largo["Periodo"].dt.strftime("%d/%m/%Y")
+
+        lineas = alt.Chart(largo).mark_line(point=True).encode(
+            x=alt.X('Periodo:T', axis=alt.Axis(labelColor='white', format='%m/%Y' if frecuencia == "M" else '%d/%m/%y', title=FRECUENCIAS[frecuencia][0])),
+            y=alt.Y('Puntaje:Q', scale=alt.Scale(domain=[0, 5]), axis=alt.Axis(labelColor='white', title='Calificación (0-5)')),
+            color=alt.Color('Etapa:N', sort=ETAPAS + ["TOTAL"]),
+            strokeWidth=alt.condition(alt.datum.Etapa == "TOTAL", alt.value(4), alt.value(2)),
+            tooltip=[alt.Tooltip('Periodo_txt:N', title='Periodo'), 'Etapa', alt.Tooltip('Puntaje:Q', format='.2f'), 'Auditorías:Q']
+        ).properties(height=350)
+        return lineas.to_dict()
+
+# --- REPORTE HTML ---
+@st.cache_data(max_entries=16, show_spinner=False)
+def reporte_memorizado(_df_audit, _ranking_df, _cubo, _etapas_dict, version, source, seleccion, plotly_embebido=False):
+    """El reporte se arma solo cuando alguien lo descarga y se memoriza por (versión, filtros)."""
+    df_audit = completar_detalle(_df_audit, version, COLUMNAS_COMENTARIOS)
+    with metricas.span("reporte_html", filas=len(df_audit), plotly_embebido=plotly_embebido):
+        return generate_html_report(None, df_audit, _ranking_df.copy(), seleccion[0], _cubo, _etapas_dict, plotly_embebido)
+
+
+# --- SIDEBAR FILTROS ---
+logo = "EA_2.png"
+try:
+    st.sidebar.image(logo, width=300)
+except:
+    pass
+
+st.sidebar.markdown("<div style='text-align:center;'><h2>🏭 5S Factory Command Center</h2></div>", unsafe_allow_html=True)
+
+origen_datos = st.sidebar.selectbox("💾 Origen de Datos (Analítica)", ["Combinar Ambos", "Google Sheets", "Supabase"])
+if st.sidebar.button("🔄 Resincronizar todo", help="Descarta la sincronización incremental y vuelve a descargar la tabla completa."):
+    forzar_resincronizacion()
+
+try:
+    esperar_datos()
+    mostrar_errores_fuentes(origen_datos)
+    df_raw = load_data(origen_datos, estado_datos()["version"])
+    version_datos = df_raw.attrs.get("version_datos")
+    st.session_state.version_mostrada = version_datos
+    with st.sidebar:
+        vigilar_version()
+    cubo_en_almacen = CUBO_EN_ALMACEN and origen_datos != "Google Sheets"
+    datos = datos_preparados(df_raw, version_datos, origen_datos, con_cubo=not cubo_en_almacen)
+    cubo, _ = cubo_tablero(datos, version_datos, origen_datos)
+
+    df_calc = datos["df"]
+    etapas_dict = datos["etapas"]
+    etapas_nombres = list(etapas_dict.keys())
+    all_eval_cols = [c for cols in etapas_dict.values() for c in cols]
+    indice = datos["indice"]
+    # Opciones de los filtros desde el cubo; las posiciones de fila solo alimentan tabla y reportes
+    meses_disponibles = opciones_cubo(cubo, "Mes")
+    plantas_disponibles = opciones_cubo(cubo, "Planta")
+
+    if not datos["tiene_planta"]:
+        st.warning("⚠️ El dataset no contiene una columna 'Planta'. Se usará el filtro de Área como fallback.")
+
+    st.sidebar.header("🔍 Filtros de Auditoría")
+
+    with metricas.span("filtros") as filtros:
+        mes_sel = st.sidebar.selectbox("📅 Mes", ["Todos"] + meses_disponibles)
+        planta_sel = st.sidebar.selectbox("🌱 Planta", ["Todas"] + plantas_disponibles)
+
+        # Posiciones de fila que sobreviven al filtro (None = todas, sin copiar el frame)
+        posiciones = None
+        if mes_sel != "Todos":
+            posiciones = filtrar_posiciones(indice, "Mes", mes_sel, posiciones)
+        if planta_sel != "Todas":
+            posiciones = filtrar_posiciones(indice, "Planta", planta_sel, posiciones)
+
+        areas_disponibles = opciones_cubo(cubo, "Area", mes_sel, planta_sel)
+        area_sel = st.sidebar.selectbox("Área", ["Todos"] + areas_disponibles)
+        if area_sel != "Todos":
+            posiciones = filtrar_posiciones(indice, "Area", area_sel, posiciones)
+
+        maquinas_disponibles = opciones_cubo(cubo, "Maquina", mes_sel, planta_sel, area_sel)
+        maq_sel = st.sidebar.selectbox("Máquina", ["Todos"] + maquinas_disponibles)
+        if maq_sel != "Todos":
+            posiciones = filtrar_posiciones(indice, "Maquina", maq_sel, posiciones)
+
+        df_filtered = df_calc if posiciones is None else df_calc.iloc[posiciones]
+        filtros["filas"] = len(df_filtered)
+
+    # --- CÁLCULOS RESUMEN (DESDE EL CUBO) ---
+    with metricas.span("resumen"):
+        cubo_filtrado = rebanar_cubo(cubo, mes_sel, planta_sel, area_sel, maq_sel)
+        resumen, score_global = resumen_etapas(cubo_filtrado, etapas_dict)
+        ranking_general = ranking_areas(cubo_filtrado, all_eval_cols)
+        ranking_df = tabla_ranking(ranking_general)
+
+    # --- PESTAÑAS PRINCIPALES ---
+    st.title("🏭🎛️ 5S Operations Command Center")
+    tab_dashboard, tab_formulario = st.tabs(["📊 Dashboard de Control", "📝 Registrar / Continuar Auditoría 5S"])
+
+    # ==========================================
+    # PESTAÑA 1: DASHBOARD DE CONTROL
+    # ==========================================
+    with tab_dashboard:
+        c1, c2, c3 = st.columns(3)
+        c1.metric("Auditorías", int(cubo_filtrado["auditorias"].sum()))
+        c2.metric("Score Global", f"{score_global:.2f}")
+
+        lider_nombre = ranking_general.idxmax() if not ranking_general.empty else "N/A"
+        c3.metric("Líder de Planta", lider_nombre)
+
+        seleccion = (mes_sel, planta_sel, area_sel, maq_sel)
+        extremos = None
+        if len(ranking_df) > 2 * RADAR_EXTREMOS and st.toggle(
+            f"Radar: solo las {RADAR_EXTREMOS} mejores y las {RADAR_EXTREMOS} peores de {len(ranking_df)} áreas (el resto como banda)", value=True
+        ):
+            extremos = RADAR_EXTREMOS
+        fig_radar, spec_barras = figuras_memorizadas(cubo_filtrado, ranking_df, etapas_nombres, version_datos, origen_datos, seleccion, extremos)
+
+        with metricas.span("graficas"):
+            # RADAR
+            st.subheader("📊 Comparativo de Madurez por Área")
+            st.plotly_chart(fig_radar, use_container_width=True)
+
+            # BARRAS ALTAIR
+            st.subheader("📈 Calificación Total 5S por Área")
+            st.vega_lite_chart(spec_barras, use_container_width=True)
+
+        # TENDENCIA (PERIODOS CON SU AÑO)
+        st.subheader("📉 Tendencia por Etapa")
+        col_frec, col_vent = st.columns(2)
+        frecuencia = col_frec.radio("Periodo", list(FRECUENCIAS), format_func=lambda f: FRECUENCIAS[f][0], index=1, horizontal=True)
+        ventana = col_vent.slider("Ventana móvil (periodos)", 1, 12, 1, help="Cada punto junta las auditorías de los últimos N periodos.")
+        spec_tendencia = tendencia_memorizada(
+            estado_datos()["tendencias"].revision, origen_datos,
+            None if planta_sel == "Todas" else planta_sel, None if area_sel == "Todos" else area_sel,
+            frecuencia, ventana,
+        )
+        if spec_tendencia:
+            st.caption("Respeta Planta y Área del sidebar; el eje es el tiempo, así que el filtro de Mes no aplica.")
+            st.vega_lite_chart(spec_tendencia, use_container_width=True)
+        else:
+            st.info("No hay auditorías con fecha para esta selección.")
 
         st.markdown("---")
-        report_html = generate_html_report(resumen, df_filtered, ranking_df, mes_sel)
-        st.download_button(label="📥 Descargar Reporte HTML Completo", data=report_html, file_name=f"reporte_5s_{mes_sel.lower()}.html", mime="text/html", use_container_width=True)
+        plotly_embebido = st.checkbox("Reporte para uso sin internet (incluye plotly.js, ~4 MB)", value=False)
+        st.download_button(label="📥 Descargar Reporte HTML Completo",
+                           data=lambda: reporte_memorizado(df_filtered, ranking_df, cubo_filtrado, etapas_dict, version_datos, origen_datos, seleccion, plotly_embebido), file_name=f"reporte_5s_{mes_sel.lower().replace(' ', '_')}.html", mime="text/html", use_container_width=True)
+
+        with st.expander("📦 Exportación masiva de reportes (Planta × Mes)"):
+            st.caption("Genera un reporte HTML por cada combinación de Planta y Mes y los entrega en un solo ZIP.")
+            if st.button("Generar ZIP de reportes", use_container_width=True):
+                barra = st.progress(0.0, text="Preparando reportes...")
+                datos_export = {**datos, "cubo": cubo, "df": completar_detalle(datos["df"], version_datos, COLUMNAS_COMENTARIOS)}
+                # El ZIP se escribe a disco y el botón lo lee del archivo: no se arma también en memoria
+                with tempfile.NamedTemporaryFile(suffix=".zip") as archivo_zip:
+                    total_reportes = exportar_zip(
+                        datos_export, archivo_zip, plotly_embebido=plotly_embebido,
+                        progreso=lambda hechos, total, nombre: barra.progress(hechos / total, text=f"{hechos}/{total} · {nombre}")
+                    )
+                    archivo_zip.flush()
+                    barra.progress(1.0, text=f"✅ {total_reportes} reportes listos")
+                    # download_button acepta un archivo abierto en 'rb' (no el envoltorio del temporal)
+                    with open(archivo_zip.name, "rb") as zip_en_disco:
+                        st.download_button(label="📥 Descargar ZIP de reportes", data=zip_en_disco, file_name="reportes_5s.zip", mime="application/zip", use_container_width=True)
 
         with st.expander("🔍 Ver tabla de datos completa"):
-            st.dataframe(df_filtered, use_container_width=True)
+            # Búsqueda, orden y columnas se resuelven aquí; al navegador solo viaja la página visible
+            col_cols, col_busq = st.columns([3, 1])
+            columnas_tabla = col_cols.multiselect(
+                "Columnas", list(df_filtered.columns), default=[c for c in COLUMNAS_TABLA if c in df_filtered.columns],
+                format_func=nombre_corto
+            )
+            busqueda = col_busq.text_input("Buscar", placeholder="Área, máquina, auditor...")
+            col_ord, col_dir, col_tam, col_pag = st.columns(4)
+            orden_tabla = col_ord.selectbox("Ordenar por", [None] + columnas_tabla, format_func=lambda c: "(sin orden)" if c is None else nombre_corto(c))
+            descendente = col_dir.toggle("Descendente", value=False)
+            tam_pagina = col_tam.selectbox("Renglones por página", [25, 50, 100, 250], index=1)
+            incluir_detalle = st.checkbox("Incluir comentarios y evidencias", value=False)
+
+            if not columnas_tabla:
+                st.info("Elige al menos una columna.")
+            else:
+                with metricas.span("tabla", filas=len(df_filtered)) as info:
+                    pos_tabla = posiciones_tabla(df_filtered, columnas_tabla, busqueda, orden_tabla, descendente)
+                    paginas = paginas_tabla(pos_tabla, tam_pagina)
+                    # La etiqueta lleva el total: si cambia (otra búsqueda) el número de página vuelve a 1
+                    pagina = col_pag.number_input(f"Página (de {paginas:,})", min_value=1, value=1, step=1)
+                    columnas_pagina = list(columnas_tabla)
+                    if incluir_detalle:
+                        # El detalle se pide solo para los ids de la página
+                        columnas_pagina += [c for c in ["id", *COLUMNAS_COMENTARIOS, *COLUMNAS_EVIDENCIAS] if c in df_filtered.columns and c not in columnas_pagina]
+                    df_tabla = pagina_tabla(df_filtered, pos_tabla, columnas_pagina, pagina, tam_pagina)
+                    if incluir_detalle:
+                        df_tabla = completar_detalle(df_tabla, version_datos, COLUMNAS_COMENTARIOS + COLUMNAS_EVIDENCIAS)
+                        if "id" not in columnas_tabla:
+                            df_tabla = df_tabla.drop(columns="id", errors="ignore")
+                    info["visibles"] = len(df_tabla)
+                cols_evidencia = [c for c in df_tabla.columns if c.startswith("Evidencia_")]
+                st.caption(f"{len(pos_tabla):,} renglones · página {min(pagina, paginas):,} de {paginas:,}")
+                st.dataframe(
+                    df_tabla.assign(**{c: df_tabla[c].map(url_miniatura) for c in cols_evidencia}).rename(columns=nombre_corto),
+                    use_container_width=True,
+                    column_config={c: st.column_config.ImageColumn(c) for c in cols_evidencia},
+                )
 
         st.markdown("### 🏆 Ranking de Desempeño")
         if not df_filtered.empty:
-            ranking_resumen = df_filtered.groupby('Area')[all_eval_cols].mean(numeric_only=True).mean(axis=1).sort_values(ascending=False)
+            ranking_resumen = ranking_general
             col_t1, col_t2 = st.columns(2)
             with col_t1:
                 st.success("Top 5 Mejores Áreas")
@@ -510,13 +955,23 @@ try:
 
         if tipo_accion == "Continuar un Borrador guardado":
             try:
-                res_drafts = supabase.table("auditorias_5s").select("*").eq("estatus", "en_proceso").execute()
-                lista_borradores = res_drafts.data if res_drafts.data else []
+                lista_borradores = indice_borradores()
                 if lista_borradores:
-                    opciones_drafts = {f"{d.get('Nombre del Auditor')} - {d.get('Area')}": d for d in lista_borradores}
-                    seleccion = st.selectbox("Selecciona borrador:", list(opciones_drafts.keys()))
-                    datos_borrador = opciones_drafts[seleccion]
-                    st.session_state.id_borrador_seleccionado = datos_borrador['id']
+                    # Solo el índice alimenta el selector; el renglón completo se trae del borrador elegido
+                    opciones_drafts = {d["id"]: d for d in lista_borradores}
+                    # Al guardar cambia la etiqueta (fecha, área...) y con ella el widget: se conserva el elegido
+                    ids_drafts = list(opciones_drafts.keys())
+                    previo = st.session_state.get("id_borrador_seleccionado")
+                    seleccion = st.selectbox("Selecciona borrador:", ids_drafts,
+                                             index=ids_drafts.index(previo) if previo in ids_drafts else 0,
+                                             format_func=lambda i: etiqueta_borrador(opciones_drafts[i]))
+                    datos_borrador = cargar_borrador(seleccion, opciones_drafts[seleccion].get("actualizado_en")) or {}
+                    if datos_borrador:
+                        st.session_state.id_borrador_seleccionado = seleccion
+                    else:
+                        st.session_state.id_borrador_seleccionado = None
+                        indice_borradores.clear()
+                        st.warning("El borrador seleccionado ya no existe; recarga la lista.")
                 else:
                     st.info("No hay borradores disponibles.")
             except Exception as e:
@@ -584,12 +1039,12 @@ try:
                 img_antes_1s = st.file_uploader("Evidencia Antes 1S", type=["jpg", "png"], key=f"f_a1s_{id_sufijo}")
                 if datos_borrador and datos_borrador.get("Evidencia_Antes_1S"):
                     st.caption("📷 Imagen guardada (antes):")
-                    st.image(datos_borrador["Evidencia_Antes_1S"], width=150)
+                    st.image(url_miniatura(datos_borrador["Evidencia_Antes_1S"]), width=150)
             with col_d:
                 img_desp_1s = st.file_uploader("Evidencia Después 1S", type=["jpg", "png"], key=f"f_d1s_{id_sufijo}")
                 if datos_borrador and datos_borrador.get("Evidencia_Despues_1S"):
                     st.caption("📷 Imagen guardada (después):")
-                    st.image(datos_borrador["Evidencia_Despues_1S"], width=150)
+                    st.image(url_miniatura(datos_borrador["Evidencia_Despues_1S"]), width=150)
 
         # --- 2S: SEITON (Ordenar) ---
         with st.expander("📦 2S_Ordenar_SEITON", expanded=False):
@@ -608,12 +1063,12 @@ try:
                 img_antes_2s = st.file_uploader("Evidencia Antes 2S", type=["jpg", "png"], key=f"f_a2s_{id_sufijo}")
                 if datos_borrador and datos_borrador.get("Evidencia_Antes_2S"):
                     st.caption("📷 Imagen guardada (antes):")
-                    st.image(datos_borrador["Evidencia_Antes_2S"], width=150)
+                    st.image(url_miniatura(datos_borrador["Evidencia_Antes_2S"]), width=150)
             with col_d:
                 img_desp_2s = st.file_uploader("Evidencia Después 2S", type=["jpg", "png"], key=f"f_d2s_{id_sufijo}")
                 if datos_borrador and datos_borrador.get("Evidencia_Despues_2S"):
                     st.caption("📷 Imagen guardada (después):")
-                    st.image(datos_borrador["Evidencia_Despues_2S"], width=150)
+                    st.image(url_miniatura(datos_borrador["Evidencia_Despues_2S"]), width=150)
 
         # --- 3S: SEISO (Limpieza) ---
         with st.expander("✨ 3S_Limpieza_SEISO", expanded=False):
@@ -632,12 +1087,12 @@ try:
                 img_antes_3s = st.file_uploader("Evidencia Antes 3S", type=["jpg", "png"], key=f"f_a3s_{id_sufijo}")
                 if datos_borrador and datos_borrador.get("Evidencia_Antes_3S"):
                     st.caption("📷 Imagen guardada (antes):")
-                    st.image(datos_borrador["Evidencia_Antes_3S"], width=150)
+                    st.image(url_miniatura(datos_borrador["Evidencia_Antes_3S"]), width=150)
             with col_d:
                 img_desp_3s = st.file_uploader("Evidencia Después 3S", type=["jpg", "png"], key=f"f_d3s_{id_sufijo}")
                 if datos_borrador and datos_borrador.get("Evidencia_Despues_3S"):
                     st.caption("📷 Imagen guardada (después):")
-                    st.image(datos_borrador["Evidencia_Despues_3S"], width=150)
+                    st.image(url_miniatura(datos_borrador["Evidencia_Despues_3S"]), width=150)
 
         # --- 4S: SEIKETSU (Estandarizar) ---
         with st.expander("📋 4S_Estandarizar_SEIKETSU", expanded=False):
@@ -656,12 +1111,12 @@ try:
                 img_antes_4s = st.file_uploader("Evidencia Antes 4S", type=["jpg", "png"], key=f"f_a4s_{id_sufijo}")
                 if datos_borrador and datos_borrador.get("Evidencia_Antes_4S"):
                     st.caption("📷 Imagen guardada (antes):")
-                    st.image(datos_borrador["Evidencia_Antes_4S"], width=150)
+                    st.image(url_miniatura(datos_borrador["Evidencia_Antes_4S"]), width=150)
             with col_d:
                 img_desp_4s = st.file_uploader("Evidencia Después 4S", type=["jpg", "png"], key=f"f_d4s_{id_sufijo}")
                 if datos_borrador and datos_borrador.get("Evidencia_Despues_4S"):
                     st.caption("📷 Imagen guardada (después):")
-                    st.image(datos_borrador["Evidencia_Despues_4S"], width=150)
+                    st.image(url_miniatura(datos_borrador["Evidencia_Despues_4S"]), width=150)
 
         # --- 5S: SHITSUKE (Mantener) ---
         with st.expander("🛡️ 5S_Mantener_SHITSUKE", expanded=False):
@@ -677,104 +1132,144 @@ try:
                 img_antes_5s = st.file_uploader("Evidencia Antes 5S", type=["jpg", "png"], key=f"f_a5s_{id_sufijo}")
                 if datos_borrador and datos_borrador.get("Evidencia_Antes_5S"):
                     st.caption("📷 Imagen guardada (antes):")
-                    st.image(datos_borrador["Evidencia_Antes_5S"], width=150)
+                    st.image(url_miniatura(datos_borrador["Evidencia_Antes_5S"]), width=150)
             with col_d:
                 img_desp_5s = st.file_uploader("Evidencia Después 5S", type=["jpg", "png"], key=f"f_d5s_{id_sufijo}")
                 if datos_borrador and datos_borrador.get("Evidencia_Despues_5S"):
                     st.caption("📷 Imagen guardada (después):")
-                    st.image(datos_borrador["Evidencia_Despues_5S"], width=150)
+                    st.image(url_miniatura(datos_borrador["Evidencia_Despues_5S"]), width=150)
 
         # --- GUARDADO DE FOTOS Y SQL ---
-        def process_image_upload(uploader_file, ref_key):
-            if uploader_file is not None:
-                ext = uploader_file.name.split('.')[-1]
-                time_stamp = int(pd.Timestamp.now().timestamp())
-                cleaned_auditor = str(auditor_form).strip().replace(" ", "_")
-                filename = f"evidencia_{ref_key.lower()}_{cleaned_auditor}_{time_stamp}.{ext}"
-                try:
-                    supabase.storage.from_("evidencias_5s").upload(
-                        path=filename,
-                        file=uploader_file.getvalue(),
-                        file_options={"content-type": uploader_file.type, "upsert": "true"}
-                    )
-                    return supabase.storage.from_("evidencias_5s").get_public_url(filename)
-                except Exception as e:
-                    st.error(f"Error al subir imagen: {e}")
-                    return get_val(ref_key, "")
-            return get_val(ref_key, "")
+        # Última versión conocida de cada borrador: lo leído del almacén más lo ya mandado en esta sesión
+        bases_borrador = st.session_state.setdefault("bases_borrador", {})
+        def base_borrador(id_borrador):
+            return {**datos_borrador, **bases_borrador.get(id_borrador, {})}
+
+        def armar_payload(urls, estatus_accion):
+            """Renglón completo del formulario con las URLs de evidencia dadas."""
+            return {
+                "Planta": planta_form,
+                "Fecha": str(fecha_form),
+                "Nombre del Auditor": auditor_form,
+                "Nombre del Líder de 5s": lider_form,
+                "Seleccione un Turno": turno_form,
+                "Area": area_form,
+                "Maquina": maquina_form,
+                "s1_1": s1_1_form,
+                "s1_2": s1_2_form,
+                "s1_3": s1_3_form,
+                "Comentarios_1S": comentarios_1s_form,
+                "Evidencia_Antes_1S": urls["Evidencia_Antes_1S"],
+                "Evidencia_Despues_1S": urls["Evidencia_Despues_1S"],
+                "s2_1": s2_1_form,
+                "s2_2": s2_2_form,
+                "s2_3": s2_3_form,
+                "Comentario_2S": comentario_2s_form,
+                "Evidencia_Antes_2S": urls["Evidencia_Antes_2S"],
+                "Evidencia_Despues_2S": urls["Evidencia_Despues_2S"],
+                "s3_1": s3_1_form,
+                "s3_2": s3_2_form,
+                "s3_3": s3_3_form,
+                "Comentarios_3S": comentarios_3s_form,
+                "Evidencia_Antes_3S": urls["Evidencia_Antes_3S"],
+                "Evidencia_Despues_3S": urls["Evidencia_Despues_3S"],
+                "s4_1": s4_1_form,
+                "s4_2": s4_2_form,
+                "s4_3": s4_3_form,
+                "Comentarios_4S": comentarios_4s_form,
+                "Evidencia_Antes_4S": urls["Evidencia_Antes_4S"],
+                "Evidencia_Despues_4S": urls["Evidencia_Despues_4S"],
+                "s5_1": s5_1_form,
+                "s5_2": s5_2_form,
+                "Comentarios_5S": comentarios_5s_form,
+                "Evidencia_Antes_5S": urls["Evidencia_Antes_5S"],
+                "Evidencia_Despues_5S": urls["Evidencia_Despues_5S"],
+                "estatus": estatus_accion
+            }
 
         def guardar_auditoria(estatus_accion):
-            with st.spinner("Subiendo evidencias y guardando en Supabase..."):
-                url_antes_1s = process_image_upload(img_antes_1s, "Evidencia_Antes_1S")
-                url_desp_1s = process_image_upload(img_desp_1s, "Evidencia_Despues_1S")
-                url_antes_2s = process_image_upload(img_antes_2s, "Evidencia_Antes_2S")
-                url_desp_2s = process_image_upload(img_desp_2s, "Evidencia_Despues_2S")
-                url_antes_3s = process_image_upload(img_antes_3s, "Evidencia_Antes_3S")
-                url_desp_3s = process_image_upload(img_desp_3s, "Evidencia_Despues_3S")
-                url_antes_4s = process_image_upload(img_antes_4s, "Evidencia_Antes_4S")
-                url_desp_4s = process_image_upload(img_desp_4s, "Evidencia_Despues_4S")
-                url_antes_5s = process_image_upload(img_antes_5s, "Evidencia_Antes_5S")
-                url_desp_5s = process_image_upload(img_desp_5s, "Evidencia_Despues_5S")
-
-                row_payload = {
-                    "Planta": planta_form,
-                    "Fecha": str(fecha_form),
-                    "Nombre del Auditor": auditor_form,
-                    "Nombre del Líder de 5s": lider_form,
-                    "Seleccione un Turno": turno_form,
-                    "Area": area_form,
-                    "Maquina": maquina_form,
-                    "s1_1": s1_1_form,
-                    "s1_2": s1_2_form,
-                    "s1_3": s1_3_form,
-                    "Comentarios_1S": comentarios_1s_form,
-                    "Evidencia_Antes_1S": url_antes_1s,
-                    "Evidencia_Despues_1S": url_desp_1s,
-                    "s2_1": s2_1_form,
-                    "s2_2": s2_2_form,
-                    "s2_3": s2_3_form,
-                    "Comentario_2S": comentario_2s_form,
-                    "Evidencia_Antes_2S": url_antes_2s,
-                    "Evidencia_Despues_2S": url_desp_2s,
-                    "s3_1": s3_1_form,
-                    "s3_2": s3_2_form,
-                    "s3_3": s3_3_form,
-                    "Comentarios_3S": comentarios_3s_form,
-                    "Evidencia_Antes_3S": url_antes_3s,
-                    "Evidencia_Despues_3S": url_desp_3s,
-                    "s4_1": s4_1_form,
-                    "s4_2": s4_2_form,
-                    "s4_3": s4_3_form,
-                    "Comentarios_4S": comentarios_4s_form,
-                    "Evidencia_Antes_4S": url_antes_4s,
-                    "Evidencia_Despues_4S": url_desp_4s,
-                    "s5_1": s5_1_form,
-                    "s5_2": s5_2_form,
-                    "Comentarios_5S": comentarios_5s_form,
-                    "Evidencia_Antes_5S": url_antes_5s,
-                    "Evidencia_Despues_5S": url_desp_5s,
-                    "estatus": estatus_accion
-                }
-
-                try:
-                    if st.session_state.id_borrador_seleccionado:
-                        supabase.table("auditorias_5s").update(row_payload).eq("id", st.session_state.id_borrador_seleccionado).execute()
-                        st.success(f"✅ Auditoría actualizada con éxito bajo estatus: '{estatus_accion}'")
-                    else:
-                        res_insert = supabase.table("auditorias_5s").insert(row_payload).execute()
-                        if estatus_accion == "en_proceso" and res_insert.data:
-                            st.session_state.id_borrador_seleccionado = res_insert.data[0]['id']
-                        st.success(f"✅ Auditoría registrada con éxito bajo estatus: '{estatus_accion}'")
+            archivos = {
+                "Evidencia_Antes_1S": img_antes_1s, "Evidencia_Despues_1S": img_desp_1s,
+                "Evidencia_Antes_2S": img_antes_2s, "Evidencia_Despues_2S": img_desp_2s,
+                "Evidencia_Antes_3S": img_antes_3s, "Evidencia_Despues_3S": img_desp_3s,
+                "Evidencia_Antes_4S": img_antes_4s, "Evidencia_Despues_4S": img_desp_4s,
+                "Evidencia_Antes_5S": img_antes_5s, "Evidencia_Despues_5S": img_desp_5s,
+            }
+            nuevos = {ref: (f.getvalue(), f.type) for ref, f in archivos.items() if f is not None}
+
+            # Las fotos nuevas viajan en la bandeja; hasta que suban se conserva la URL previa
+            urls = {ref: get_val(ref, "") for ref in archivos}
+            row_payload = armar_payload(urls, estatus_accion)
 
-                    if estatus_accion == "terminada":
-                        st.session_state.id_borrador_seleccionado = None
-                        st.cache_data.clear()
-                        st.rerun()
-                except Exception as db_err:
-                    st.error(f"Error al escribir en Supabase: {db_err}")
+            try:
+                id_borrador = st.session_state.id_borrador_seleccionado
+                if id_borrador:
+                    # Solo viajan los campos que cambiaron, junto con lo que el autoguardado tenía pendiente
+                    pendientes = autoguardado().descartar(id_borrador)
+                    cambios = {**pendientes, **campos_cambiados(row_payload, base_borrador(id_borrador))}
+                    try:
+                        if cambios or nuevos:
+                            encolar_envio(cambios, id_borrador, archivos=nuevos)
+                    except Exception:
+                        autoguardado().programar(id_borrador, pendientes)
+                        raise
+                    bases_borrador.setdefault(id_borrador, {}).update(cambios)
+                    st.success(f"✅ Auditoría guardada bajo estatus: '{estatus_accion}' ({len(cambios)} campo(s) modificado(s)); se envía en segundo plano")
+                else:
+                    # La misma clave en cada guardado de esta auditoría nueva: se actualiza en vez de duplicarse
+                    clave = st.session_state.setdefault("clave_auditoria_nueva", uuid.uuid4().hex)
+                    encolar_envio(row_payload, clave=clave, archivos=nuevos)
+                    st.success(f"✅ Auditoría guardada bajo estatus: '{estatus_accion}'; se envía en segundo plano")
+
+                if estatus_accion == "terminada":
+                    st.session_state.id_borrador_seleccionado = None
+                    st.session_state.pop("clave_auditoria_nueva", None)
+                    st.rerun()
+            except Exception as db_err:
+                st.error(f"Error al guardar la auditoría: {db_err}")
+
+        # --- AUTOGUARDADO DEL BORRADOR ---
+        id_borrador = st.session_state.id_borrador_seleccionado
+        if id_borrador and datos_borrador:
+            autoguardar = st.toggle(
+                "Autoguardar borrador", key="autoguardar_borrador",
+                help=f"Guarda los cambios {AUTOGUARDADO_SEG:g} s después de la última edición. Las fotos nuevas se suben al guardar el borrador."
+            )
+            if autoguardar:
+                # Las evidencias se quedan con su URL guardada: subir fotos sigue siendo manual
+                base = base_borrador(id_borrador)
+                urls_guardadas = {ref: base.get(ref) or "" for ref in COLUMNAS_EVIDENCIAS}
+                cambios = campos_cambiados(armar_payload(urls_guardadas, "en_proceso"), base)
+                if cambios:
+                    autoguardado().programar(id_borrador, cambios)
+                    bases_borrador.setdefault(id_borrador, {}).update(cambios)
+                error_autoguardado = autoguardado().errores.get(id_borrador)
+                ultimo = autoguardado().ultimo_guardado.get(id_borrador)
+                if error_autoguardado:
+                    st.warning(f"⚠️ No se pudo autoguardar, se reintentará: {error_autoguardado}")
+                elif autoguardado().pendiente(id_borrador):
+                    st.caption("💾 Cambios pendientes de autoguardar...")
+                elif ultimo:
+                    st.caption(f"💾 Autoguardado a las {pd.Timestamp.fromtimestamp(ultimo):%H:%M:%S}")
 
         # --- BOTONES DE ACCIÓN ---
         st.markdown("### Acciones de Envío")
+        envios_pendientes = bandeja().pendientes()
+        if envios_pendientes:
+            error_envio = bandeja().ultimo_error()
+            st.caption(f"📤 {envios_pendientes} envío(s) guardado(s) en este equipo, pendientes de subir"
+                       + (f" — último intento: {error_envio}" if error_envio else ""))
+        if getattr(almacen, "idempotente", None) is False:
+            st.caption("ℹ️ La tabla de Supabase aún no tiene la columna clave_envio: las altas se mandan sin"
+                       " protección contra duplicados hasta correr `python almacen_5s.py --sql-supabase`.")
+        envios_fallidos = bandeja().fallidos()
+        if envios_fallidos:
+            st.warning(f"⚠️ {envios_fallidos} envío(s) fallaron {bandeja().max_intentos} veces y ya no se reintentan solos"
+                       f" — último error: {bandeja().ultimo_error('fallido')}")
+            if st.button("🔁 Reintentar envíos fallidos"):
+                bandeja().reintentar_fallidos()
+                vaciador_bandeja().notificar()
+                st.rerun()
         col_btn_b, col_btn_f = st.columns(2)
         with col_btn_b:
             if st.button("💾 Guardar como Borrador (En Proceso)", use_container_width=True):
@@ -791,3 +1286,22 @@ try:
 
 except Exception as e:
     st.error(f"Error de sistema: {e}")
+
+# --- PANEL DE DEPURACIÓN (TIEMPOS POR ETAPA) ---
+# Se cierra la traza antes de pintar el panel, así que su propio costo no entra en el rerun.
+# Un rerun cortado por st.rerun() no llega aquí y su traza se descarta.
+spans_rerun = metricas.cerrar_traza(origen=origen_datos)
+metricas.volcar()
+if st.sidebar.toggle("⏱️ Panel de tiempos (depuración)", value=False):
+    with st.sidebar.expander("⏱️ Tiempos por etapa", expanded=True):
+        st.caption(f"Este rerun: {spans_rerun[-1]['ms']:,.0f} ms · p50/p95 sobre los últimos {metricas.ventana} de cada span en el proceso")
+        if falla_cubo_almacen():
+            st.caption(f"Cubo en pandas: almacen.cubo() falló en este proceso ({falla_cubo_almacen()['error']})")
+        st.dataframe(pd.DataFrame(spans_rerun).drop(columns=["ts", "hilo"]), hide_index=True, use_container_width=True)
+        st.dataframe(pd.DataFrame(metricas.resumen()), hide_index=True, use_container_width=True)
+        if metricas.descargas():
+            st.dataframe(pd.DataFrame(metricas.descargas()), hide_index=True, use_container_width=True)
+        st.download_button("Eventos (JSON lines)", data=metricas.exportar_jsonl, file_name="metricas_5s.jsonl",
+                           mime="application/x-ndjson", use_container_width=True)
+        st.download_button("Prometheus (texto)", data=metricas.texto_prometheus, file_name="metricas_5s.prom",
+                           mime="text/plain", use_container_width=True)
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+Bandeja de salida local de auditorías (sin Streamlit).
+
+El formulario no escribe directo al almacén: guarda el renglón y sus fotos pendientes en un
+SQLite del equipo y regresa de inmediato. vaciar() los manda después, en orden de llegada,
+cuando hay conexión; lo que no se pudo mandar se queda en la bandeja para el siguiente intento,
+así que una caída de red en piso no le cuesta la auditoría al auditor.
+
+Un envío que falla no detiene a los demás: se anota el intento y el error y vaciar() sigue con
+el siguiente. Después de max_intentos fallas el envío pasa a 'fallido' (cola de descarte) y ya
+no se reintenta solo; reintentar_fallidos() lo regresa a la cola, y volver a guardar la misma
+auditoría también.
+
+Cada envío lleva una clave de idempotencia. Las altas viajan en lote con esa clave en la
+columna clave_envio (guardar_lote hace upsert sobre ella), de modo que reintentar un lote cuya
+respuesta se perdió no duplica auditorías. Los cambios a un registro ya existente se aplican
+por id y repetirlos deja el mismo resultado. En Supabase la columna la crea la migración de
+`python almacen_5s.py --sql-supabase`; sin ella las altas siguen llegando, pero sin esa garantía
+(ver AlmacenSupabase.idempotente).
+
+Guardar otra vez la misma auditoría mientras su envío sigue pendiente no agrega otro envío:
+los campos se combinan con lo pendiente y el envío sube de versión. Si vaciar() estaba
+mandando la versión anterior, el envío sigue pendiente y sale completo en la siguiente vuelta.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+# Los envíos ya entregados se guardan unos días para resolver clave -> id de altas recientes
+DIAS_HISTORIAL = 7
+# Fallas seguidas de un envío antes de pasarlo a 'fallido'
+MAX_INTENTOS = 5
+
+
+class BandejaSalida:
+    """Envíos pendientes (renglón + fotos) en un archivo SQLite local."""
+
+    def __init__(self, ruta, max_intentos=MAX_INTENTOS):
+        self.ruta = ruta
+        self.max_intentos = max_intentos
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+        with self._conectar() as con:
+            con.execute("""CREATE TABLE IF NOT EXISTS envios (
+                orden INTEGER PRIMARY KEY AUTOINCREMENT,
+                clave TEXT NOT NULL UNIQUE,
+                id_auditoria INTEGER,
+                fila TEXT NOT NULL,
+                version INTEGER NOT NULL DEFAULT 1,
+                estado TEXT NOT NULL DEFAULT 'pendiente',
+                intentos INTEGER NOT NULL DEFAULT 0,
+                ultimo_error TEXT,
+                creado_en REAL NOT NULL,
+                enviado_en REAL)""")
+            con.execute("""CREATE TABLE IF NOT EXISTS evidencias_pendientes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                clave TEXT NOT NULL, ref TEXT NOT NULL,
+                contenido BLOB, content_type TEXT, url TEXT)""")
+            con.execute("CREATE INDEX IF NOT EXISTS envios_estado ON envios (estado, orden)")
+
+    def _conectar(self):
+        return sqlite3.connect(self.ruta, timeout=10)
+
+    # --- ENCOLAR ---
+    def encolar(self, fila, id_auditoria=None, clave=None, archivos=None):
+        """Guarda fila (y {ref: (contenido, content_type)}) para enviarse; regresa la clave del envío.
+
+        Con clave se reconoce la misma auditoría entre guardados: si su envío sigue pendiente (o
+        fallido) se combina con él y vuelve a la cola con sus intentos en cero; si ya se entregó,
+        el nuevo envío se aplica sobre el id que obtuvo.
+        """
+        archivos = archivos or {}
+        with self._lock, self._conectar() as con:
+            previo = con.execute("SELECT estado, id_auditoria FROM envios WHERE clave = ?", (clave,)).fetchone() if clave else None
+            if previo and previo[0] == "enviado":
+                id_auditoria = id_auditoria or previo[1]
+            destino = clave if previo and previo[0] in ("pendiente", "fallido") else None
+            if destino is None and id_auditoria is not None:
+                pendiente = con.execute(
+                    "SELECT clave FROM envios WHERE estado IN ('pendiente', 'fallido') AND id_auditoria = ? "
+                    "ORDER BY orden DESC LIMIT 1", (id_auditoria,)).fetchone()
+                destino = pendiente[0] if pendiente else None
+
+            if destino is not None:
+                actual = json.loads(con.execute("SELECT fila FROM envios WHERE clave = ?", (destino,)).fetchone()[0])
+                con.execute("UPDATE envios SET fila = ?, version = version + 1, estado = 'pendiente', intentos = 0 "
+                            "WHERE clave = ?", (json.dumps({**actual, **fila}), destino))
+            else:
+                # Un alta ya entregada se sigue actualizando por id, con su propio envío
+                destino = clave if clave and not previo else uuid.uuid4().hex
+                con.execute("INSERT INTO envios (clave, id_auditoria, fila, creado_en) VALUES (?, ?, ?, ?)",
+                            (destino, id_auditoria, json.dumps(fila), time.time()))
+
+            for ref, (contenido, content_type) in archivos.items():
+                con.execute("DELETE FROM evidencias_pendientes WHERE clave = ? AND ref = ?", (destino, ref))
+                con.execute("INSERT INTO evidencias_pendientes (clave, ref, contenido, content_type) VALUES (?, ?, ?, ?)",
+                            (destino, ref, sqlite3.Binary(contenido), content_type))
+        return clave or destino
+
+    # --- CONSULTAS ---
+    def pendientes(self):
+        with self._conectar() as con:
+            return con.execute("SELECT COUNT(*) FROM envios WHERE estado = 'pendiente'").fetchone()[0]
+
+    def fallidos(self):
+        with self._conectar() as con:
+            return con.execute("SELECT COUNT(*) FROM envios WHERE estado = 'fallido'").fetchone()[0]
+
+    def ultimo_error(self, estado="pendiente"):
+        with self._conectar() as con:
+            fila = con.execute(
+                "SELECT ultimo_error FROM envios WHERE estado = ? AND ultimo_error IS NOT NULL ORDER BY orden LIMIT 1",
+                (estado,)).fetchone()
+        return fila[0] if fila else None
+
+    def reintentar_fallidos(self):
+        """Regresa los envíos fallidos a la cola con sus intentos en cero; regresa cuántos."""
+        with self._lock, self._conectar() as con:
+            return con.execute("UPDATE envios SET estado = 'pendiente', intentos = 0 WHERE estado = 'fallido'").rowcount
+
+    def id_de(self, clave):
+        """Id que el almacén le dio al alta con esa clave (None mientras no se entregue)."""
+        with self._conectar() as con:
+            fila = con.execute("SELECT id_auditoria FROM envios WHERE clave = ? AND estado = 'enviado'", (clave,)).fetchone()
+        return fila[0] if fila else None
+
+    # --- VACIAR ---
+    def _marcar_error(self, clave, error):
+        """Anota el intento fallido; al llegar a max_intentos el envío pasa a 'fallido'."""
+        with self._lock, self._conectar() as con:
+            con.execute(
+                "UPDATE envios SET intentos = intentos + 1, ultimo_error = ?, "
+                "estado = CASE WHEN intentos + 1 >= ? THEN 'fallido' ELSE estado END "
+                "WHERE clave = ? AND estado = 'pendiente'", (str(error), self.max_intentos, clave))
+
+    def _marcar_enviado(self, clave, version, id_auditoria):
+        """Marca el envío como entregado si nadie lo cambió mientras viajaba."""
+        with self._lock, self._conectar() as con:
+            cursor = con.execute(
+                "UPDATE envios SET estado = 'enviado', enviado_en = ?, id_auditoria = ?, ultimo_error = NULL "
+                "WHERE clave = ? AND version = ?", (time.time(), id_auditoria, clave, version))
+            if cursor.rowcount:
+                con.execute("DELETE FROM evidencias_pendientes WHERE clave = ?", (clave,))
+            else:
+                # Cambió durante el envío: queda pendiente (ya como actualización si era un alta)
+                con.execute("UPDATE envios SET id_auditoria = ? WHERE clave = ?", (id_auditoria, clave))
+
+    def _con_evidencias(self, clave, fila, subir):
+        """fila con las URLs de sus fotos; sube las que falten y recuerda las que ya subieron."""
+        with self._conectar() as con:
+            fotos = con.execute("SELECT id, ref, contenido, content_type, url FROM evidencias_pendientes WHERE clave = ?",
+                                (clave,)).fetchall()
+        faltan = {ref: (bytes(contenido), tipo) for _, ref, contenido, tipo, url in fotos if not url}
+        urls = {ref: url for _, ref, _, _, url in fotos if url}
+        if faltan:
+            if subir is None:
+                raise RuntimeError(f"{len(faltan)} evidencia(s) sin forma de subirse")
+            subidas, errores = subir(faltan)
+            with self._conectar() as con:
+                con.executemany("UPDATE evidencias_pendientes SET url = ?, contenido = NULL WHERE id = ?",
+                                [(subidas[ref], id_foto) for id_foto, ref, _, _, _ in fotos if ref in subidas])
+            if errores:
+                detalle = "; ".join(f"{ref}: {getattr(r, 'error', r)}" for ref, r in errores.items())
+                raise RuntimeError(f"No se pudieron subir {len(errores)} evidencia(s): {detalle}")
+            urls.update(subidas)
+        return {**fila, **urls}
+
+    def _guardar_altas(self, almacen, altas):
+        """[(envío, id o excepción)] de las altas; si el lote falla se reintentan una por una
+        para que solo la que falla se quede atrás (clave_envio evita duplicar lo que sí entró)."""
+        try:
+            ids = list(almacen.guardar_lote([{**fila, "clave_envio": clave} for clave, _, fila, _ in altas]))
+        except Exception as e:
+            if len(altas) == 1:
+                return [(altas[0], e)]
+            return [resultado for alta in altas for resultado in self._guardar_altas(almacen, [alta])]
+        return list(zip(altas, ids + [None] * (len(altas) - len(ids))))
+
+    def vaciar(self, almacen, subir=None, lote=50):
+        """Manda lo pendiente al almacén en orden de llegada; regresa cuántos envíos se entregaron.
+
+        subir({ref: (contenido, content_type)}) -> ({ref: url}, {ref: error}) sube las fotos.
+        Cada envío que falla se anota (intento y error) y se salta hasta la siguiente llamada;
+        los demás siguen su curso. Cada envío se intenta a lo más una vez por llamada.
+        """
+        entregados, ultimo = 0, 0
+        while True:
+            with self._conectar() as con:
+                envios = con.execute(
+                    "SELECT orden, clave, id_auditoria, fila, version FROM envios "
+                    "WHERE estado = 'pendiente' AND orden > ? ORDER BY orden LIMIT ?", (ultimo, lote)).fetchall()
+            if not envios:
+                break
+            ultimo = envios[-1][0]
+            listos = []
+            for _, clave, id_auditoria, fila, version in envios:
+                try:
+                    listos.append((clave, id_auditoria, self._con_evidencias(clave, json.loads(fila), subir), version))
+                except Exception as e:
+                    self._marcar_error(clave, e)
+
+            altas = [e for e in listos if e[1] is None]
+            resultados = self._guardar_altas(almacen, altas) if altas else []
+            for envio in (e for e in listos if e[1] is not None):
+                clave, id_auditoria, fila, _ = envio
+                try:
+                    almacen.guardar(fila, id_auditoria)
+                    resultados.append((envio, id_auditoria))
+                except Exception as e:
+                    resultados.append((envio, e))
+
+            for (clave, _, _, version), resultado in resultados:
+                if isinstance(resultado, Exception):
+                    self._marcar_error(clave, resultado)
+                elif resultado is None:
+                    self._marcar_error(clave, RuntimeError(f"El almacén no regresó id para el envío {clave}"))
+                else:
+                    self._marcar_enviado(clave, version, resultado)
+                    entregados += 1
+
+        with self._conectar() as con:
+            con.execute("DELETE FROM envios WHERE estado = 'enviado' AND enviado_en < ?", (time.time() - DIAS_HISTORIAL * 86400,))
+        return entregados
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+Generador de auditorías sintéticas y benchmark del núcleo de cálculo (sin Streamlit ni Supabase).
+
+    python benchmark_5s.py                                   # 10k, 100k, 1M y 10M auditorías
+    python benchmark_5s.py --tamanos 10000 100000 --guardar base.json
+    python benchmark_5s.py --tamanos 10000 100000 --comparar base.json --tolerancia 0.25
+
+Cada tamaño recorre el mismo camino que el dashboard, etapa por etapa:
+
+    carga      leer el snapshot Parquet
+    codificar  respuestas de texto -> puntajes (codificar_respuestas)
+    mes        columna de fecha -> Mes (derivar_mes)
+    indice     índice de filtros en cascada (construir_indice_filtros)
+    cubo       agregación Planta × Area × Maquina × Mes (construir_cubo)
+    filtrar    Mes -> Planta -> Área sobre el índice y rebanado del cubo
+    resumen    resumen por etapa y ranking de áreas (resumen_etapas, ranking_areas)
+    reporte    reporte HTML de una Planta × Mes (generate_html_report)
+
+Con --comparar, el proceso termina con código 1 si alguna etapa tardó más de (1 + tolerancia)
+veces lo que tardó en el archivo base para el mismo tamaño. 10M auditorías necesitan varios GB
+de RAM, sobre todo por el cubo; --categorico baja el consumo de las respuestas.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from nucleo_5s import (
+    MAPEO_NOMBRES, codificar_respuestas, construir_cubo, construir_indice_filtros, derivar_mes,
+    descubrir_etapas, filtrar_posiciones, generate_html_report, opciones_disponibles, ranking_areas,
+    rebanar_cubo, resumen_etapas, tabla_ranking,
+)
+
+TAMANOS = [10_000, 100_000, 1_000_000, 10_000_000]
+ETAPAS_BENCHMARK = ["carga", "codificar", "mes", "indice", "cubo", "filtrar", "resumen", "reporte"]
+RESPUESTAS = ["Si cumple", "Falta mejorar", "No cumple", "N/A", ""]
+COMENTARIOS = ["", "Limpiar área", "Etiquetar racks", "Falta delimitar pasillo"]
+
+
+# --- GENERADOR SINTÉTICO ---
+def generar_auditorias(n, plantas=3, areas=30, maquinas=8, meses=12, tasa_na=0.1, tasa_vacia=0.02,
+                       anio=2025, semilla=0, categorico=False):
+    """Frame de n auditorías con el formato que entrega load_data (preguntas con su nombre largo).
+
+    Cada área tiene su propia calidad, así que los rankings no salen empatados. tasa_na y
+    tasa_vacia son la proporción de respuestas "N/A" y vacías. Por defecto las respuestas son
+    texto, como en el snapshot real; con categorico=True son Categorical (mucho menos memoria en
+    los tamaños grandes, pero codificar sale más barato que en producción).
+    """
+    rng = np.random.default_rng(semilla)
+
+    def columna(codigos, valores, dimension=False):
+        # Las dimensiones siempre van como texto: agrupar por Categorical cambia el cubo (observed)
+        if categorico and not dimension:
+            return pd.Categorical.from_codes(codigos, categories=valores)
+        return np.asarray(valores, dtype=object)[codigos]
+
+    nombres_planta = [f"Planta {i + 1}" for i in range(plantas)]
+    nombres_area = [f"Área {i + 1:02d}" for i in range(areas)]
+    nombres_maquina = [f"M{i + 1}" for i in range(maquinas)]
+    area = rng.integers(0, areas, n)
+
+    inicio = pd.Timestamp(anio, 1, 1)
+    dias = (inicio + pd.DateOffset(months=meses) - inicio).days
+    fechas = (inicio + pd.to_timedelta(rng.integers(0, dias, n), unit="D")).strftime("%Y-%m-%d")
+
+    df = pd.DataFrame({
+        "Planta": columna(rng.integers(0, plantas, n), nombres_planta, dimension=True),
+        "Fecha": fechas,
+        "Nombre del Auditor": columna(rng.integers(0, 12, n), [f"Auditor {i + 1}" for i in range(12)], dimension=True),
+        "Seleccione un Turno": columna(rng.integers(0, 3, n), ["1er Turno", "2do Turno", "3er Turno"], dimension=True),
+        "Area": columna(area, nombres_area, dimension=True),
+        "Maquina": columna(rng.integers(0, maquinas, n), nombres_maquina, dimension=True),
+    })
+
+    # Por área: probabilidad de "Si cumple" entre las respuestas que sí cuentan
+    calidad = rng.uniform(0.3, 0.85, areas)[area]
+    resto = 1.0 - tasa_na - tasa_vacia
+    for largo in MAPEO_NOMBRES.values():
+        u = rng.random(n)
+        p_si = resto * calidad
+        p_falta = p_si + resto * (1 - calidad) * 0.6
+        codigos = np.select(
+            [u < p_si, u < p_falta, u < resto, u < resto + tasa_na],
+            [0, 1, 2, 3], default=4,
+        )
+        df[largo] = columna(codigos, RESPUESTAS)
+    for s in ["Comentarios_1S", "Comentario_2S", "Comentarios_3S", "Comentarios_4S", "Comentarios_5S"]:
+        df[s] = columna(rng.choice(len(COMENTARIOS), n, p=[0.7, 0.1, 0.1, 0.1]), COMENTARIOS)
+    return df
+
+
+# --- MEDICIÓN ---
+def medir(funcion, repeticiones=1):
+    """(resultado, mejor tiempo en segundos) de llamar funcion() 'repeticiones' veces."""
+    mejor, resultado = float("inf"), None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return resultado, mejor
+
+
+def correr_benchmark(n, repeticiones=1, **opciones_generador):
+    """Tiempos {etapa: segundos} del camino completo del tablero sobre n auditorías sintéticas."""
+    tiempos = {}
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta = os.path.join(directorio, "auditorias.parquet")
+        generar_auditorias(n, **opciones_generador).to_parquet(ruta)
+        df, tiempos["carga"] = medir(lambda: pd.read_parquet(ruta), repeticiones)
+
+    etapas = descubrir_etapas(df.columns)
+    columnas = [c for cols in etapas.values() for c in cols]
+    matriz, tiempos["codificar"] = medir(lambda: codificar_respuestas(df, columnas), repeticiones)
+    df[columnas] = matriz
+
+    (_, mes, meses), tiempos["mes"] = medir(lambda: derivar_mes(df), repeticiones)
+    df["Mes"] = mes
+    indice, tiempos["indice"] = medir(lambda: construir_indice_filtros(df), repeticiones)
+    cubo, tiempos["cubo"] = medir(lambda: construir_cubo(df, etapas), repeticiones)
+
+    # Un filtro como el del sidebar: el primer mes, la primera planta y la primera área disponibles
+    mes_sel = meses[0]
+    planta_sel = opciones_disponibles(indice, "Planta")[0]
+
+    def filtrar():
+        posiciones = filtrar_posiciones(indice, "Mes", mes_sel)
+        posiciones = filtrar_posiciones(indice, "Planta", planta_sel, posiciones)
+        area_sel = opciones_disponibles(indice, "Area", posiciones)[0]
+        posiciones = filtrar_posiciones(indice, "Area", area_sel, posiciones)
+        return posiciones, rebanar_cubo(cubo, mes_sel, planta_sel, area_sel)
+    _, tiempos["filtrar"] = medir(filtrar, max(repeticiones, 5))
+
+    cubo_planta_mes = rebanar_cubo(cubo, mes_sel, planta_sel)
+    def resumir():
+        resumen_etapas(cubo_planta_mes, etapas)
+        return tabla_ranking(ranking_areas(cubo_planta_mes, columnas))
+    ranking_df, tiempos["resumen"] = medir(resumir, max(repeticiones, 5))
+
+    posiciones = filtrar_posiciones(indice, "Planta", planta_sel, filtrar_posiciones(indice, "Mes", mes_sel))
+    df_audit = df.iloc[posiciones]
+    _, tiempos["reporte"] = medir(
+        # Mínimo dos: la primera llamada del proceso paga la carga de plantillas de plotly
+        lambda: generate_html_report(None, df_audit, ranking_df, mes_sel, cubo_planta_mes, etapas), max(repeticiones, 2)
+    )
+    return tiempos
+
+
+def comparar(resultados, base, tolerancia):
+    """Regresiones [(n, etapa, segundos, segundos base)] contra un archivo de --guardar."""
+    regresiones = []
+    for n, tiempos in resultados.items():
+        for etapa, segundos in tiempos.items():
+            previo = base.get(str(n), {}).get(etapa)
+            if previo and segundos > previo * (1 + tolerancia):
+                regresiones.append((n, etapa, segundos, previo))
+    return regresiones
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark del núcleo 5S sobre auditorías sintéticas.")
+    parser.add_argument("--tamanos", type=int, nargs="+", default=TAMANOS, help="Número de auditorías por corrida.")
+    parser.add_argument("--repeticiones", type=int, default=1, help="Se toma el mejor de N tiempos por etapa.")
+    parser.add_argument("--plantas", type=int, default=3)
+    parser.add_argument("--areas", type=int, default=30)
+    parser.add_argument("--maquinas", type=int, default=8)
+    parser.add_argument("--meses", type=int, default=12)
+    parser.add_argument("--tasa-na", type=float, default=0.1, help="Proporción de respuestas N/A.")
+    parser.add_argument("--categorico", action="store_true", help="Respuestas como Categorical (para 10M con poca RAM).")
+    parser.add_argument("--guardar", metavar="JSON", help="Guarda los tiempos para comparar después.")
+    parser.add_argument("--comparar", metavar="JSON", help="Compara contra tiempos guardados con --guardar.")
+    parser.add_argument("--tolerancia", type=float, default=0.25, help="Holgura antes de marcar una regresión.")
+    args = parser.parse_args(argv)
+
+    resultados = {}
+    for n in args.tamanos:
+        print(f"{n:,} auditorías...", file=sys.stderr)
+        resultados[n] = correr_benchmark(
+            n, args.repeticiones, plantas=args.plantas, areas=args.areas, maquinas=args.maquinas,
+            meses=args.meses, tasa_na=args.tasa_na, categorico=args.categorico,
+        )
+
+    tabla = pd.DataFrame(resultados).reindex(ETAPAS_BENCHMARK)
+    tabla.loc["total"] = tabla.sum()
+    tabla.columns = [f"{n:,}" for n in tabla.columns]
+    print(tabla.map(lambda s: f"{s * 1000:,.1f} ms" if s < 1 else f"{s:,.2f} s").to_string())
+    print("auditorías/s (total): " + "  ".join(f"{n:,}: {n / sum(t.values()):,.0f}" for n, t in resultados.items()))
+
+    if args.guardar:
+        with open(args.guardar, "w", encoding="utf-8") as f:
+            json.dump({str(n): t for n, t in resultados.items()}, f, indent=2)
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            regresiones = comparar(resultados, json.load(f), args.tolerancia)
+        for n, etapa, segundos, previo in regresiones:
+            print(f"REGRESIÓN {n:,} {etapa}: {segundos:.3f} s contra {previo:.3f} s (x{segundos / previo:.2f})")
+        if regresiones:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark de la subida de evidencias contra un Storage local de prueba (sin Streamlit ni red).
+
+    python benchmark_evidencias_5s.py                                  # 10 fotos, 1, 4 y 8 hilos
+    python benchmark_evidencias_5s.py --fotos 20 --latencia 400 --ancho-banda 2 --guardar base.json
+    python benchmark_evidencias_5s.py --comparar base.json --tolerancia 0.25
+
+El servidor de prueba contesta como el endpoint de objetos de Supabase Storage
+(POST/PUT /storage/v1/object/<bucket>/<ruta>), con una latencia fija por petición, un ancho de
+banda de subida acotado y, si se pide, una proporción de respuestas 503. El cliente es el mismo
+de la app (create_client(...).storage.from_(BUCKET_EVIDENCIAS)), así que se mide el camino real
+de guardar_evidencias: recomprimir, miniatura, hilos, reintentos y HTTP.
+
+Por cada número de hilos se mide:
+
+    subir      solo subir_evidencias con las fotos ya procesadas
+    guardar    guardar_evidencias completo (procesar + subir) con un índice vacío
+    repetir    guardar_evidencias otra vez con el índice lleno (no debe subir nada)
+
+Las fotos son sintéticas y se generan con la misma semilla, así que dos corridas suben los
+mismos bytes. Con --comparar el proceso termina con código 1 si alguna medida tardó más de
+(1 + tolerancia) veces lo guardado para el mismo número de hilos.
+"""
+
+import argparse
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+from PIL import Image
+
+from benchmark_5s import comparar, medir
+from evidencias_5s import (
+    BUCKET_EVIDENCIAS, IndiceEvidencias, guardar_evidencias, preparar_evidencia, subir_evidencias,
+)
+
+HILOS = [1, 4, 8]
+MEDIDAS = ["subir", "guardar", "repetir"]
+
+
+# --- STORAGE LOCAL DE PRUEBA ---
+class ServidorStorage:
+    """Servidor HTTP en 127.0.0.1 que acepta subidas como Supabase Storage y cuenta lo recibido."""
+
+    def __init__(self, latencia=0.2, ancho_banda=None, tasa_fallas=0.0, semilla=0):
+        self.latencia = latencia
+        self.ancho_banda = ancho_banda     # bytes/s por petición; None = sin límite
+        self.tasa_fallas = tasa_fallas
+        self.peticiones = 0
+        self.bytes_recibidos = 0
+        self._rng = np.random.default_rng(semilla)
+        self._lock = threading.Lock()
+        servidor = self
+
+        class Manejador(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                cuerpo = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                with servidor._lock:
+                    servidor.peticiones += 1
+                    servidor.bytes_recibidos += len(cuerpo)
+                    falla = servidor._rng.random() < servidor.tasa_fallas
+                espera = servidor.latencia
+                if servidor.ancho_banda:
+                    espera += len(cuerpo) / servidor.ancho_banda
+                time.sleep(espera)
+                if falla:
+                    self._responder(503, {"statusCode": "503", "error": "Service Unavailable", "message": "falla simulada"})
+                else:
+                    self._responder(200, {"Key": self.path.split("/object/", 1)[-1]})
+
+            do_PUT = do_POST
+
+            def _responder(self, codigo, cuerpo):
+                datos = json.dumps(cuerpo).encode()
+                self.send_response(codigo)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(datos)))
+                self.end_headers()
+                self.wfile.write(datos)
+
+        self._http = ThreadingHTTPServer(("127.0.0.1", 0), Manejador)
+        self.url = f"http://127.0.0.1:{self._http.server_port}"
+
+    def __enter__(self):
+        threading.Thread(target=self._http.serve_forever, name="storage_prueba", daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self._http.shutdown()
+        self._http.server_close()
+
+    def reiniciar_conteo(self):
+        with self._lock:
+            self.peticiones, self.bytes_recibidos = 0, 0
+
+
+# --- FOTOS SINTÉTICAS ---
+def generar_fotos(n, ancho=4000, alto=3000, semilla=0):
+    """{ref: (jpeg, content_type)} como las que manda el formulario: fotos de cámara de varios MB.
+
+    Degradado con ruido para que el JPEG pese como una foto real y no como un color plano.
+    """
+    rng = np.random.default_rng(semilla)
+    fotos = {}
+    for i in range(n):
+        base = np.linspace(0, 255, ancho, dtype=np.float32)[None, :, None] * rng.uniform(0.3, 1.0, 3)
+        ruido = rng.normal(0, 18, (alto // 4, ancho // 4, 3)).repeat(4, axis=0).repeat(4, axis=1)
+        pixeles = np.clip(base + ruido, 0, 255).astype(np.uint8)
+        salida = io.BytesIO()
+        Image.fromarray(pixeles).save(salida, format="JPEG", quality=92)
+        fotos[f"Evidencia_{i + 1}"] = (salida.getvalue(), "image/jpeg")
+    return fotos
+
+
+# --- MEDICIÓN ---
+def correr_benchmark(servidor, fotos, hilos, repeticiones=1, reintentos=3, espera_base=0.05):
+    """({medida: segundos}, {medida: (peticiones, bytes)}) con 'hilos' subidas en paralelo."""
+    from supabase import create_client
+
+    bucket = create_client(servidor.url, "benchmark").storage.from_(BUCKET_EVIDENCIAS)
+    opciones = {"max_hilos": hilos, "reintentos": reintentos, "espera_base": espera_base}
+    tiempos, trafico = {}, {}
+
+    def contar(medida):
+        trafico[medida] = (servidor.peticiones, servidor.bytes_recibidos)
+        servidor.reiniciar_conteo()
+
+    procesadas = {}
+    for ref, (contenido, tipo) in fotos.items():
+        for i, subida in enumerate(preparar_evidencia(ref, contenido, tipo)):
+            procesadas[ref if i == 0 else f"{ref} (miniatura)"] = subida
+    servidor.reiniciar_conteo()
+    _, tiempos["subir"] = medir(lambda: subir_evidencias(bucket, procesadas, **opciones), repeticiones)
+    contar("subir")
+
+    with tempfile.TemporaryDirectory() as directorio:
+        # Índice nuevo en cada repetición: si no, la segunda ya no subiría nada
+        def guardar():
+            indice = IndiceEvidencias(os.path.join(directorio, f"indice_{time.perf_counter_ns()}.sqlite"))
+            return indice, guardar_evidencias(bucket, fotos, indice=indice, **opciones)
+        (indice, (urls, errores)), tiempos["guardar"] = medir(guardar, repeticiones)
+        contar("guardar")
+        if errores:
+            print(f"  {len(errores)} evidencia(s) no subieron: {next(iter(errores.values())).error}", file=sys.stderr)
+        _, tiempos["repetir"] = medir(lambda: guardar_evidencias(bucket, fotos, indice=indice, **opciones), repeticiones)
+        contar("repetir")
+    return tiempos, trafico
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de subida de evidencias contra un Storage local.")
+    parser.add_argument("--fotos", type=int, default=10, help="Fotos por auditoría.")
+    parser.add_argument("--lado", type=int, nargs=2, default=[4000, 3000], metavar=("ANCHO", "ALTO"), help="Tamaño de cada foto original.")
+    parser.add_argument("--hilos", type=int, nargs="+", default=HILOS, help="Subidas en paralelo por corrida.")
+    parser.add_argument("--latencia", type=float, default=200, help="Latencia del servidor por petición, en ms.")
+    parser.add_argument("--ancho-banda", type=float, default=None, help="MB/s de subida por petición (sin límite si no se da).")
+    parser.add_argument("--tasa-fallas", type=float, default=0.0, help="Proporción de peticiones que responden 503.")
+    parser.add_argument("--repeticiones", type=int, default=1, help="Se toma el mejor de N tiempos por medida.")
+    parser.add_argument("--guardar", metavar="JSON", help="Guarda los tiempos para comparar después.")
+    parser.add_argument("--comparar", metavar="JSON", help="Compara contra tiempos guardados con --guardar.")
+    parser.add_argument("--tolerancia", type=float, default=0.25, help="Holgura antes de marcar una regresión.")
+    args = parser.parse_args(argv)
+
+    print(f"Generando {args.fotos} fotos de {args.lado[0]}x{args.lado[1]}...", file=sys.stderr)
+    fotos = generar_fotos(args.fotos, *args.lado)
+    megas = sum(len(c) for c, _ in fotos.values()) / 1e6
+    ancho_banda = args.ancho_banda * 1e6 if args.ancho_banda else None
+
+    resultados, trafico = {}, {}
+    with ServidorStorage(args.latencia / 1000, ancho_banda, args.tasa_fallas) as servidor:
+        for hilos in args.hilos:
+            print(f"{hilos} hilo(s)...", file=sys.stderr)
+            resultados[hilos], trafico[hilos] = correr_benchmark(servidor, fotos, hilos, args.repeticiones)
+
+    tabla = pd.DataFrame(resultados).reindex(MEDIDAS)
+    tabla.columns = [f"{h} hilo(s)" for h in tabla.columns]
+    print(f"{args.fotos} fotos originales ({megas:,.1f} MB), latencia {args.latencia:g} ms")
+    print(tabla.map(lambda s: f"{s * 1000:,.1f} ms" if s < 1 else f"{s:,.2f} s").to_string())
+    for medida in MEDIDAS:
+        detalle = "  ".join(f"{h}: {p} pet. / {b / 1e6:,.2f} MB" for h, t in trafico.items() for p, b in [t[medida]])
+        print(f"{medida:<8} {detalle}")
+
+    if args.guardar:
+        with open(args.guardar, "w", encoding="utf-8") as f:
+            json.dump({str(h): t for h, t in resultados.items()}, f, indent=2)
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            regresiones = comparar(resultados, json.load(f), args.tolerancia)
+        for hilos, medida, segundos, previo in regresiones:
+            print(f"REGRESIÓN {hilos} hilo(s) {medida}: {segundos:.3f} s contra {previo:.3f} s (x{segundos / previo:.2f})")
+        if regresiones:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Guardado de borradores por diferencias (sin Streamlit).
+
+campos_cambiados() compara el renglón que arma el formulario contra la última versión conocida
+del borrador y regresa solo los campos distintos, que es lo que se manda al almacén.
+
+GuardadoDiferido junta las ediciones rápidas de un mismo borrador en una sola escritura: cada
+programar() reinicia la espera, y cuando pasan 'espera' segundos sin cambios nuevos un hilo
+escribe todo lo acumulado. Si la escritura falla los cambios se quedan pendientes y se
+reintentan tras otra espera.
+"""
+
+import math
+import threading
+import time
+
+
+def _normalizar(valor):
+    """None, NaN y "" cuentan igual; lo demás se compara como texto (fechas, números)."""
+    if valor is None or (isinstance(valor, float) and math.isnan(valor)):
+        return ""
+    return str(valor)
+
+
+def campos_cambiados(fila, base):
+    """Campos de fila cuyo valor difiere del que tiene base."""
+    base = base or {}
+    return {campo: valor for campo, valor in fila.items() if _normalizar(valor) != _normalizar(base.get(campo))}
+
+
+class GuardadoDiferido:
+    """Agrupa los cambios de cada borrador y los escribe con escribir(clave, cambios) tras 'espera' s quietos."""
+
+    def __init__(self, escribir, espera=5.0):
+        self.escribir = escribir
+        self.espera = espera
+        self.escrituras = 0
+        self.ultimo_guardado = {}
+        self.errores = {}
+        self._pendientes = {}
+        self._timers = {}
+        self._lock = threading.Lock()
+
+    def programar(self, clave, cambios):
+        """Suma cambios a lo pendiente de 'clave' y reinicia la espera."""
+        if not cambios:
+            return
+        with self._lock:
+            self._pendientes.setdefault(clave, {}).update(cambios)
+            self._reiniciar(clave)
+
+    def _reiniciar(self, clave):
+        timer = self._timers.pop(clave, None)
+        if timer:
+            timer.cancel()
+        timer = threading.Timer(self.espera, self.vaciar, args=(clave,))
+        timer.daemon = True
+        self._timers[clave] = timer
+        timer.start()
+
+    def pendiente(self, clave):
+        with self._lock:
+            return dict(self._pendientes.get(clave, {}))
+
+    def descartar(self, clave):
+        """Cancela la escritura programada y regresa lo pendiente (para mandarlo en un guardado manual)."""
+        with self._lock:
+            timer = self._timers.pop(clave, None)
+            if timer:
+                timer.cancel()
+            return self._pendientes.pop(clave, {})
+
+    def vaciar(self, clave):
+        """Escribe ya lo pendiente de 'clave'; regresa True si no quedó nada pendiente."""
+        cambios = self.descartar(clave)
+        if not cambios:
+            return True
+        try:
+            self.escribir(clave, cambios)
+        except Exception as e:
+            with self._lock:
+                # Lo que llegó mientras se escribía es más nuevo y gana
+                self._pendientes[clave] = {**cambios, **self._pendientes.get(clave, {})}
+                self.errores[clave] = e
+                self._reiniciar(clave)
+            return False
+        with self._lock:
+            self.escrituras += 1
+            self.ultimo_guardado[clave] = time.time()
+            self.errores.pop(clave, None)
+        return True
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+Subida de evidencias fotográficas al bucket de Supabase Storage (sin Streamlit).
+
+Antes de subir, cada foto se endereza, se le quita el EXIF, se reduce a un lado máximo y se
+recomprime a JPEG; además se genera una miniatura que se guarda junto a la imagen completa.
+Los archivos se nombran por el hash de su contenido y un índice local hash -> URL evita volver
+a subir una foto que ya está en el bucket (re-guardar un borrador, la misma foto en dos auditorías).
+Las fotos de una auditoría se suben en paralelo con un pool de hilos acotado, con reintentos
+y espera exponencial. El avance se reporta desde el hilo que llama, así que el callback puede
+pintar widgets de Streamlit.
+"""
+
+import hashlib
+import io
+import os
+import random
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+
+from PIL import Image, ImageOps
+
+BUCKET_EVIDENCIAS = "evidencias_5s"
+
+# Las imágenes procesadas viven en fotos/ y su miniatura en fotos/miniaturas/ con el mismo nombre
+CARPETA_FOTOS = "fotos/"
+CARPETA_MINIATURAS = "fotos/miniaturas/"
+MAX_LADO_EVIDENCIA = 1600
+MAX_LADO_MINIATURA = 320
+CALIDAD_JPEG = 80
+
+
+@dataclass
+class SubidaEvidencia:
+    """Un archivo por subir al bucket."""
+    nombre: str
+    contenido: bytes
+    content_type: str
+
+
+@dataclass
+class ResultadoSubida:
+    url: str = ""
+    error: str = ""
+    intentos: int = 0
+
+
+def recomprimir_imagen(contenido, max_lado, calidad=CALIDAD_JPEG):
+    """Regresa la imagen como JPEG sin EXIF, con su lado mayor reducido a max_lado."""
+    with Image.open(io.BytesIO(contenido)) as img:
+        # La orientación del EXIF se aplica a los píxeles antes de descartarlo
+        img = ImageOps.exif_transpose(img)
+        if img.mode in ("RGBA", "LA", "P"):
+            fondo = Image.new("RGB", img.size, "white")
+            img = img.convert("RGBA")
+            fondo.paste(img, mask=img.getchannel("A"))
+            img = fondo
+        elif img.mode != "RGB":
+            img = img.convert("RGB")
+        img.thumbnail((max_lado, max_lado), Image.LANCZOS)
+        salida = io.BytesIO()
+        img.save(salida, format="JPEG", quality=calidad, optimize=True, progressive=True)
+        return salida.getvalue()
+
+
+def clave_contenido(contenido, max_lado=MAX_LADO_EVIDENCIA, max_lado_miniatura=MAX_LADO_MINIATURA):
+    """Hash SHA-256 del archivo original y de los parámetros con que se procesa."""
+    h = hashlib.sha256(contenido)
+    h.update(f"|{max_lado}|{max_lado_miniatura}|{CALIDAD_JPEG}".encode())
+    return h.hexdigest()
+
+
+def preparar_evidencia(clave, contenido, content_type, max_lado=MAX_LADO_EVIDENCIA, max_lado_miniatura=MAX_LADO_MINIATURA):
+    """Arma las subidas de una foto: [imagen completa, miniatura], nombradas por su clave.
+
+    Si la imagen no se puede abrir se sube tal cual (un solo archivo, sin miniatura).
+    """
+    try:
+        completa = recomprimir_imagen(contenido, max_lado)
+        miniatura = recomprimir_imagen(completa, max_lado_miniatura)
+    except Exception:
+        ext = (content_type or "").split("/")[-1] or "bin"
+        return [SubidaEvidencia(nombre=f"{clave}.{ext}", contenido=contenido, content_type=content_type)]
+    nombre = f"{clave}.jpg"
+    return [
+        SubidaEvidencia(nombre=CARPETA_FOTOS + nombre, contenido=completa, content_type="image/jpeg"),
+        SubidaEvidencia(nombre=CARPETA_MINIATURAS + nombre, contenido=miniatura, content_type="image/jpeg"),
+    ]
+
+
+def url_miniatura(url):
+    """URL de la miniatura de una evidencia; las fotos subidas antes del pipeline no tienen, se usa la original."""
+    if not isinstance(url, str) or "/" + CARPETA_MINIATURAS in url or "/" + CARPETA_FOTOS not in url:
+        return url
+    return url.replace("/" + CARPETA_FOTOS, "/" + CARPETA_MINIATURAS, 1)
+
+
+def _subir_con_reintentos(bucket, subida, reintentos, espera_base):
+    for intento in range(1, reintentos + 1):
+        try:
+            bucket.upload(
+                path=subida.nombre,
+                file=subida.contenido,
+                file_options={"content-type": subida.content_type, "upsert": "true"}
+            )
+            return ResultadoSubida(url=bucket.get_public_url(subida.nombre), intentos=intento)
+        except Exception as e:
+            if intento == reintentos:
+                return ResultadoSubida(error=str(e), intentos=intento)
+            # Espera exponencial con jitter para no golpear la red del piso todos a la vez
+            time.sleep(espera_base * (2 ** (intento - 1)) * (1 + random.random()))
+
+
+def subir_evidencias(bucket, subidas, max_hilos=4, reintentos=3, espera_base=0.5, progreso=None):
+    """Sube {llave: SubidaEvidencia} en paralelo y regresa {llave: ResultadoSubida}.
+
+    Un archivo que falla no cancela a los demás: el resultado trae la URL de los que sí subieron
+    y el error de los que no. progreso(hechos, total, llave, resultado) se llama al terminar cada uno.
+    """
+    resultados = {}
+    if not subidas:
+        return resultados
+    with ThreadPoolExecutor(max_workers=min(max_hilos, len(subidas)), thread_name_prefix="evidencias_5s") as pool:
+        futuros = {pool.submit(_subir_con_reintentos, bucket, subida, reintentos, espera_base): llave
+                   for llave, subida in subidas.items()}
+        for hechos, futuro in enumerate(as_completed(futuros), start=1):
+            llave = futuros[futuro]
+            resultados[llave] = futuro.result()
+            if progreso:
+                progreso(hechos, len(subidas), llave, resultados[llave])
+    return resultados
+
+
+class IndiceEvidencias:
+    """Índice local (SQLite) de clave de contenido -> URL pública de la imagen completa."""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+        with self._conectar() as con:
+            con.execute("CREATE TABLE IF NOT EXISTS evidencias (clave TEXT PRIMARY KEY, url TEXT NOT NULL)")
+
+    def _conectar(self):
+        return sqlite3.connect(self.ruta, timeout=10)
+
+    def buscar(self, clave):
+        with self._conectar() as con:
+            fila = con.execute("SELECT url FROM evidencias WHERE clave = ?", (clave,)).fetchone()
+        return fila[0] if fila else None
+
+    def registrar(self, clave, url):
+        with self._conectar() as con:
+            con.execute("INSERT OR REPLACE INTO evidencias (clave, url) VALUES (?, ?)", (clave, url))
+
+
+def guardar_evidencias(bucket, archivos, indice=None, max_lado=MAX_LADO_EVIDENCIA, max_lado_miniatura=MAX_LADO_MINIATURA,
+                       progreso=None, **opciones_subida):
+    """Procesa y sube {ref: (contenido, content_type)} sin repetir transferencias.
+
+    Una foto ya registrada en el índice no se vuelve a procesar ni a subir, y la misma foto en dos
+    casillas se sube una sola vez. Regresa ({ref: url}, {ref: ResultadoSubida con el error}).
+    """
+    urls, errores = {}, {}
+    refs_por_clave, subidas, clave_de_subida = {}, {}, {}
+    for ref, (contenido, content_type) in archivos.items():
+        clave = clave_contenido(contenido, max_lado, max_lado_miniatura)
+        url = indice.buscar(clave) if indice else None
+        if url:
+            urls[ref] = url
+            continue
+        if clave in refs_por_clave:
+            refs_por_clave[clave].append(ref)
+            continue
+        refs_por_clave[clave] = [ref]
+        for i, subida in enumerate(preparar_evidencia(clave, contenido, content_type, max_lado, max_lado_miniatura)):
+            llave = ref if i == 0 else f"{ref} (miniatura)"
+            subidas[llave] = subida
+            clave_de_subida[llave] = (clave, i)
+
+    resultados = subir_evidencias(bucket, subidas, progreso=progreso, **opciones_subida)
+
+    completas = {}
+    fallidas = set()
+    for llave, resultado in resultados.items():
+        clave, i = clave_de_subida[llave]
+        if not resultado.url:
+            fallidas.add(clave)
+        if i == 0:
+            completas[clave] = resultado
+    for clave, resultado in completas.items():
+        for ref in refs_por_clave[clave]:
+            if resultado.url:
+                urls[ref] = resultado.url
+            else:
+                errores[ref] = resultado
+        # Solo se registra cuando la imagen y su miniatura quedaron arriba
+        if indice and clave not in fallidas:
+            indice.registrar(clave, resultado.url)
+    return urls, errores
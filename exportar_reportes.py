@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Exportación masiva de reportes 5S: un reporte HTML por Planta × Mes dentro de un solo ZIP.
+
+Se usa desde el dashboard (expander "Exportación masiva") o sin interfaz:
+
+    python exportar_reportes.py --entrada .cache_5s/auditorias.parquet --salida reportes_5s.zip
+"""
+
+import argparse
+import multiprocessing
+import os
+import re
+import sys
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import pandas as pd
+
+from nucleo_5s import (
+    MAPEO_NOMBRES, preparar_datos, rebanar_cubo, ranking_areas, tabla_ranking,
+    filtrar_posiciones, generate_html_report,
+)
+
+COLUMNAS_TECNICAS = ["id", "creado_en", "actualizado_en", "estatus", "_origen"]
+
+# Datos preparados de cada proceso de trabajo (se reciben una sola vez en el initializer)
+_DATOS = None
+
+
+def _inicializar_trabajador(datos):
+    global _DATOS
+    _DATOS = datos
+
+
+def nombre_reporte(planta, mes):
+    limpio = re.sub(r"[^\w\-]+", "_", f"{planta}_{mes}".strip().lower())
+    return f"reporte_5s_{limpio}.html"
+
+
+def combinaciones_planta_mes(datos):
+    """Pares (Planta, Mes) con auditorías, en el orden de los filtros del dashboard."""
+    presentes = datos["cubo"][["Planta", "Mes"]].dropna().drop_duplicates()
+    orden_mes = {mes: i for i, mes in enumerate(datos["meses"])}
+    presentes = presentes.assign(_orden=presentes["Mes"].map(orden_mes)).sort_values(["Planta", "_orden"])
+    return list(zip(presentes["Planta"], presentes["Mes"]))
+
+
+def reporte_planta_mes(datos, planta, mes, plotly_embebido=False):
+    """Genera el HTML de una combinación con la misma lógica que el botón de descarga."""
+    posiciones = filtrar_posiciones(datos["indice"], "Mes", mes)
+    posiciones = filtrar_posiciones(datos["indice"], "Planta", planta, posiciones)
+    df_audit = datos["df"].iloc[posiciones]
+    cubo = rebanar_cubo(datos["cubo"], mes=mes, planta=planta)
+
+    all_eval_cols = [c for cols in datos["etapas"].values() for c in cols]
+    ranking_df = tabla_ranking(ranking_areas(cubo, all_eval_cols))
+    return generate_html_report(None, df_audit, ranking_df, mes, cubo, datos["etapas"], plotly_embebido)
+
+
+def _tarea(planta, mes, plotly_embebido):
+    html = reporte_planta_mes(_DATOS, planta, mes, plotly_embebido)
+    return nombre_reporte(planta, mes), html.encode("utf-8")
+
+
+def exportar_zip(datos, destino, trabajadores=None, plotly_embebido=False, progreso=None):
+    """Reparte las combinaciones Planta × Mes en un pool de procesos y las escribe a un ZIP.
+
+    destino puede ser una ruta o un archivo binario abierto (ej. io.BytesIO). Solo se mantienen
+    en vuelo 2 tareas por proceso, así que la memoria no crece con el número de reportes.
+    progreso(hechos, total, nombre) se llama al terminar cada reporte. Regresa el total escrito.
+    """
+    combinaciones = combinaciones_planta_mes(datos)
+    total = len(combinaciones)
+    trabajadores = trabajadores or min(os.cpu_count() or 1, 4)
+
+    with zipfile.ZipFile(destino, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        def escribir(nombre, contenido, hechos):
+            zf.writestr(nombre, contenido)
+            if progreso:
+                progreso(hechos, total, nombre)
+
+        # Con pocas combinaciones no vale la pena levantar procesos
+        if trabajadores <= 1 or total <= 1:
+            for hechos, (planta, mes) in enumerate(combinaciones, start=1):
+                html = reporte_planta_mes(datos, planta, mes, plotly_embebido)
+                escribir(nombre_reporte(planta, mes), html.encode("utf-8"), hechos)
+            return total
+
+        # 'spawn' porque el dashboard corre con hilos y un fork ahí no es seguro
+        contexto = multiprocessing.get_context("spawn")
+        pendientes = iter(combinaciones)
+        hechos = 0
+        with ProcessPoolExecutor(max_workers=trabajadores, mp_context=contexto,
+                                 initializer=_inicializar_trabajador, initargs=(datos,)) as pool:
+            en_vuelo = set()
+            for planta, mes in pendientes:
+                en_vuelo.add(pool.submit(_tarea, planta, mes, plotly_embebido))
+                if len(en_vuelo) >= 2 * trabajadores:
+                    listos, en_vuelo = wait(en_vuelo, return_when=FIRST_COMPLETED)
+                    for futuro in listos:
+                        hechos += 1
+                        escribir(*futuro.result(), hechos)
+            for futuro in [*en_vuelo]:
+                hechos += 1
+                escribir(*futuro.result(), hechos)
+    return total
+
+
+def cargar_archivo(ruta):
+    """Lee un snapshot Parquet o un CSV/Excel exportado y lo deja como lo entrega load_data."""
+    ext = os.path.splitext(ruta)[1].lower()
+    if ext == ".parquet":
+        df = pd.read_parquet(ruta)
+    elif ext in [".xlsx", ".xls"]:
+        df = pd.read_excel(ruta)
+    else:
+        df = pd.read_csv(ruta)
+    df.columns = [str(c).strip() for c in df.columns]
+    if "estatus" in df.columns:
+        df = df[df["estatus"].isna() | (df["estatus"] == "terminada")]
+    df = df.rename(columns=MAPEO_NOMBRES)
+    return df.drop(columns=[c for c in COLUMNAS_TECNICAS if c in df.columns])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera un reporte HTML 5S por Planta × Mes en un ZIP.")
+    parser.add_argument("--entrada", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache_5s", "auditorias.parquet"),
+                        help="Snapshot Parquet del dashboard o CSV/Excel con las auditorías.")
+    parser.add_argument("--salida", default="reportes_5s.zip", help="Ruta del ZIP a generar.")
+    parser.add_argument("--procesos", type=int, default=None, help="Procesos de trabajo (por defecto hasta 4).")
+    parser.add_argument("--sin-internet", action="store_true", help="Incluye plotly.js dentro de cada reporte.")
+    args = parser.parse_args(argv)
+
+    datos = preparar_datos(cargar_archivo(args.entrada))
+
+    def progreso(hechos, total, nombre):
+        print(f"[{hechos}/{total}] {nombre}", file=sys.stderr)
+
+    total = exportar_zip(datos, args.salida, trabajadores=args.procesos,
+                         plotly_embebido=args.sin_internet, progreso=progreso)
+    print(f"{total} reportes escritos en {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+"""
+Importación masiva del historial de auditorías (exportaciones de Google Forms) a auditorias_5s.
+
+    python importar_5s.py historial.csv --sqlite .cache_5s/auditorias.sqlite
+    python importar_5s.py historial_2019_2023.xlsx          # Supabase (SUPABASE_URL / SUPABASE_KEY)
+    python importar_5s.py historial.csv --en-seco           # solo valida y cuenta
+
+El archivo se lee por bloques (CSV con chunksize, Excel con openpyxl en modo read_only), así que
+la memoria no crece con el tamaño del archivo. En cada bloque:
+  1. Los encabezados largos del formulario pasan a las llaves cortas de la tabla (el inverso de
+     MAPEO_NOMBRES); si el texto de una pregunta cambió entre versiones del formulario, basta con
+     su código "[1S_1 ...". "Marca temporal" se usa como Fecha cuando no hay columna Fecha.
+  2. Las respuestas se validan contra el vocabulario del formulario sobre los valores únicos de
+     cada columna (factorize), no celda por celda. Los renglones con respuestas fuera del
+     vocabulario van al archivo de rechazos con el motivo.
+  3. Los renglones válidos se escriben en lotes con guardar_lote.
+
+Cada renglón lleva la clave_envio "importacion:<huella del archivo>:<renglón>", así que repetir un
+lote no duplica auditorías. Tras cada lote se guarda un checkpoint junto al archivo; al correr otra
+vez el mismo comando se retoma desde el último renglón confirmado.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from almacen_5s import (
+    COLUMNA_CLAVE_ENVIO, COLUMNAS_COMENTARIOS, COLUMNAS_DIMENSIONES, COLUMNAS_EVIDENCIAS,
+    AlmacenSQLite, AlmacenSupabase,
+)
+from nucleo_5s import MAPEO_NOMBRES
+
+TAM_BLOQUE = 50_000
+TAM_LOTE = 500
+REINTENTOS = 5
+
+# Opciones del formulario tal como las guarda la app; se aceptan sin importar mayúsculas, espacios o acento
+RESPUESTAS_FORMULARIO = ["Si cumple", "Falta mejorar", "No cumple", "N/A"]
+_CANONICA = {r.lower(): r for r in RESPUESTAS_FORMULARIO}
+_CANONICA["sí cumple"] = "Si cumple"
+
+COLUMNAS_TEXTO = [*COLUMNAS_DIMENSIONES, *COLUMNAS_COMENTARIOS, *COLUMNAS_EVIDENCIAS]
+CODIGO_PREGUNTA = re.compile(r"\[\s*(\d)S_(\d)\b")
+
+
+def _normalizar_encabezado(texto):
+    return re.sub(r"\s+", " ", str(texto)).strip().lower()
+
+
+# Inverso de MAPEO_NOMBRES: encabezado largo (normalizado) -> llave corta
+LLAVE_POR_ENCABEZADO = {_normalizar_encabezado(largo): corta for corta, largo in MAPEO_NOMBRES.items()}
+LLAVE_POR_ENCABEZADO.update({_normalizar_encabezado(c): c for c in COLUMNAS_TEXTO})
+
+
+def mapear_encabezados(columnas):
+    """Regresa ({encabezado del archivo: columna de la tabla}, [encabezados ignorados])."""
+    destino, ignoradas = {}, []
+    for col in columnas:
+        llave = LLAVE_POR_ENCABEZADO.get(_normalizar_encabezado(col))
+        if llave is None:
+            codigo = CODIGO_PREGUNTA.search(str(col))
+            candidata = f"s{codigo.group(1)}_{codigo.group(2)}" if codigo else None
+            llave = candidata if candidata in MAPEO_NOMBRES else None
+        if llave is None or llave in destino.values():
+            ignoradas.append(col)
+        else:
+            destino[col] = llave
+    if "Fecha" not in destino.values():
+        marca = next((c for c in ignoradas if _normalizar_encabezado(c) in ("marca temporal", "timestamp")), None)
+        if marca is not None:
+            destino[marca] = "Fecha"
+            ignoradas.remove(marca)
+    return destino, ignoradas
+
+
+def validar_respuestas(bloque, columnas):
+    """Lleva las respuestas al texto del formulario (vacías a None) sobre los valores únicos.
+
+    Regresa un arreglo booleano de renglones inválidos y, para esos renglones, el motivo.
+    """
+    invalidos = np.zeros(len(bloque), dtype=bool)
+    motivos = np.full(len(bloque), "", dtype=object)
+    for col in columnas:
+        codigos, unicos = pd.factorize(bloque[col])
+        texto = [str(u).strip() for u in unicos]
+        # El último elemento atiende el código -1 de los vacíos
+        canonicas = np.array([_CANONICA.get(t.lower()) if t else None for t in texto] + [None], dtype=object)
+        validas = np.array([(not t) or t.lower() in _CANONICA for t in texto] + [True])
+        malos = ~validas[codigos]
+        bloque[col] = canonicas[codigos]
+        if malos.any():
+            invalidos |= malos
+            motivos[malos] = motivos[malos] + f"{col} fuera de vocabulario; "
+    return invalidos, motivos
+
+
+def normalizar_fechas(serie, dia_primero=True):
+    """Fecha ISO (AAAA-MM-DD) o None si no se puede leer.
+
+    Lo que ya viene en ISO (celdas de fecha de Excel, exportaciones de la base) se lee con
+    format="ISO8601", sin adivinar; el resto, como la "Marca temporal" de Google Forms en
+    español (18/10/2025 14:05:33), con el día primero salvo dia_primero=False.
+    """
+    texto = serie.astype("string").str.strip()
+    fechas = pd.to_datetime(texto, errors="coerce", format="ISO8601")
+    resto = fechas.isna() & texto.notna() & (texto != "")
+    if resto.any():
+        fechas[resto] = pd.to_datetime(texto[resto], errors="coerce", format="mixed", dayfirst=dia_primero)
+    return fechas.dt.strftime("%Y-%m-%d").astype(object).where(fechas.notna(), None)
+
+
+# --- LECTURA POR BLOQUES ---
+def leer_bloques(ruta, tam_bloque=TAM_BLOQUE, saltar=0, hoja=None):
+    """Genera DataFrames (texto) de hasta tam_bloque renglones, empezando después de 'saltar'."""
+    ext = os.path.splitext(ruta)[1].lower()
+    if ext in (".xlsx", ".xlsm"):
+        try:
+            from openpyxl import load_workbook
+        except ImportError:
+            sys.exit("Para importar Excel instala openpyxl (pip install openpyxl) o exporta el archivo a CSV.")
+        libro = load_workbook(ruta, read_only=True, data_only=True)
+        try:
+            filas = (libro[hoja] if hoja else libro.active).iter_rows(values_only=True)
+            encabezados = ["" if c is None else str(c) for c in next(filas)]
+            bloque = []
+            for i, fila in enumerate(filas):
+                if i < saltar:
+                    continue
+                bloque.append(fila[:len(encabezados)])
+                if len(bloque) >= tam_bloque:
+                    yield pd.DataFrame(bloque, columns=encabezados, dtype=object)
+                    bloque = []
+            if bloque:
+                yield pd.DataFrame(bloque, columns=encabezados, dtype=object)
+        finally:
+            libro.close()
+    elif ext == ".xls":
+        sys.exit("El formato .xls no se puede leer por bloques; guárdalo como .xlsx o CSV.")
+    else:
+        yield from pd.read_csv(ruta, chunksize=tam_bloque, dtype=str, keep_default_na=False,
+                               encoding="utf-8-sig", skiprows=range(1, saltar + 1))
+
+
+# --- CHECKPOINT ---
+def huella_archivo(ruta):
+    """Identifica el archivo por su tamaño y su primer MB (no cambia si solo se copia o se toca)."""
+    h = hashlib.sha1(str(os.path.getsize(ruta)).encode())
+    with open(ruta, "rb") as f:
+        h.update(f.read(1 << 20))
+    return h.hexdigest()[:16]
+
+
+def leer_checkpoint(ruta, huella):
+    try:
+        with open(ruta, encoding="utf-8") as f:
+            punto = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return punto if punto.get("huella") == huella else None
+
+
+def guardar_checkpoint(ruta, punto):
+    temporal = ruta + ".tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump(punto, f)
+    os.replace(temporal, ruta)
+
+
+def _escribir_con_reintentos(almacen, filas, reintentos=REINTENTOS):
+    for intento in range(1, reintentos + 1):
+        try:
+            return almacen.guardar_lote(filas)
+        except Exception as e:
+            if intento == reintentos:
+                raise
+            espera = 2 ** intento
+            print(f"  lote falló ({e}); reintento {intento}/{reintentos - 1} en {espera} s", file=sys.stderr)
+            time.sleep(espera)
+
+
+# --- IMPORTACIÓN ---
+def importar(ruta, almacen=None, tam_bloque=TAM_BLOQUE, tam_lote=TAM_LOTE, estatus="terminada",
+             ruta_checkpoint=None, ruta_rechazos=None, hoja=None, dia_primero=True, progreso=None):
+    """Importa el archivo al almacén (None = solo validar). Regresa el resumen de la corrida.
+
+    progreso(resumen) se llama al terminar cada bloque.
+    """
+    huella = huella_archivo(ruta)
+    ruta_checkpoint = ruta_checkpoint or f"{ruta}.importacion.json"
+    ruta_rechazos = ruta_rechazos or f"{ruta}.rechazos.csv"
+    punto = (leer_checkpoint(ruta_checkpoint, huella) if almacen is not None else None) or {
+        "archivo": os.path.abspath(ruta), "huella": huella, "renglones": 0, "insertados": 0, "rechazados": 0,
+    }
+    inicio_renglones, inicio = punto["renglones"], time.perf_counter()
+    resumen = dict(punto, ignoradas=[], sin_fecha=0, renglones_por_segundo=0.0)
+    rechazos_con_encabezado = os.path.exists(ruta_rechazos) and punto["renglones"] > 0
+
+    def confirmar(hasta, rechazados):
+        nonlocal rechazos_con_encabezado
+        if not rechazados.empty:
+            rechazados.to_csv(ruta_rechazos, mode="a" if rechazos_con_encabezado else "w",
+                              header=not rechazos_con_encabezado, index=False)
+            rechazos_con_encabezado = True
+        resumen["rechazados"] += len(rechazados)
+        resumen["renglones"] = hasta
+        if almacen is not None:
+            guardar_checkpoint(ruta_checkpoint, {k: resumen[k] for k in punto})
+
+    for bloque in leer_bloques(ruta, tam_bloque, punto["renglones"], hoja):
+        if bloque.empty:
+            # Al retomar una importación ya terminada el lector regresa un bloque sin renglones
+            continue
+        primero = resumen["renglones"] + 1
+        renglones = np.arange(primero, primero + len(bloque))
+        destino, ignoradas = mapear_encabezados(bloque.columns)
+        if not resumen["ignoradas"]:
+            resumen["ignoradas"] = ignoradas
+        original = bloque
+        bloque = bloque[list(destino)].rename(columns=destino)
+
+        preguntas = [c for c in bloque.columns if c in MAPEO_NOMBRES]
+        invalidos, motivos = validar_respuestas(bloque, preguntas)
+        if "Fecha" in bloque.columns:
+            bloque["Fecha"] = normalizar_fechas(bloque["Fecha"], dia_primero)
+            resumen["sin_fecha"] += int(bloque["Fecha"].isna().sum())
+        for col in bloque.columns.difference(preguntas):
+            texto = bloque[col].astype(object)
+            bloque[col] = texto.where(texto.notna() & (texto.astype(str).str.strip() != ""), None)
+        bloque["estatus"] = estatus
+        bloque[COLUMNA_CLAVE_ENVIO] = [f"importacion:{huella}:{n}" for n in renglones]
+
+        rechazados = original[invalidos].assign(_renglon=renglones[invalidos], _motivo=[m.rstrip("; ") for m in motivos[invalidos]])
+        validos = bloque[~invalidos]
+        numeros = renglones[~invalidos]
+        filas = validos.astype(object).where(validos.notna(), None).to_dict("records")
+
+        for i in range(0, len(filas), tam_lote):
+            if almacen is not None:
+                _escribir_con_reintentos(almacen, filas[i:i + tam_lote])
+            resumen["insertados"] += len(filas[i:i + tam_lote])
+            hasta = int(numeros[min(i + tam_lote, len(filas)) - 1])
+            # Los rechazos hasta este renglón se escriben junto con el checkpoint que los cubre
+            confirmar(hasta, rechazados[rechazados["_renglon"] <= hasta])
+            rechazados = rechazados[rechazados["_renglon"] > hasta]
+        confirmar(int(renglones[-1]), rechazados)
+
+        transcurrido = time.perf_counter() - inicio
+        resumen["renglones_por_segundo"] = (resumen["renglones"] - inicio_renglones) / transcurrido if transcurrido else 0.0
+        if progreso:
+            progreso(resumen)
+    return resumen
+
+
+def _almacen_de(args):
+    if args.en_seco:
+        return None
+    if args.sqlite:
+        return AlmacenSQLite(args.sqlite)
+    url, key = os.environ.get("SUPABASE_URL"), os.environ.get("SUPABASE_KEY")
+    secretos = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".streamlit", "secrets.toml")
+    if not (url and key) and os.path.exists(secretos):
+        import tomllib
+        with open(secretos, "rb") as f:
+            datos = tomllib.load(f)
+        url, key = datos.get("SUPABASE_URL"), datos.get("SUPABASE_KEY")
+    if not (url and key):
+        sys.exit("Faltan SUPABASE_URL y SUPABASE_KEY (variables de entorno o .streamlit/secrets.toml), o usa --sqlite.")
+    from supabase import create_client
+    return AlmacenSupabase(create_client(url, key))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Importa el historial de auditorías 5S (CSV/Excel) a auditorias_5s.")
+    parser.add_argument("archivo", help="CSV o Excel (.xlsx) exportado del formulario.")
+    parser.add_argument("--sqlite", metavar="RUTA", help="Importa a un almacén SQLite local en lugar de Supabase.")
+    parser.add_argument("--en-seco", action="store_true", help="Solo valida y cuenta; no escribe nada.")
+    parser.add_argument("--hoja", help="Hoja del Excel (por defecto la activa).")
+    parser.add_argument("--bloque", type=int, default=TAM_BLOQUE, help="Renglones leídos por bloque.")
+    parser.add_argument("--lote", type=int, default=TAM_LOTE, help="Renglones por escritura al almacén.")
+    parser.add_argument("--estatus", default="terminada", help="Estatus con el que entran las auditorías.")
+    fechas = parser.add_mutually_exclusive_group()
+    fechas.add_argument("--dayfirst", "--dia-primero", dest="dia_primero", action="store_true", default=True,
+                        help="Fechas no ISO en formato día/mes/año (por defecto, como las exporta Forms en español).")
+    fechas.add_argument("--monthfirst", "--mes-primero", dest="dia_primero", action="store_false",
+                        help="Fechas no ISO en formato mes/día/año (formulario en inglés de EE. UU.).")
+    parser.add_argument("--checkpoint", help="Archivo de checkpoint (por defecto <archivo>.importacion.json).")
+    parser.add_argument("--rechazos", help="CSV de renglones rechazados (por defecto <archivo>.rechazos.csv).")
+    args = parser.parse_args(argv)
+
+    def progreso(r):
+        print(f"{r['renglones']:,} renglones · {r['insertados']:,} insertados · {r['rechazados']:,} rechazados · "
+              f"{r['renglones_por_segundo']:,.0f} renglones/s", file=sys.stderr)
+
+    resumen = importar(args.archivo, _almacen_de(args), args.bloque, args.lote, args.estatus,
+                       args.checkpoint, args.rechazos, args.hoja, args.dia_primero, progreso)
+    if resumen["ignoradas"]:
+        print(f"Columnas ignoradas: {', '.join(map(str, resumen['ignoradas']))}", file=sys.stderr)
+    print(f"{resumen['insertados']:,} auditorías {'válidas' if args.en_seco else 'importadas'}, "
+          f"{resumen['rechazados']:,} rechazadas, {resumen['sin_fecha']:,} sin fecha legible "
+          f"({resumen['renglones_por_segundo']:,.0f} renglones/s)")
+
+
+if __name__ == "__main__":
+    main()
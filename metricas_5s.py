@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+Tiempos por etapa del tablero (sin Streamlit).
+
+Cada etapa que interesa (descargas, codificar, cubo, filtros, radar, reporte...) se envuelve en
+un span con nombre:
+
+    with span("consulta_supabase", fuente="Supabase") as info:
+        delta = ...
+        info["filas"] = len(delta)
+
+La duración y los atributos quedan en un registro del proceso: una ventana de las últimas
+duraciones por span (para p50/p95), sumas y conteos acumulados, y contadores de filas y bytes
+por fuente de datos. Los spans que corren en el hilo de un rerun se juntan además en su traza
+(iniciar_traza / cerrar_traza), que es lo que muestra el panel de depuración.
+
+Exportación:
+    exportar_jsonl()        un evento JSON por renglón (o conectar_jsonl(ruta) para irlos anexando)
+    texto_prometheus()      formato de texto de Prometheus (summary con cuantiles + contadores),
+                            pensado para el textfile collector de node_exporter vía volcar()
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+CUANTILES = [0.5, 0.95]
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metricas:
+    """Registro de spans y descargas compartido por todos los hilos del proceso."""
+
+    def __init__(self, ventana=1000, max_eventos=5000):
+        self.ventana = ventana
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._duraciones = {}    # span -> deque de las últimas 'ventana' duraciones (s)
+        self._acumulados = {}    # span -> [conteo, suma en s]
+        self._descargas = {}     # fuente -> [descargas, filas, bytes]
+        self._bytes = {}         # fuente -> bytes recibidos (los cuenta el cliente HTTP)
+        self.eventos = deque(maxlen=max_eventos)
+        self.ruta_jsonl = None
+        self.ruta_prometheus = None
+        self.cada_prometheus = 15
+        self._ultimo_volcado = 0.0
+
+    # --- SPANS ---
+    @contextmanager
+    def span(self, nombre, **atributos):
+        """Mide el bloque; los atributos que se agreguen al dict dentro del bloque también se guardan."""
+        inicio = time.perf_counter()
+        try:
+            yield atributos
+        finally:
+            self.registrar(nombre, time.perf_counter() - inicio, **atributos)
+
+    def registrar(self, nombre, segundos, **atributos):
+        evento = {"ts": round(time.time(), 3), "span": nombre, "ms": round(segundos * 1000, 3),
+                  "hilo": threading.current_thread().name, **atributos}
+        with self._lock:
+            if nombre not in self._duraciones:
+                self._duraciones[nombre] = deque(maxlen=self.ventana)
+                self._acumulados[nombre] = [0, 0.0]
+            self._duraciones[nombre].append(segundos)
+            self._acumulados[nombre][0] += 1
+            self._acumulados[nombre][1] += segundos
+            self.eventos.append(evento)
+            if self.ruta_jsonl:
+                try:
+                    with open(self.ruta_jsonl, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(evento, ensure_ascii=False, default=str) + "\n")
+                except OSError:
+                    pass
+        traza = getattr(self._local, "traza", None)
+        if traza is not None:
+            traza["spans"].append(evento)
+        return evento
+
+    # --- TRAZA DEL RERUN (POR HILO) ---
+    def iniciar_traza(self):
+        """Empieza a juntar los spans de este hilo; descarta una traza anterior sin cerrar."""
+        self._local.traza = {"inicio": time.perf_counter(), "spans": []}
+
+    def cerrar_traza(self, nombre="rerun", **atributos):
+        """Registra el span del rerun completo y regresa la lista de spans de la traza."""
+        traza = getattr(self._local, "traza", None)
+        if traza is None:
+            return []
+        self._local.traza = None
+        spans = traza["spans"]
+        spans.append(self.registrar(nombre, time.perf_counter() - traza["inicio"], **atributos))
+        return spans
+
+    # --- DESCARGAS ---
+    def registrar_descarga(self, fuente, filas, bytes_=0):
+        with self._lock:
+            acumulado = self._descargas.setdefault(fuente, [0, 0, 0])
+            acumulado[0] += 1
+            acumulado[1] += int(filas)
+            acumulado[2] += int(bytes_ or 0)
+
+    def sumar_bytes(self, fuente, n):
+        """Para el hook del cliente HTTP: bytes de cada respuesta (la diferencia acota una descarga)."""
+        with self._lock:
+            self._bytes[fuente] = self._bytes.get(fuente, 0) + n
+
+    def bytes_recibidos(self, fuente):
+        with self._lock:
+            return self._bytes.get(fuente, 0)
+
+    # --- CONSULTA ---
+    def resumen(self):
+        """[{span, n, p50_ms, p95_ms, max_ms, total_s}] de la ventana de cada span, por nombre."""
+        with self._lock:
+            copia = {nombre: (np.array(d), *self._acumulados[nombre]) for nombre, d in self._duraciones.items()}
+        renglones = []
+        for nombre, (ventana, conteo, suma) in sorted(copia.items()):
+            p50, p95 = np.quantile(ventana, CUANTILES) * 1000
+            renglones.append({"span": nombre, "n": conteo, "p50_ms": round(p50, 1), "p95_ms": round(p95, 1),
+                              "max_ms": round(ventana.max() * 1000, 1), "total_s": round(suma, 2)})
+        return renglones
+
+    def descargas(self):
+        """[{fuente, descargas, filas, bytes}] acumulados desde que arrancó el proceso."""
+        with self._lock:
+            return [{"fuente": fuente, "descargas": d, "filas": f, "bytes": b}
+                    for fuente, (d, f, b) in sorted(self._descargas.items())]
+
+    # --- EXPORTACIÓN ---
+    def exportar_jsonl(self):
+        with self._lock:
+            eventos = list(self.eventos)
+        return "".join(json.dumps(e, ensure_ascii=False, default=str) + "\n" for e in eventos)
+
+    def texto_prometheus(self, prefijo="tablero5s"):
+        with self._lock:
+            copia = {nombre: (np.array(d), *self._acumulados[nombre]) for nombre, d in self._duraciones.items()}
+            descargas = {fuente: list(v) for fuente, v in self._descargas.items()}
+
+        lineas = [f"# HELP {prefijo}_span_segundos Duración de cada etapa instrumentada (cuantiles sobre las últimas {self.ventana}).",
+                  f"# TYPE {prefijo}_span_segundos summary"]
+        for nombre, (ventana, conteo, suma) in sorted(copia.items()):
+            etiqueta = f'span="{_escapar(nombre)}"'
+            for q, valor in zip(CUANTILES, np.quantile(ventana, CUANTILES)):
+                lineas.append(f'{prefijo}_span_segundos{{{etiqueta},quantile="{q}"}} {valor:.6f}')
+            lineas.append(f"{prefijo}_span_segundos_sum{{{etiqueta}}} {suma:.6f}")
+            lineas.append(f"{prefijo}_span_segundos_count{{{etiqueta}}} {conteo}")
+
+        for metrica, posicion, ayuda in [("descargas_total", 0, "Descargas por fuente."),
+                                         ("descarga_filas_total", 1, "Renglones recibidos por fuente."),
+                                         ("descarga_bytes_total", 2, "Bytes recibidos por fuente.")]:
+            lineas += [f"# HELP {prefijo}_{metrica} {ayuda}", f"# TYPE {prefijo}_{metrica} counter"]
+            for fuente, valores in sorted(descargas.items()):
+                lineas.append(f'{prefijo}_{metrica}{{fuente="{_escapar(fuente)}"}} {valores[posicion]}')
+        return "\n".join(lineas) + "\n"
+
+    def conectar_jsonl(self, ruta):
+        """Anexa cada evento a 'ruta' (un JSON por renglón) a partir de ahora."""
+        os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+        self.ruta_jsonl = ruta
+
+    def conectar_prometheus(self, ruta, cada=15):
+        """volcar() reescribe 'ruta' con texto_prometheus(), a lo más una vez cada 'cada' segundos."""
+        os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+        self.ruta_prometheus, self.cada_prometheus = ruta, cada
+
+    def volcar(self, forzar=False):
+        if not self.ruta_prometheus:
+            return False
+        ahora = time.monotonic()
+        if not forzar and ahora - self._ultimo_volcado < self.cada_prometheus:
+            return False
+        self._ultimo_volcado = ahora
+        # Escritura atómica: el collector nunca lee un archivo a medias
+        tmp = self.ruta_prometheus + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.texto_prometheus())
+        os.replace(tmp, self.ruta_prometheus)
+        return True
+
+
+# Registro único del proceso; span() es el atajo que usan los módulos
+METRICAS = Metricas()
+span = METRICAS.span
@@ -0,0 +1,578 @@
+# -*- coding: utf-8 -*-
+"""
+Núcleo de cálculo del 5S Command Center (sin Streamlit).
+
+Codificación de respuestas, etapas y mes, cubo de puntajes, índice de filtros, resumen del
+tablero y reporte HTML. Lo usan el dashboard (appMejoraC.py), la exportación masiva de reportes
+y el benchmark (benchmark_5s.py), así que todo se puede importar y medir sin levantar la interfaz.
+Los pasos de preparar_datos dejan su tiempo en metricas_5s.
+"""
+
+import html
+import string
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from metricas_5s import span
+
+# Este diccionario traduce lo que la DB guarda (s1_1) a lo que tu Dashboard espera (Nombre Largo)
+MAPEO_NOMBRES = {
+    "s1_1": "1S_Seleccionar_SEIR [1S_1 El área está libre de material dañado, tirado o defectuoso (scrap) y se encuentra en los contenedores para material de scrap o disposición.]",
+    "s1_2": "1S_Seleccionar_SEIR [1S_2 La máquina o estación está libre de material, herramientas por dentro y fuera.]",
+    "s1_3": "1S_Seleccionar_SEIR [1S_3 El área de trabajo está libre de alimentos y/o bebidas y artículos personales]",
+    "s2_1": "2S_Ordenar_SEITON [2S_1 Todas las máquinas están etiquetadas (nombre de la estación, número) y todas las líneas de servicio están identificadas de acuerdo al color y con la dirección del flujo. (hidráulico, neumático y eléctrico)]",
+    "s2_2": "2S_Ordenar_SEITON [2S_2 El personal (operador, coordinador, técnico, supervisor, ingenieros, calidad, etc.) que tiene su área de trabajo en la zona auditada tiene ordenada su estación de trabajo (incluye: máquina, gavetas, mesas, etc.)]",
+    "s2_3": "2S_Ordenar_SEITON [2S_3 Las fixturas de la máquina tienen un lugar asignado, cerca de la máquina y están ordenadas?]",
+    "s3_1": "3S_Limpieza_SEISO [3S_1 El personal limpia su área de trabajo al inicio y final de turno?]",
+    "s3_2": "3S_Limpieza_SEISO [3S_2 Los elementos del área (máquinas, instrumentos de medición, pruebas destructivas, mesas de trabajo, etc) se encuentran libres de suciedad, basura o polvo]",
+    "s3_3": "3S_Limpieza_SEISO [3S_3  Los materiales y equipos de limpieza están disponibles, están en buenas condiciones y son fácilmente accesibles.]",
+    "s4_1": "4S_Estandarizar_SEIKETSU [4S_1 Los tableros de desempeño por hora y documentación en el área (QPS, ayuda visual, check list, etc.) en el área tienen información actualizada y se encuentran en buenas condiciones (limpios y visibles)]",
+    "s4_2": "4S_Estandarizar_SEIKETSU [4S_2 El material, sus contenedores y racks estan identificados (cuenta con máximos y minimos)? ¿La etiqueta esta en buenas condiciones?]",
+    "s4_3": "4S_Estandarizar_SEIKETSU [4S_3 ¿El area se encuentra con las delimitaciones debidas? Carros, pallets, racks, gruas, gavetas.]",
+    "s5_1": "5S_Mantener_SHITSUKE [5S_1 El líder de área (supervisor / coordinador) conoce el resultado de la auditoría 5S y está realizando un seguimiento de las acciones correctivas y los resultados son visibles para todos]",
+    "s5_2": "5S_Mantener_SHITSUKE [5S_2 Es visible la limpieza, estandarización y orden del área (no hay material mal colocado o suciedad, los documentos estan actualizados, etc.)]"
+}
+
+# Puntaje de cada respuesta del formulario (N/A no cuenta para el promedio)
+MAPEO_RESPUESTAS = {"no cumple": 1, "falta mejorar": 3, "si cumple": 5, "n/a": np.nan}
+
+# --- CODIFICACIÓN VECTORIZADA DE RESPUESTAS ---
+def codificar_columna(serie):
+    """Convierte una columna de respuestas a puntajes float32.
+
+    Solo se normalizan (lower/strip) los valores únicos de la columna; luego se expanden con
+    los códigos de pd.factorize, así que el costo ya no es una llamada de Python por celda.
+    """
+    codigos, unicos = pd.factorize(serie)
+    # El NaN extra al final atiende el código -1 que factorize asigna a los vacíos
+    puntajes = np.array([MAPEO_RESPUESTAS.get(str(u).lower().strip(), np.nan) for u in unicos] + [np.nan], dtype=np.float32)
+    return puntajes[codigos]
+
+def codificar_respuestas(df, columnas):
+    """Matriz de puntajes (float32) de las preguntas."""
+    matriz = np.empty((len(df), len(columnas)), dtype=np.float32)
+    for i, col in enumerate(columnas):
+        matriz[:, i] = codificar_columna(df[col])
+    return pd.DataFrame(matriz, columns=columnas, index=df.index)
+
+
+# --- CUBO DE PUNTAJES (UNA SOLA AGREGACIÓN) ---
+# Todos los promedios del tablero y del reporte salen de este cubo: sumas y conteos por pregunta
+# y por etapa, agrupados por Planta × Area × Maquina × Mes. Filtrar es rebanar el cubo.
+CLAVES_CUBO = ["Planta", "Area", "Maquina", "Mes"]
+
+# Renglones agregados por tramo: las medidas de un tramo ocupan ~39 columnas de 8 bytes por renglón
+BLOQUE_CUBO = 1_000_000
+
+def construir_cubo(df, etapas_dict):
+    """Agrega el frame ya codificado; en frames grandes por tramos para acotar la memoria.
+
+    Los cubos parciales se vuelven a sumar por las mismas claves, así que el resultado es el
+    mismo que con un solo groupby (los grupos salen en el orden en que aparecen).
+    """
+    if len(df) <= BLOQUE_CUBO:
+        return _cubo_tramo(df, etapas_dict)
+    parciales = [_cubo_tramo(df.iloc[i:i + BLOQUE_CUBO], etapas_dict) for i in range(0, len(df), BLOQUE_CUBO)]
+    return pd.concat(parciales, ignore_index=True).groupby(CLAVES_CUBO, sort=False, dropna=False).sum().reset_index()
+
+def _cubo_tramo(df, etapas_dict):
+    medidas = {}
+    for etapa, columnas in etapas_dict.items():
+        for col in columnas:
+            valores = df[col].to_numpy(dtype=np.float64)
+            validos = ~np.isnan(valores)
+            medidas[f"suma|{col}"] = np.where(validos, valores, 0.0)
+            medidas[f"n|{col}"] = validos.astype(np.int64)
+        # Promedio por fila de la etapa: el puntaje de etapa es el promedio de estos promedios
+        prom_fila = df[columnas].astype(np.float64).mean(axis=1).to_numpy() if columnas else np.full(len(df), np.nan)
+        validos = ~np.isnan(prom_fila)
+        medidas[f"suma_etapa|{etapa}"] = np.where(validos, prom_fila, 0.0)
+        medidas[f"n_etapa|{etapa}"] = validos.astype(np.int64)
+    medidas["auditorias"] = np.ones(len(df), dtype=np.int64)
+    medidas = pd.DataFrame(medidas, index=df.index)
+    return medidas.groupby([df[c] for c in CLAVES_CUBO], sort=False, dropna=False).sum().reset_index()
+
+def medidas_cubo(etapas_dict):
+    """Columnas de medidas del cubo, en el orden en que las arma construir_cubo."""
+    columnas = []
+    for etapa, preguntas in etapas_dict.items():
+        for col in preguntas:
+            columnas += [f"suma|{col}", f"n|{col}"]
+        columnas += [f"suma_etapa|{etapa}", f"n_etapa|{etapa}"]
+    return columnas + ["auditorias"]
+
+def combinar_cubos(cubos, etapas_dict):
+    """Suma cubos parciales (ej. el de SQL y el de Sheets) con las medidas de etapas_dict.
+
+    Una medida que un cubo no trae cuenta 0 (suma y conteo), así que no altera los promedios.
+    """
+    columnas = CLAVES_CUBO + medidas_cubo(etapas_dict)
+    alineados = [c.reindex(columns=columnas) for c in cubos]
+    cubo = pd.concat(alineados, ignore_index=True) if len(alineados) > 1 else alineados[0]
+    medidas = columnas[len(CLAVES_CUBO):]
+    cubo[medidas] = cubo[medidas].fillna(0)
+    if len(alineados) > 1:
+        cubo = cubo.groupby(CLAVES_CUBO, sort=False, dropna=False).sum().reset_index()
+    return cubo
+
+def rebanar_cubo(cubo, mes="Todos", planta="Todas", area="Todos", maquina="Todos"):
+    mascara = np.ones(len(cubo), dtype=bool)
+    for col, valor, todos in [("Mes", mes, "Todos"), ("Planta", planta, "Todas"), ("Area", area, "Todos"), ("Maquina", maquina, "Todos")]:
+        if valor != todos:
+            mascara &= (cubo[col] == valor).to_numpy()
+    return cubo[mascara]
+
+def _agregar(cubo, columnas, por=None, ordenar=True):
+    bloque = cubo[columnas]
+    if por is None:
+        return bloque.sum()
+    return bloque.groupby(cubo[por], sort=ordenar).sum()
+
+def _cociente(sumas, conteos, nombres):
+    with np.errstate(invalid="ignore", divide="ignore"):
+        datos = sumas.to_numpy(dtype=np.float64) / conteos.to_numpy(dtype=np.float64)
+    if datos.ndim == 1:
+        return pd.Series(datos, index=nombres)
+    return pd.DataFrame(datos, index=sumas.index, columns=nombres)
+
+def puntaje_etapas(cubo, etapas, por=None, ordenar=True):
+    """Equivale a df[cols_etapa].mean(axis=1).mean() por etapa (y por grupo si se da 'por')."""
+    sumas = _agregar(cubo, [f"suma_etapa|{e}" for e in etapas], por, ordenar)
+    conteos = _agregar(cubo, [f"n_etapa|{e}" for e in etapas], por, ordenar)
+    return _cociente(sumas, conteos, etapas)
+
+def ranking_preguntas(cubo, columnas, por="Area"):
+    """Equivale a df.groupby(por)[columnas].mean().mean(axis=1)."""
+    sumas = _agregar(cubo, [f"suma|{c}" for c in columnas], por)
+    conteos = _agregar(cubo, [f"n|{c}" for c in columnas], por)
+    return _cociente(sumas, conteos, columnas).mean(axis=1)
+
+
+def _orden_mes(etiqueta):
+    """Llave cronológica de "Enero 2025"; 'Sin Fecha' y 'General' van al final."""
+    numero = {nombre: n for n, nombre in MESES_MAP.items()}
+    nombre, _, anio = str(etiqueta).rpartition(" ")
+    if nombre not in numero or not anio.isdigit():
+        return (1, 0, 0)
+    return (0, int(anio), numero[nombre])
+
+def opciones_cubo(cubo, dim, mes="Todos", planta="Todas", area="Todos"):
+    """Valores de dim presentes en el cubo rebanado, para la cascada de filtros del sidebar.
+
+    Mes sale en orden cronológico, como en derivar_mes; las demás dimensiones en orden alfabético.
+    """
+    valores = rebanar_cubo(cubo, mes, planta, area)[dim].dropna().unique().tolist()
+    return sorted(valores, key=_orden_mes) if dim == "Mes" else sorted(valores)
+
+
+# --- ÍNDICE DE FILTROS (CASCADA SIN COPIAS) ---
+# Para cada dimensión guardamos los códigos categóricos por fila y el mapa grupo -> posiciones.
+# Cada paso del filtro reduce un arreglo de posiciones en lugar de copiar el DataFrame.
+DIMENSIONES_FILTRO = ["Mes", "Planta", "Area", "Maquina"]
+
+def construir_indice_filtros(df):
+    indice = {}
+    for dim in DIMENSIONES_FILTRO:
+        codigos, categorias = pd.factorize(df[dim])
+        orden = np.argsort(codigos, kind="stable")
+        cortes = np.searchsorted(codigos[orden], np.arange(len(categorias) + 1))
+        indice[dim] = {
+            "codigos": codigos,
+            "categorias": categorias,
+            "codigo_de": {cat: i for i, cat in enumerate(categorias)},
+            "posiciones": {cat: orden[cortes[i]:cortes[i + 1]] for i, cat in enumerate(categorias)},
+        }
+    return indice
+
+def filtrar_posiciones(indice, dim, valor, posiciones=None):
+    """Reduce las posiciones a las filas donde dim == valor (posiciones=None significa todas)."""
+    entrada = indice[dim]
+    if valor not in entrada["codigo_de"]:
+        return np.empty(0, dtype=np.intp)
+    if posiciones is None:
+        return entrada["posiciones"][valor]
+    return posiciones[entrada["codigos"][posiciones] == entrada["codigo_de"][valor]]
+
+def opciones_disponibles(indice, dim, posiciones=None):
+    """Valores presentes de la dimensión dentro de las posiciones, ordenados para el dropdown."""
+    entrada = indice[dim]
+    if posiciones is None:
+        return sorted(entrada["categorias"].tolist())
+    codigos = np.unique(entrada["codigos"][posiciones])
+    return sorted(entrada["categorias"][codigos[codigos >= 0]].tolist())
+
+
+# --- PREPARACIÓN COMPARTIDA POR VERSIÓN DE DATOS ---
+MESES_MAP = {1: 'Enero', 2: 'Febrero', 3: 'Marzo', 4: 'Abril', 5: 'Mayo', 6: 'Junio',
+             7: 'Julio', 8: 'Agosto', 9: 'Septiembre', 10: 'Octubre', 11: 'Noviembre', 12: 'Diciembre'}
+
+ETAPAS = ["SEIRI", "SEITON", "SEISO", "SEIKETSU", "SHITSUKE"]
+COLUMNAS_FECHA = ['fecha', 'marca temporal', 'timestamp', 'date']
+
+def descubrir_etapas(columnas):
+    """Columnas de pregunta de cada etapa: las que traen "1S_"…"5S_" y el texto entre corchetes."""
+    return {etapa: [c for c in columnas if f"{i}S_" in c and "[" in c] for i, etapa in enumerate(ETAPAS, start=1)}
+
+def etiqueta_mes(anio, mes):
+    """Nombre del periodo para el filtro de Mes; lleva el año para no juntar enero de 2025 y de 2026."""
+    return f"{MESES_MAP[int(mes)]} {int(anio)}"
+
+def fechas_auditoria(df):
+    """Fecha de cada auditoría: la primera columna de fecha con valor en ese renglón, o None.
+
+    Al combinar orígenes, Sheets trae 'Marca temporal' y Supabase 'Fecha'; cada renglón toma la suya.
+    """
+    fechas = None
+    for col in [c for c in df.columns if c.lower() in COLUMNAS_FECHA]:
+        valores = pd.to_datetime(df[col], errors='coerce')
+        fechas = valores if fechas is None else fechas.fillna(valores)
+    return fechas
+
+def derivar_mes(df):
+    """Regresa (fechas, Mes, meses para el filtro) a partir de las columnas de fecha.
+
+    Mes es "Enero 2025", "Febrero 2025"... y los meses salen en orden cronológico. Sin columna
+    de fecha, o si no se puede leer, todo queda en 'General' y fechas es None.
+    """
+    try:
+        fechas = fechas_auditoria(df)
+        if fechas is not None:
+            # Año*100 + mes: un solo número por periodo, que ordena bien
+            periodo = fechas.dt.year * 100 + fechas.dt.month
+            etiquetas = {p: etiqueta_mes(p // 100, p % 100) for p in sorted(periodo.dropna().unique())}
+            mes = periodo.map(etiquetas).fillna('Sin Fecha')
+            meses_disponibles = list(etiquetas.values())
+            if periodo.isna().any():
+                meses_disponibles.append('Sin Fecha')
+            return fechas, mes, meses_disponibles
+    except Exception:
+        pass
+    return None, pd.Series('General', index=df.index), ['General']
+
+def preparar_datos(df_raw, con_cubo=True):
+    """Codifica, deriva Mes/Planta y arma el cubo y el índice de filtros (cada paso con su span).
+
+    con_cubo=False deja "cubo" en None, para cuando el cubo lo agrega el almacén en SQL.
+    """
+    df_calc = df_raw.copy()
+    etapas_dict = descubrir_etapas(df_calc.columns)
+    all_eval_cols = [c for cols in etapas_dict.values() for c in cols]
+    if all_eval_cols:
+        with span("codificar", filas=len(df_calc), columnas=len(all_eval_cols)):
+            df_calc[all_eval_cols] = codificar_respuestas(df_calc, all_eval_cols)
+
+    # --- VALIDAR COLUMNA PLANTA ---
+    tiene_planta = "Planta" in df_calc.columns
+    if not tiene_planta:
+        df_calc["Planta"] = "General"
+
+    # --- VALIDAR COLUMNA DE FECHA PARA EL FILTRO DE MES ---
+    with span("derivar_mes", filas=len(df_calc)):
+        fechas, mes, meses_disponibles = derivar_mes(df_calc)
+    if fechas is not None:
+        df_calc['_Fecha_Parsed'] = fechas
+    df_calc['Mes'] = mes
+
+    with span("indice_filtros", filas=len(df_calc)):
+        indice = construir_indice_filtros(df_calc)
+    cubo = None
+    if con_cubo:
+        with span("cubo", filas=len(df_calc)) as info:
+            cubo = construir_cubo(df_calc, etapas_dict)
+            info["celdas"] = len(cubo)
+    return {
+        "df": df_calc,
+        "etapas": etapas_dict,
+        "tiene_planta": tiene_planta,
+        "meses": meses_disponibles,
+        "plantas": opciones_disponibles(indice, "Planta") if tiene_planta else ["General"],
+        "cubo": cubo,
+        "indice": indice,
+    }
+
+
+# --- RESUMEN DEL TABLERO (DESDE EL CUBO YA FILTRADO) ---
+def resumen_etapas(cubo, etapas_dict):
+    """Tabla Etapa / Puntaje / Mejor Área con el renglón TOTAL, y el score global."""
+    puntajes = puntaje_etapas(cubo, list(etapas_dict))
+    resumen_data = []
+    for etapa, columnas in etapas_dict.items():
+        if not cubo.empty and len(columnas) > 0:
+            avg_etapa = puntajes[etapa]
+            ranking = ranking_preguntas(cubo, columnas)
+            mejor_area = ranking.idxmax() if not ranking.empty and ranking.max() > 0 else "N/A"
+        else:
+            avg_etapa = np.nan
+            mejor_area = "N/A"
+
+        resumen_data.append({
+            "Etapa": etapa, "Puntaje": round(avg_etapa, 2) if not np.isnan(avg_etapa) else 0,
+            "Mejor Área": mejor_area
+        })
+
+    score_global = sum([d['Puntaje'] for d in resumen_data]) / 5
+    resumen_data.append({"Etapa": "TOTAL", "Puntaje": round(score_global, 2), "Mejor Área": "N/A"})
+    return pd.DataFrame(resumen_data), score_global
+
+def ranking_areas(cubo, columnas):
+    """Calificación Total 5S por área, de mayor a menor."""
+    if cubo.empty:
+        return pd.Series(dtype=np.float64)
+    return ranking_preguntas(cubo, columnas).sort_values(ascending=False)
+
+def tabla_ranking(ranking_general):
+    """El ranking como tabla Area / Calificación Total 5S / Es_Máximo (la que usan gráfica y reporte)."""
+    ranking_df = ranking_general.reset_index()
+    ranking_df.columns = ['Area', 'Calificación Total 5S']
+    max_score = ranking_df['Calificación Total 5S'].max() if not ranking_df.empty else 0
+    ranking_df['Es_Máximo'] = ranking_df['Calificación Total 5S'] == max_score
+    return ranking_df
+
+
+# --- TABLA PAGINADA (SOLO LA PÁGINA VISIBLE) ---
+# Búsqueda y orden trabajan sobre posiciones de fila; el frame solo se copia para la página que
+# se muestra, con las columnas elegidas. Así el navegador no recibe decenas de miles de renglones.
+def nombre_corto(columna):
+    """'1S_Seleccionar_SEIR [1S_1 El área...]' -> '1S_1'; el resto de las columnas se quedan igual."""
+    if "[" in columna:
+        codigo = columna.split("[", 1)[1].split(" ", 1)[0]
+        if codigo[:1].isdigit() and "S_" in codigo:
+            return codigo
+    return columna
+
+def posiciones_tabla(df, columnas, busqueda="", orden=None, descendente=False):
+    """Posiciones de los renglones que contienen 'busqueda' en alguna de 'columnas', ya ordenadas."""
+    posiciones = np.arange(len(df))
+    busqueda = busqueda.strip()
+    if busqueda:
+        mascara = np.zeros(len(df), dtype=bool)
+        for col in columnas:
+            serie = df[col]
+            texto = serie.astype(str).where(serie.notna(), "")
+            mascara |= texto.str.contains(busqueda, case=False, regex=False).to_numpy(dtype=bool, na_value=False)
+        posiciones = posiciones[mascara]
+    if orden:
+        valores = df[orden].iloc[posiciones].reset_index(drop=True)
+        try:
+            ordenados = valores.sort_values(ascending=not descendente, kind="stable", na_position="last")
+        except TypeError:
+            # Columnas con tipos mezclados (Maquina numérica en Sheets y texto en la DB)
+            ordenados = valores.where(valores.isna(), valores.astype(str)).sort_values(ascending=not descendente, kind="stable", na_position="last")
+        posiciones = posiciones[ordenados.index.to_numpy()]
+    return posiciones
+
+def paginas_tabla(posiciones, tam_pagina=50):
+    return max(1, -(-len(posiciones) // tam_pagina))
+
+def pagina_tabla(df, posiciones, columnas, pagina=1, tam_pagina=50):
+    """Renglones de la página (base 1, se recorta al rango válido) con solo 'columnas'."""
+    pagina = min(max(1, int(pagina)), paginas_tabla(posiciones, tam_pagina))
+    inicio = (pagina - 1) * tam_pagina
+    indices_col = [df.columns.get_loc(c) for c in columnas]
+    return df.iloc[posiciones[inicio:inicio + tam_pagina], indices_col]
+
+
+# ==========================================
+# REPORTE HTML (RESTAURADO A LA VERSIÓN ORIGINAL)
+# ==========================================
+# HTML RECONSTRUIDO CON CSS AVANZADO ORIGINAL (plantilla compilada una sola vez)
+PLANTILLA_REPORTE = string.Template("""<html>
+<head>
+    <meta charset="UTF-8">
+    <style>
+        @keyframes blink-red {
+            0% { background-color: rgba(255, 75, 75, 0.1); }
+            50% { background-color: rgba(255, 75, 75, 0.4); color: #fff; }
+            100% { background-color: rgba(255, 75, 75, 0.1); }
+        }
+        @keyframes float {
+            0% { transform: translateY(0px); }
+            50% { transform: translateY(-10px); }
+            100% { transform: translateY(0px); }
+        }
+        body { background-color: #0e1117; color: #e0e0e0; font-family: 'Segoe UI', sans-serif; padding: 40px; text-align: center; }
+        .insight-grid { display: flex; justify-content: center; gap: 20px; margin: 30px 0; flex-wrap: wrap; }
+        .insight-card { flex: 1; max-width: 300px; padding: 25px; border-radius: 15px; background: #161b22; border-top: 4px solid #333; box-shadow: 0 4px 15px rgba(0,0,0,0.3); }
+        .val { font-size: 28px; font-weight: bold; color: #00ffff; display: block; margin: 10px 0; }
+        .radar-container, .barras-container { animation: float 4s ease-in-out infinite; background: #161b22; padding: 20px; border-radius: 20px; margin: 20px auto; max-width: 850px; border: 1px solid #30363d; }
+        .styled-table { width: 90%; margin-left: auto; margin-right: auto; border-collapse: collapse; margin-top: 20px; background: #161b22; }
+        .styled-table th { background: #00ffff; color: #000; padding: 15px; text-transform: uppercase; font-size: 0.9em; }
+        .styled-table td { padding: 12px; border-bottom: 1px solid #333; }
+        .row-critical-blink { animation: blink-red 2s infinite; font-weight: bold; }
+        h1, h3 { letter-spacing: 2px; text-transform: uppercase; color: #fff; }
+    </style>
+</head>
+<body>
+    <h1>🏭 Command Center: Reporte de Desempeño 5S</h1>
+    <p style="font-size: 1.2em; color: #00ffff; margin-top: -10px;">Filtro de Análisis: <b>Filtro por Mes -> $mes_aplicado</b></p>
+    <p>Developed by Master Engineer <b>Erik Armenta</b></p>
+
+    <div class="insight-grid">
+        <div class="insight-card" style="border-top-color: #ff4b4b;">
+            <small style="color:#ff4b4b">ALERTA: ÁREA CRÍTICA</small>
+            <span class="val">$area_critica</span>
+            <small>Puntaje: $score_critico_area</small>
+        </div>
+        <div class="insight-card" style="border-top-color: #00ffff;">
+            <small style="color:#00ffff">BENCHMARK: ÁREA LÍDER</small>
+            <span class="val">$area_lider_rep</span>
+            <small>Máximo Desempeño</small>
+        </div>
+        <div class="insight-card" style="border-top-color: #f1c40f;">
+            <small style="color:#f1c40f">AUDITOR LÍDER</small>
+            <span class="val">$auditor_lider_rep</span>
+            <small>Mayor Nivel de Actividad</small>
+        </div>
+    </div>
+
+    <div class="radar-container">
+        <h3>Análisis de Madurez por Planta (Calificación Global)</h3>
+        $radar_div
+    </div>
+
+    <div class="barras-container">
+        <h3>Calificación Total 5S por Área</h3>
+        $barras_div
+    </div>
+
+    <div style="margin-top:40px;">
+        <h3>📊 Calificaciones Detalladas por Área (Total 5S)</h3>
+        <table class="styled-table" style="max-width: 600px;">
+            <thead>
+                <tr><th>Área</th><th>Puntaje Promedio Total 5S</th><th>Área Referente (Líder)</th></tr>
+            </thead>
+            <tbody>$tabla_calificaciones_html</tbody>
+        </table>
+    </div>
+
+    <div style="margin-top:40px;">
+        <h3>📝 Comentarios de Auditoría por Área</h3>
+        <table class="styled-table">
+            <thead>
+                <tr><th>Área</th><th>Comentarios de Auditoría</th></tr>
+            </thead>
+            <tbody>$comentarios_html</tbody>
+        </table>
+    </div>
+
+    <div style="margin-top: 50px; color: #888; font-size: 0.9em;">
+        Generado automáticamente por EA 5S System • $generado
+    </div>
+</body>
+</html>""")
+
+CLASE_CRITICA = ' class="row-critical-blink"'
+FILA_COMENTARIOS = "<tr{clase}><td style='padding: 12px; border-bottom: 1px solid #333; font-weight: bold;'>{area}</td><td style='padding: 12px; border-bottom: 1px solid #333;'>{comentarios}</td></tr>"
+FILA_CALIFICACION = """
+<tr{clase}>
+    <td style="padding: 12px; border-bottom: 1px solid #333; font-weight: bold;">{area}</td>
+    <td style="padding: 12px; border-bottom: 1px solid #333;">{puntaje:.2f}</td>
+    <td style="padding: 12px; border-bottom: 1px solid #333; color: #00ffff;">{lider}</td>
+</tr>
+"""
+
+def agrupar_comentarios(df_audit):
+    """Comentarios de todas las columnas 'Comentario*' unidos por área (sin duplicados, en orden)."""
+    cols_comentarios = [c for c in df_audit.columns if 'Comentario' in c or 'Comentarios' in c]
+    if df_audit.empty or not cols_comentarios:
+        return pd.Series(dtype=object)
+    largo = df_audit[["Area"] + cols_comentarios].reset_index(drop=True).rename_axis("_fila").reset_index()
+    largo = largo.melt(id_vars=["_fila", "Area"], var_name="columna", value_name="texto").dropna(subset=["texto"])
+    largo["texto"] = largo["texto"].astype(str)
+    largo = largo[largo["texto"].str.strip() != ""]
+    if largo.empty:
+        return pd.Series(dtype=object)
+    # Limpiamos el nombre de la columna para que se vea más limpio
+    etiquetas = {col: col.replace('Comentario', '').replace('Comentarios', '').replace('_', ' ').strip() for col in cols_comentarios}
+    largo["linea"] = "• " + largo["columna"].map(etiquetas) + ": " + largo["texto"].map(html.escape)
+    # melt va columna por columna; el orden estable por fila deja los comentarios como se capturaron
+    largo = largo.sort_values("_fila", kind="stable").drop_duplicates(["Area", "linea"])
+    return largo.groupby("Area", sort=False, dropna=False)["linea"].agg("<br>".join)
+
+def generate_html_report(df_resumen, df_audit, ranking_df_area, mes_aplicado, cubo_reporte, etapas_dict, plotly_embebido=False):
+    etapas_nombres = list(etapas_dict.keys())
+    all_eval_cols = [c for cols in etapas_dict.values() for c in cols]
+    ranking_total = ranking_preguntas(cubo_reporte, all_eval_cols).dropna()
+    area_critica = ranking_total.idxmin() if not ranking_total.empty else "N/A"
+    area_lider_rep = ranking_total.idxmax() if not ranking_total.empty else "N/A"
+    score_critico_area = round(ranking_total.min(), 2) if not ranking_total.empty else 0
+    auditor_lider_rep = df_audit['Nombre del Auditor'].mode()[0] if not df_audit.empty and 'Nombre del Auditor' in df_audit.columns else "N/A"
+
+    etapas_ciclo = etapas_nombres + [etapas_nombres[0]]
+    puntajes_planta = puntaje_etapas(cubo_reporte, etapas_nombres, por="Planta", ordenar=False)
+
+    fig_anim = go.Figure()
+    for planta, fila in puntajes_planta.iterrows():
+        r_v = [round(v, 2) if not np.isnan(v) else 0 for v in fila]
+        avg_planta = round(sum(r_v)/5, 2)
+        color_linea = "#00FF00" if avg_planta >= 4 else ("#FFFF00" if avg_planta >= 3 else "#ff4b4b")
+        r_v.append(r_v[0])
+        fig_anim.add_trace(go.Scatterpolar(
+            r=r_v, theta=etapas_ciclo, name=planta,
+            line=dict(color=color_linea, width=3), fill='none',
+            marker=dict(size=6, color=color_linea),
+            hovertemplate=f"<b>Planta: {planta}</b><br>Etapa: %{{theta}}<br>Calificación: %{{r}}<br>Promedio: {avg_planta}<extra></extra>"
+        ))
+
+    # Se restauro el estilo en el Update Layout para igualar el original
+    fig_anim.update_layout(
+        template="plotly_dark",
+        polar=dict(
+            bgcolor="rgba(0,0,0,0)",
+            radialaxis=dict(range=[0,5], visible=True, tickfont=dict(color="white", size=12)),
+            angularaxis=dict(
+                tickfont=dict(color="white", size=14),
+                tickvals=etapas_nombres,
+                ticktext=[f"<b>{etapa}</b>" for etapa in etapas_nombres]
+            )
+        ),
+        paper_bgcolor="rgba(0,0,0,0)",
+        plot_bgcolor="rgba(0,0,0,0)",
+        margin=dict(t=30, b=30, l=30, r=30)
+    )
+    # plotly.js se incluye una sola vez: del CDN, o embebido (minificado) para abrir el reporte sin internet
+    radar_div = fig_anim.to_html(full_html=False, include_plotlyjs=True if plotly_embebido else 'cdn')
+
+    ranking_df_area['Es_Maximo'] = ranking_df_area['Calificación Total 5S'] == ranking_df_area['Calificación Total 5S'].max()
+    fig_barras = go.Figure()
+    fig_barras.add_trace(go.Bar(
+        x=ranking_df_area['Area'], y=ranking_df_area['Calificación Total 5S'],
+        marker_color=['#00FF00' if es_max else '#1f77b4' for es_max in ranking_df_area['Es_Maximo']],
+        text=ranking_df_area['Calificación Total 5S'].round(2), textposition='outside',
+        textfont=dict(color='white', size=12), hovertemplate='Área: %{x}<br>Calificación: %{y}<extra></extra>'
+    ))
+    fig_barras.update_layout(
+        title="Calificación Total 5S por Área", template="plotly_dark",
+        paper_bgcolor="rgba(0,0,0,0)", plot_bgcolor="rgba(0,0,0,0)",
+        yaxis=dict(title="Calificación Total (0-5)", range=[0, 5], gridcolor="gray", tickfont=dict(color="white")),
+        xaxis=dict(title="Área", tickfont=dict(color="white"), tickangle=-45), height=500, margin=dict(t=50, b=100, l=50, r=50)
+    )
+    barras_div = fig_barras.to_html(full_html=False, include_plotlyjs=False)
+
+    comentarios_area = agrupar_comentarios(df_audit)
+    if not comentarios_area.empty:
+        comentarios_html = "".join(
+            FILA_COMENTARIOS.format(clase=CLASE_CRITICA if area == area_critica else "", area=area, comentarios=texto)
+            for area, texto in comentarios_area.items()
+        )
+    else:
+        comentarios_html = '<tr><td colspan="2">Sin comentarios registrados</td></tr>'
+
+    # El máximo se calcula una sola vez, no por cada fila de la tabla
+    maximo_total = ranking_df_area['Calificación Total 5S'].max()
+    tabla_calificaciones_html = "".join(
+        FILA_CALIFICACION.format(
+            clase=CLASE_CRITICA if area == area_critica else "", area=area, puntaje=puntaje,
+            lider=area_lider_rep if puntaje == maximo_total else '-'
+        )
+        for area, puntaje in zip(ranking_df_area['Area'], ranking_df_area['Calificación Total 5S'])
+    )
+
+    return PLANTILLA_REPORTE.substitute(
+        mes_aplicado=mes_aplicado, area_critica=area_critica, score_critico_area=score_critico_area,
+        area_lider_rep=area_lider_rep, auditor_lider_rep=auditor_lider_rep,
+        radar_div=radar_div, barras_div=barras_div,
+        tabla_calificaciones_html=tabla_calificaciones_html, comentarios_html=comentarios_html,
+        generado=pd.Timestamp.now().strftime('%Y-%m-%d %H:%M'),
+    )
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Refresco de datos compartido por el proceso (sin Streamlit).
+
+Un solo hilo es dueño de la descarga: actualiza las fuentes, deja publicada una versión nueva
+y se duerme hasta la siguiente señal. Las sesiones solo leen lo publicado y se vuelven a pintar
+cuando cambia la versión, así que ninguna paga la descarga dentro de su rerun.
+
+La señal es intercambiable:
+    SenalSondeo(intervalo)          despierta cada 'intervalo' segundos.
+    SenalNotificaciones(respaldo)   despierta cuando un feed de cambios llama notificar()
+                                    (con un sondeo de respaldo por si el feed se cae).
+Las dos aceptan notificar() a mano: lo usan el guardado del formulario, el botón de
+resincronizar y las pruebas con un feed simulado.
+"""
+
+import threading
+import time
+
+
+class SenalSondeo:
+    """Despierta al refrescador cada 'intervalo' segundos, o antes si alguien llama notificar()."""
+
+    def __init__(self, intervalo=60):
+        self.intervalo = intervalo
+        self._evento = threading.Event()
+
+    def notificar(self):
+        self._evento.set()
+
+    def esperar(self):
+        self._evento.wait(self.intervalo)
+        self._evento.clear()
+
+
+class SenalNotificaciones(SenalSondeo):
+    """Despierta con cada aviso de un feed de cambios; 'respaldo' acota cuánto se puede perder uno."""
+
+    def __init__(self, respaldo=600):
+        super().__init__(respaldo)
+        self.avisos = 0
+
+    def conectar(self, suscribir):
+        """Registra notificar() en el feed: suscribir(callback) debe llamar callback(*args) en cada cambio."""
+        suscribir(self.notificar)
+        return self
+
+    def notificar(self, *args):
+        self.avisos += 1
+        super().notificar()
+
+
+class Refrescador:
+    """Hilo daemon que llama actualizar() al arrancar y cada vez que la señal lo despierta."""
+
+    def __init__(self, actualizar, senal, nombre="refresco_5s"):
+        self.actualizar = actualizar
+        self.senal = senal
+        self.ciclos = 0
+        self.ultimo_error = None
+        self.ultima_actualizacion = None
+        self._primera_carga = threading.Event()
+        self._detener = threading.Event()
+        self._hilo = threading.Thread(target=self._bucle, name=nombre, daemon=True)
+
+    def iniciar(self):
+        self._hilo.start()
+        return self
+
+    def detener(self, timeout=None):
+        self._detener.set()
+        self.senal.notificar()
+        self._hilo.join(timeout)
+
+    def notificar(self):
+        """Pide un ciclo de inmediato; si llega durante uno, al terminar corre otro (no se acumulan)."""
+        self.senal.notificar()
+
+    def esperar_primera_carga(self, timeout=None):
+        return self._primera_carga.wait(timeout)
+
+    def _bucle(self):
+        while not self._detener.is_set():
+            try:
+                self.actualizar()
+                self.ultimo_error = None
+            except Exception as e:
+                self.ultimo_error = e
+            self.ciclos += 1
+            self.ultima_actualizacion = time.time()
+            self._primera_carga.set()
+            if self._detener.is_set():
+                break
+            self.senal.esperar()
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+Lectura paginada de tablas de Supabase / PostgREST (sin Streamlit).
+
+PostgREST corta cada respuesta en max-rows (1,000 renglones por defecto), así que una sola
+.execute() sin rango trunca el historial en silencio. Aquí la primera página se pide con el
+conteo exacto y todo lo demás se lee por id (keyset: id > último leído), nunca por offset: si un
+renglón se borra o sale del filtro mientras se pagina, un offset recorre las páginas siguientes
+y se salta el renglón de la orilla, que la sincronización incremental ya no vuelve a pedir.
+
+Con el total conocido, el rango de ids que falta (del último de la primera página al id más
+alto) se parte en tramos que se leen en paralelo, cada uno por keyset. El último tramo no tiene
+tope y sigue hasta una página incompleta, así que también trae lo que entró durante la lectura.
+Si el servidor no regresa conteo se lee un solo tramo.
+
+feed_realtime() conecta una SenalNotificaciones (refresco_5s) a los cambios de una tabla por
+Supabase Realtime.
+"""
+
+import asyncio
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+TAM_PAGINA = 1000
+
+
+def _pagina(nueva_consulta, columnas, filtros, inicio=None, fin=None, despues_de=None, hasta=None, tam=None, conteo=False):
+    q = nueva_consulta().select(columnas, count="exact") if conteo else nueva_consulta().select(columnas)
+    if filtros:
+        q = filtros(q)
+    if despues_de is not None:
+        q = q.gt("id", despues_de)
+    if hasta is not None:
+        q = q.lte("id", hasta)
+    q = q.order("id")
+    q = q.range(inicio, fin) if inicio is not None else q.limit(tam)
+    res = q.execute()
+    return res.data or [], getattr(res, "count", None)
+
+
+def _ultimo_id(nueva_consulta, filtros):
+    q = nueva_consulta().select("id")
+    if filtros:
+        q = filtros(q)
+    res = q.order("id", desc=True).limit(1).execute()
+    return res.data[0]["id"] if res.data else None
+
+
+def _tramo(nueva_consulta, columnas, filtros, desde, hasta, paso, salida):
+    """Lee por keyset desde < id <= hasta (hasta None = sin tope) y deja cada página en la cola.
+
+    Al final deja None; si algo falla deja la excepción para que la levante quien consume.
+    """
+    try:
+        while True:
+            filas, _ = _pagina(nueva_consulta, columnas, filtros, despues_de=desde, hasta=hasta, tam=paso)
+            if filas:
+                salida.put(filas)
+                desde = max(f["id"] for f in filas)
+            if len(filas) < paso:
+                break
+    except Exception as e:
+        salida.put(e)
+    salida.put(None)
+
+
+def iterar_paginas(nueva_consulta, columnas="*", filtros=None, tam_pagina=TAM_PAGINA, max_hilos=4):
+    """Genera (filas, total) por página, en orden de id y sin repetir renglones.
+
+    nueva_consulta() debe regresar un query builder nuevo (ej. lambda: cliente.table("auditorias_5s"))
+    y filtros(q) aplicarle los .eq / .or_ necesarios. columnas debe incluir 'id'.
+    total es el conteo que reportó el servidor en la primera página (None si no lo dio).
+    """
+    vistos = set()
+
+    def nuevas(filas):
+        filas = [f for f in filas if f.get("id") not in vistos]
+        vistos.update(f.get("id") for f in filas)
+        return filas
+
+    filas, total = _pagina(nueva_consulta, columnas, filtros, 0, tam_pagina - 1, conteo=True)
+    # El servidor puede entregar menos que tam_pagina (max-rows más chico); paginamos con lo que da
+    paso = len(filas) or tam_pagina
+    yield nuevas(filas), total
+    if len(filas) < paso or (total is not None and len(filas) >= total):
+        return
+
+    # Tramos de ids: (desde, hasta] cada uno; el último sin tope
+    desde = max(f["id"] for f in filas)
+    cortes = [desde]
+    n_tramos = min(max_hilos, -(-(total - len(filas)) // paso)) if total is not None else 1
+    if n_tramos > 1:
+        tope = _ultimo_id(nueva_consulta, filtros)
+        if isinstance(tope, int) and tope > desde:
+            cortes += [desde + (tope - desde) * i // n_tramos for i in range(1, n_tramos)]
+    cortes.append(None)
+
+    colas = [queue.Queue() for _ in cortes[:-1]]
+    with ThreadPoolExecutor(max_workers=len(colas), thread_name_prefix="paginas_5s") as pool:
+        for cola, a, b in zip(colas, cortes, cortes[1:]):
+            pool.submit(_tramo, nueva_consulta, columnas, filtros, a, b, paso, cola)
+        # Los tramos se consumen en orden para que el frame quede ordenado por id
+        for cola in colas:
+            while (pagina := cola.get()) is not None:
+                if isinstance(pagina, Exception):
+                    raise pagina
+                filas = nuevas(pagina)
+                if filas:
+                    yield filas, total
+
+
+def leer_paginado(nueva_consulta, columnas="*", filtros=None, tam_pagina=TAM_PAGINA, max_hilos=4, progreso=None):
+    """Lee todos los renglones que cumplen filtros y los regresa en un DataFrame.
+
+    progreso(filas_leidas, total) se llama desde el hilo que llama al terminar cada página.
+    """
+    paginas, leidas = [], 0
+    for filas, total in iterar_paginas(nueva_consulta, columnas, filtros, tam_pagina, max_hilos):
+        if filas:
+            paginas.append(pd.DataFrame(filas))
+            leidas += len(filas)
+        if progreso:
+            progreso(leidas, total)
+    return pd.concat(paginas, ignore_index=True) if paginas else pd.DataFrame()
+
+
+# --- CAMBIOS EN VIVO (REALTIME) ---
+def _canal_vivo(cliente, canal):
+    # Si el servidor cierra limpio, is_connected sigue en True: la tarea que lee el socket es la que termina
+    lectura = getattr(cliente, "_listen_task", None)
+    return (cliente.is_connected and not (canal.is_errored or canal.is_closed)
+            and (lectura is None or not lectura.done()))
+
+
+def feed_realtime(url, clave, tabla, esquema="public", revision=30, espera=60):
+    """suscribir(callback) para SenalNotificaciones.conectar: llama callback con cada cambio de 'tabla'.
+
+    El cliente síncrono de supabase-py no trae Realtime, así que el asíncrono corre en un hilo
+    daemon con su propio event loop. Cada 'revision' segundos se revisa que el canal siga unido;
+    si se perdió se vuelve a suscribir tras 'espera' segundos (mientras tanto cubre el sondeo de
+    respaldo de la señal). Cada (re)conexión también avisa: lo que cambió sin feed llega con el
+    siguiente delta. La tabla debe estar en la publicación supabase_realtime.
+    """
+    from realtime import AsyncRealtimeClient
+
+    async def escuchar(callback):
+        while True:
+            cliente = AsyncRealtimeClient(f"{url.rstrip('/')}/realtime/v1", clave, max_retries=3)
+            try:
+                canal = cliente.channel(f"cambios_{tabla}")
+                canal.on_postgres_changes("*", callback=callback, table=tabla, schema=esquema)
+                await canal.subscribe()
+                callback()
+                while _canal_vivo(cliente, canal):
+                    await asyncio.sleep(revision)
+            except Exception:
+                pass
+            try:
+                await cliente.close()
+            except Exception:
+                pass
+            await asyncio.sleep(espera)
+
+    def suscribir(callback):
+        threading.Thread(target=asyncio.run, args=(escuchar(callback),), name="realtime_5s", daemon=True).start()
+
+    return suscribir
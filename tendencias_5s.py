@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Tendencia de los puntajes por etapa en el tiempo (sin Streamlit).
+
+MotorTendencias guarda, por Origen × Planta × Area × periodo, la suma y el conteo de los
+promedios por fila de cada etapa (las mismas medidas suma_etapa| / n_etapa| del cubo), en dos
+frecuencias: semana (lunes a domingo) y mes calendario, cada periodo con su año. Como son sumas,
+una auditoría nueva solo agrega su aporte y una que cambia o desaparece lo resta: el refresco
+aplica el delta que ya trae de Supabase y ningún rerun recorre el historial.
+
+Para poder restar, cada renglón aplicado queda en un libro (clave -> dimensiones, periodos y
+promedio por etapa). Las claves las pone quien llama: el id en Supabase y el número de renglón
+en el CSV de Sheets, que se reemplaza completo cuando cambia.
+
+    motor.aplicar("supabase", df, claves)        alta o reemplazo por clave
+    motor.quitar("supabase", claves)             bajas (ej. una terminada que volvió a borrador)
+    motor.reemplazar("sheets", df, claves)       todo el origen de nuevo
+    motor.serie("M", origenes, planta, area, ventana=3)
+        puntaje por etapa y periodo; con ventana > 1 cada periodo junta sumas y conteos de los
+        últimos 'ventana' periodos (promedio móvil ponderado por auditorías)
+"""
+
+import threading
+
+import numpy as np
+import pandas as pd
+
+from nucleo_5s import ETAPAS, codificar_respuestas, descubrir_etapas, fechas_auditoria
+
+# Clave de periodo -> (nombre, frecuencia de pandas para el rango de fechas)
+FRECUENCIAS = {"W": ("Semanal", "W-MON"), "M": ("Mensual", "MS")}
+DIMENSIONES = ["Origen", "Planta", "Area"]
+MEDIDAS = [f"suma_etapa|{e}" for e in ETAPAS] + [f"n_etapa|{e}" for e in ETAPAS] + ["auditorias"]
+SIN_DATO = "(sin dato)"
+
+
+class MotorTendencias:
+    """Sumas por etapa y periodo que se actualizan con cada delta de auditorías."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._libro = self._libro_vacio()
+        self._sumas = {f: self._sumas_vacias() for f in FRECUENCIAS}
+        # Sube con cada cambio; sirve de llave para memorizar lo que se arma con serie()
+        self.revision = 0
+
+    @staticmethod
+    def _libro_vacio():
+        columnas = {c: pd.Series(dtype=object) for c in DIMENSIONES}
+        columnas.update({f: pd.Series(dtype="datetime64[ns]") for f in FRECUENCIAS})
+        columnas.update({e: pd.Series(dtype=np.float64) for e in ETAPAS})
+        return pd.DataFrame(columnas, index=pd.Index([], dtype=object, name="clave"))
+
+    @staticmethod
+    def _sumas_vacias():
+        indice = pd.MultiIndex.from_arrays([[]] * (len(DIMENSIONES) + 1), names=DIMENSIONES + ["Periodo"])
+        return pd.DataFrame(0.0, index=indice, columns=MEDIDAS)
+
+    def _renglones(self, origen, df, claves):
+        """Renglones del libro para df: promedio por etapa y periodos; sin fecha no entran a la tendencia."""
+        n = len(df)
+        libro = pd.DataFrame({
+            "Origen": origen,
+            "Planta": df["Planta"].to_numpy() if "Planta" in df.columns else "General",
+            "Area": df["Area"].to_numpy() if "Area" in df.columns else SIN_DATO,
+        }, index=pd.Index([f"{origen}:{c}" for c in claves], dtype=object, name="clave"))
+        # Un NaN en el MultiIndex no se alinea bien al sumar; esos renglones quedan en SIN_DATO
+        libro[["Planta", "Area"]] = libro[["Planta", "Area"]].fillna(SIN_DATO)
+        fechas = fechas_auditoria(df) if n else None
+        if fechas is None:
+            fechas = pd.Series(pd.NaT, index=df.index, dtype="datetime64[ns]")
+        for frecuencia in FRECUENCIAS:
+            libro[frecuencia] = fechas.dt.to_period(frecuencia).dt.start_time.to_numpy().astype("datetime64[ns]")
+        for etapa, columnas in descubrir_etapas(df.columns).items():
+            if columnas and n:
+                libro[etapa] = codificar_respuestas(df, columnas).astype(np.float64).mean(axis=1).to_numpy()
+            else:
+                libro[etapa] = np.nan
+        return libro[libro["M"].notna()]
+
+    def _acumular(self, libro, signo):
+        if libro.empty:
+            return
+        medidas = {}
+        for etapa in ETAPAS:
+            valores = libro[etapa].to_numpy(dtype=np.float64)
+            validos = ~np.isnan(valores)
+            medidas[f"suma_etapa|{etapa}"] = signo * np.where(validos, valores, 0.0)
+            medidas[f"n_etapa|{etapa}"] = signo * validos.astype(np.float64)
+        medidas["auditorias"] = np.full(len(libro), float(signo))
+        medidas = pd.DataFrame(medidas, index=libro.index)
+        for frecuencia in FRECUENCIAS:
+            claves = [libro[c] for c in DIMENSIONES] + [libro[frecuencia].rename("Periodo")]
+            aporte = medidas.groupby(claves).sum()
+            sumas = self._sumas[frecuencia].add(aporte, fill_value=0)
+            # Grupos que se quedaron sin auditorías se van (evita residuos de la resta en flotante)
+            self._sumas[frecuencia] = sumas[sumas["auditorias"] > 0.5]
+
+    def _restar(self, claves):
+        presentes = self._libro.index.intersection(claves)
+        if len(presentes):
+            self._acumular(self._libro.loc[presentes], -1)
+            self._libro = self._libro.drop(presentes)
+
+    # --- ACTUALIZACIÓN ---
+    def aplicar(self, origen, df, claves):
+        """Agrega (o reemplaza, si la clave ya estaba) los renglones de df."""
+        nuevos = self._renglones(origen, df, claves)
+        with self._lock:
+            self._restar(pd.Index([f"{origen}:{c}" for c in claves], dtype=object))
+            self._acumular(nuevos, 1)
+            self._libro = pd.concat([self._libro, nuevos]) if len(self._libro) else nuevos
+            self.revision += 1
+
+    def quitar(self, origen, claves):
+        with self._lock:
+            self._restar(pd.Index([f"{origen}:{c}" for c in claves], dtype=object))
+            self.revision += 1
+
+    def reemplazar(self, origen, df, claves):
+        """El origen completo de nuevo: se descarta lo suyo sin restar renglón por renglón."""
+        nuevos = self._renglones(origen, df, claves)
+        with self._lock:
+            self._libro = self._libro[self._libro["Origen"] != origen]
+            for frecuencia, sumas in self._sumas.items():
+                self._sumas[frecuencia] = sumas[sumas.index.get_level_values("Origen") != origen]
+            self._acumular(nuevos, 1)
+            self._libro = pd.concat([self._libro, nuevos]) if len(self._libro) else nuevos
+            self.revision += 1
+
+    # --- CONSULTA ---
+    def serie(self, frecuencia="M", origenes=None, planta=None, area=None, ventana=1):
+        """Puntaje por etapa, TOTAL y Auditorías por periodo (índice = inicio del periodo).
+
+        planta/area None = todas. Los periodos sin auditorías dentro del rango quedan en NaN
+        (con ventana > 1 los cubre la ventana si alcanza algún periodo con datos).
+        """
+        with self._lock:
+            sumas = self._sumas[frecuencia]
+        mascara = np.ones(len(sumas), dtype=bool)
+        for dim, valor in [("Origen", origenes), ("Planta", planta), ("Area", area)]:
+            if valor is not None:
+                niveles = sumas.index.get_level_values(dim)
+                mascara &= niveles.isin(valor) if dim == "Origen" else (niveles == valor)
+        por_periodo = sumas[mascara].groupby(level="Periodo").sum()
+        if por_periodo.empty:
+            return pd.DataFrame(columns=ETAPAS + ["TOTAL", "Auditorías"], dtype=np.float64)
+
+        rango = pd.date_range(por_periodo.index.min(), por_periodo.index.max(), freq=FRECUENCIAS[frecuencia][1])
+        por_periodo = por_periodo.reindex(rango, fill_value=0.0)
+        if ventana > 1:
+            por_periodo = por_periodo.rolling(ventana, min_periods=1).sum()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            puntajes = pd.DataFrame(
+                por_periodo[[f"suma_etapa|{e}" for e in ETAPAS]].to_numpy() / por_periodo[[f"n_etapa|{e}" for e in ETAPAS]].to_numpy(),
+                index=por_periodo.index, columns=ETAPAS,
+            )
+        auditorias = por_periodo["auditorias"].round().astype(np.int64)
+        # Como el Score Global del tablero: etapas sin respuestas cuentan 0, entre las cinco
+        puntajes["TOTAL"] = puntajes[ETAPAS].fillna(0).sum(axis=1).div(len(ETAPAS)).where(auditorias > 0)
+        puntajes["Auditorías"] = auditorias
+        puntajes.index.name = "Periodo"
+        return puntajes
+
+    def __len__(self):
+        """Renglones vigentes en el libro."""
+        with self._lock:
+            return len(self._libro)